@@ -0,0 +1,70 @@
+"""Latency of ``get_thread`` for reply chains of depth 1-50.
+
+Compares the old client-side walk (one HGET per hop) with the server-side
+traversal in ``bot.history.get_thread``::
+
+    REDIS_URL=redis://localhost:6379/15 python benchmarks/bench_get_thread.py
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import history  # noqa: E402
+
+CHAT_ID = -999_000_002
+DEPTHS = (1, 5, 10, 20, 30, 50)
+
+
+async def _legacy_get_thread(chat_id: int, user_id: int, msg_id: int) -> list[dict]:
+    msg_key = f"chat:{chat_id}:messages"
+    msgs = []
+    current = msg_id
+    while current:
+        raw = await history.redis.hget(msg_key, current)
+        if not raw:
+            break
+        data = json.loads(raw)
+        msgs.append({"role": data.get("role", "user"), "content": data.get("content", "")})
+        current = data.get("reply") or 0
+    return list(reversed(msgs))
+
+
+async def _time(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=300)
+    args = parser.parse_args()
+    try:
+        for msg_id in range(1, max(DEPTHS) + 1):
+            text = f"сообщение {msg_id} в цепочке ответов"
+            await history.add_message(CHAT_ID, 1, 0, msg_id, text, msg_id - 1)
+            data = {"role": "user", "content": text, "reply": msg_id - 1}
+            await history.redis.hset(f"chat:{CHAT_ID}:messages", msg_id, json.dumps(data))
+        print(f"{'depth':>5} {'per-hop HGET':>14} {'server-side':>12}")
+        for depth in DEPTHS:
+            legacy = await _time(lambda: _legacy_get_thread(CHAT_ID, 1, depth), args.repeat)
+            current = await _time(lambda: history.get_thread(CHAT_ID, 1, 0, depth), args.repeat)
+            assert len(await history.get_thread(CHAT_ID, 1, 0, depth)) == depth
+            print(f"{depth:>5} {legacy:>12.0f}us {current:>10.0f}us")
+    finally:
+        async for key in history.redis.scan_iter(match=f"chat:{CHAT_ID}*"):
+            await history.redis.delete(key)
+        await history.redis.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+"""Latency of ``get_history`` from Redis and from the in-process cache.
+
+    REDIS_URL=redis://localhost:6379/15 python benchmarks/bench_history_cache.py
+
+Keys are written under a throwaway chat id and deleted afterwards.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import history  # noqa: E402
+
+CHAT_ID = -999_000_004
+
+
+async def _time(repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await history.get_history(CHAT_ID, 1, 0, limit=10)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    print(f"redis: {os.getenv('REDIS_URL', 'redis://localhost:6379/0')}")
+    try:
+        for msg_id in range(1, 201):
+            user_id = 1 if msg_id % 5 == 0 else 2
+            await history.add_message(CHAT_ID, user_id, 0, msg_id, f"сообщение {msg_id} " * 8, msg_id - 1)
+        print(f"redis     p50={await _time(args.repeat):.1f}us")
+        await history.init_history()
+        await asyncio.sleep(0.1)
+        print(f"cached    p50={await _time(args.repeat):.1f}us {history.cache.snapshot()}")
+    finally:
+        if history._listener:
+            history._listener.cancel()
+        async for key in history.redis.scan_iter(match=f"chat:{CHAT_ID}:*"):
+            await history.redis.delete(key)
+        await history.redis.aclose()
+        await history._raw.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,145 @@
+"""Redis memory and bytes written per message for the history layouts.
+
+Writes the same synthetic chat (threads of ``HISTORY_MAX_MESSAGES`` messages,
+several users, every message replying to the previous one, longer bot
+replies) once per layout and sums ``MEMORY USAGE`` over the keys:
+
+- ``list+hash``: the old per-user JSON list and hash pair
+- ``fields``: the thread stream with role, content and name as plain fields
+- ``json``, ``msgpack``, ``msgpack+zstd``: the thread stream with the
+  message encoded by that ``bot.codec`` codec
+
+::
+
+    REDIS_URL=redis://localhost:6379/15 python benchmarks/bench_history_memory.py --messages 1000000
+
+Keys are written under throwaway chat ids and deleted after each layout.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+from itertools import groupby
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import codec, history  # noqa: E402
+
+CHAT_ID = -999_000_003
+ALPHABET = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+LAYOUTS = ("list+hash", "fields", "json", "msgpack", "msgpack+zstd")
+
+
+def _chat(count: int, users: int) -> list[tuple[int, int, int, str, int, str, str]]:
+    rnd = random.Random(1)
+    # Zipf-distributed pseudo-words, so compression sees natural-text entropy
+    vocab = ["".join(rnd.choices(ALPHABET, k=rnd.randint(1, 11))) for _ in range(20_000)]
+    weights = [1 / rank for rank in range(1, len(vocab) + 1)]
+    per_thread = history.HISTORY_MAX_MESSAGES or count
+    rows = []
+    for msg_id in range(1, count + 1):
+        user_id = rnd.randrange(users) + 1
+        if msg_id % 2 == 0:
+            role, name, words = "assistant", rnd.choice(codec.NAMES), rnd.randint(5, 120)
+        else:
+            role, name, words = "user", f"User {user_id}", rnd.randint(2, 30)
+        text = " ".join(rnd.choices(vocab, weights, k=words))
+        rows.append((msg_id // per_thread, user_id, msg_id, text, msg_id - 1, role, name))
+    return rows
+
+
+async def _legacy(chat_id: int, row) -> int:
+    thread_id, user_id, msg_id, text, reply, role, name = row
+    entry = json.dumps({"role": role, "content": text, "name": name})
+    data = json.dumps({"role": role, "content": text, "reply": reply, "name": name})
+    hist_key = f"chat:{chat_id}:thread:{thread_id}:user:{user_id}:history"
+    await history.redis.rpush(hist_key, entry)
+    await history.redis.ltrim(hist_key, -100, -1)
+    await history.redis.hset(f"chat:{chat_id}:thread:{thread_id}:user:{user_id}:messages", msg_id, data)
+    return len(entry.encode()) + len(data.encode())
+
+
+async def _fields(chat_id: int, row) -> int:
+    thread_id, user_id, msg_id, text, reply, role, name = row
+    fields = {"m": msg_id, "u": user_id, "r": role, "c": text, "n": name, "p": reply}
+    stream = history._thread_key(chat_id, thread_id, "stream")
+    entry_id = await history.redis.xadd(
+        stream, fields, maxlen=history.HISTORY_MAX_MESSAGES or None, approximate=True
+    )
+    await history.redis.hset(history._thread_key(chat_id, thread_id, "index"), msg_id, entry_id)
+    return sum(len(str(v).encode()) for v in fields.values())
+
+
+async def _codec(chat_id: int, row) -> int:
+    thread_id, user_id, msg_id, text, reply, role, name = row
+    await history.add_message(chat_id, user_id, thread_id, msg_id, text, reply, role=role, name=name)
+    values = (msg_id, user_id, reply)
+    return sum(len(str(v).encode()) for v in values) + len(codec.encode_entry(role, text, name))
+
+
+async def _write(layout: str, chat_id: int, rows, concurrency: int) -> int:
+    if layout in codec.CODECS:
+        codec.writer = codec.CODECS[layout]
+        write = _codec
+    else:
+        write = _legacy if layout == "list+hash" else _fields
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def thread(thread_rows) -> int:
+        async with semaphore:
+            total = 0
+            for row in thread_rows:
+                total += await write(chat_id, row)
+            return total
+
+    threads = [list(group) for _, group in groupby(rows, key=lambda row: row[0])]
+    return sum(await asyncio.gather(*(thread(t) for t in threads)))
+
+
+async def _memory(chat_id: int) -> tuple[int, int]:
+    total = keys = 0
+    async for key in history.redis.scan_iter(match=f"chat:{chat_id}:*", count=1000):
+        total += await history.redis.memory_usage(key, samples=0)
+        keys += 1
+    return total, keys
+
+
+async def _cleanup(chat_id: int) -> None:
+    async for key in history.redis.scan_iter(match=f"chat:{chat_id}:*", count=1000):
+        await history.redis.delete(key)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--layouts", default=",".join(LAYOUTS))
+    args = parser.parse_args()
+    print(f"redis: {os.getenv('REDIS_URL', 'redis://localhost:6379/0')} messages={args.messages}")
+    rows = _chat(args.messages, args.users)
+    baseline = None
+    try:
+        for i, layout in enumerate(args.layouts.split(",")):
+            chat_id = CHAT_ID - i
+            written = await _write(layout, chat_id, rows, args.concurrency)
+            memory, keys = await _memory(chat_id)
+            await _cleanup(chat_id)
+            baseline = baseline or memory
+            print(
+                f"{layout:<13} keys={keys:<6} memory={memory / 2**20:8.1f}MiB "
+                f"({memory / len(rows):4.0f} B/msg, {memory / baseline:4.0%}) "
+                f"written={written / len(rows):4.0f} B/msg"
+            )
+    finally:
+        for i in range(len(LAYOUTS)):
+            await _cleanup(CHAT_ID - i)
+        await history.redis.aclose()
+        await history._raw.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
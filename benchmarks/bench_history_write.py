@@ -0,0 +1,82 @@
+"""Per-message latency of history writes against a local Redis.
+
+Compares the old three sequential commands (RPUSH, LTRIM, HSET) with the
+current ``bot.history.add_message``::
+
+    REDIS_URL=redis://localhost:6379/15 python benchmarks/bench_history_write.py
+
+Keys are written under a throwaway chat id and deleted afterwards.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import history  # noqa: E402
+
+CHAT_ID = -999_000_001
+
+
+async def _legacy_add(chat_id: int, user_id: int, msg_id: int, text: str) -> None:
+    redis = history.redis
+    hist_key = f"chat:{chat_id}:thread:0:user:{user_id}:history"
+    await redis.rpush(hist_key, json.dumps({"role": "user", "content": text, "name": "User"}))
+    await redis.ltrim(hist_key, -100, -1)
+    msg_key = f"chat:{chat_id}:thread:0:user:{user_id}:messages"
+    data = {"role": "user", "content": text, "reply": msg_id - 1, "name": "User"}
+    await redis.hset(msg_key, msg_id, json.dumps(data))
+
+
+async def _current_add(chat_id: int, user_id: int, msg_id: int, text: str) -> None:
+    await history.add_message(chat_id, user_id, 0, msg_id, text, msg_id - 1, name="User")
+
+
+async def _measure(add, chat_id: int, count: int) -> list[float]:
+    text = "обычное сообщение из чата, средней длины " * 3
+    latencies = []
+    for i in range(1, count + 1):
+        start = time.perf_counter()
+        await add(chat_id, 1, i, text)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies
+
+
+async def _cleanup() -> None:
+    async for key in history.redis.scan_iter(match=f"chat:{CHAT_ID}*"):
+        await history.redis.delete(key)
+    async for key in history.redis.scan_iter(match=f"chat:{CHAT_ID - 1}*"):
+        await history.redis.delete(key)
+
+
+def _report(name: str, latencies: list[float]) -> None:
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{name:<8} n={len(latencies)} mean={statistics.mean(latencies):.0f}us "
+        f"p50={statistics.median(latencies):.0f}us p99={p99:.0f}us"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000)
+    args = parser.parse_args()
+    print(f"redis: {os.getenv('REDIS_URL', 'redis://localhost:6379/0')}")
+    try:
+        await _measure(_legacy_add, CHAT_ID, 200)
+        await _measure(_current_add, CHAT_ID - 1, 200)
+        _report("before", await _measure(_legacy_add, CHAT_ID, args.messages))
+        _report("after", await _measure(_current_add, CHAT_ID - 1, args.messages))
+    finally:
+        await _cleanup()
+        await history.redis.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+"""Compare a fresh AsyncClient per request with the shared pooled client.
+
+Starts a local aiohttp server that imitates the DeepSeek completions
+endpoint and measures request latency in both modes::
+
+    python benchmarks/bench_llm_client.py --requests 300 --concurrency 10
+
+The stand-in server speaks plain HTTP, so the numbers only include the TCP
+handshake; against api.deepseek.com every new connection also pays TLS.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from aiohttp import web
+from httpx import AsyncClient, AsyncHTTPTransport
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot.llm import close_llm_client, get_llm_client  # noqa: E402
+
+COMPLETION = {"choices": [{"message": {"role": "assistant", "content": "ok"}}]}
+
+
+async def _completions(request: web.Request) -> web.Response:
+    await request.read()
+    return web.json_response(COMPLETION)
+
+
+async def _start_server() -> tuple[web.AppRunner, str]:
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", _completions)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1/chat/completions"
+
+
+async def _fresh_client_post(url: str, payload: dict) -> None:
+    transport = AsyncHTTPTransport(retries=3)
+    async with AsyncClient(transport=transport, timeout=30) as client:
+        resp = await client.post(url, json=payload)
+        resp.raise_for_status()
+        resp.json()
+
+
+async def _shared_client_post(url: str, payload: dict) -> None:
+    resp = await get_llm_client().post(url, json=payload)
+    resp.raise_for_status()
+    resp.json()
+
+
+async def _run(post, url: str, total: int, concurrency: int) -> list[float]:
+    payload = {"model": "deepseek-chat", "messages": [{"role": "user", "content": "привет"}]}
+    latencies: list[float] = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with sem:
+            start = time.perf_counter()
+            await post(url, payload)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(total)))
+    return latencies
+
+
+def _report(name: str, latencies: list[float]) -> None:
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<8} n={len(latencies)} mean={statistics.mean(latencies):.2f}ms "
+        f"p50={statistics.median(latencies):.2f}ms p95={p95:.2f}ms"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    runner, url = await _start_server()
+    try:
+        # warm up both paths so imports and the server are hot
+        await _run(_fresh_client_post, url, 10, 1)
+        await _run(_shared_client_post, url, 10, 1)
+        _report("fresh", await _run(_fresh_client_post, url, args.requests, args.concurrency))
+        _report("shared", await _run(_shared_client_post, url, args.requests, args.concurrency))
+    finally:
+        await close_llm_client()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
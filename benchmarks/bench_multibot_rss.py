@@ -0,0 +1,121 @@
+"""Resident memory of one process per personality vs all bots in one process.
+
+Runs ``main.main()`` in child processes, once per personality with
+``PERSONALITY`` set (the docker-compose layout) and once with only
+``BOT_TOKENS``. Sums ``VmRSS`` of the children once it stops growing and
+counts the Redis connections they hold::
+
+    REDIS_URL=redis://localhost:6379/15 python benchmarks/bench_multibot_rss.py
+
+Telegram is not contacted: in the children ``Dispatcher.start_polling``
+waits forever instead and ``Bot.delete_webhook`` does nothing, so
+long-polling buffers are not counted. Everything
+else (Redis pools and listeners, the DeepSeek client, SQLite, the worker
+loops) starts as in production. Each child gets its own database file.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from redis import Redis
+
+ROOT = Path(__file__).resolve().parents[1]
+PERSONALITIES = ("JoePeach", "Kuplinov", "Mrazota")
+
+
+def _child() -> None:
+    sys.path.append(str(ROOT))
+    from aiogram import Bot, Dispatcher
+
+    import main
+
+    async def _idle(self, *bots, **kwargs) -> None:
+        await asyncio.Event().wait()
+
+    async def _no_webhook(self, *args, **kwargs) -> bool:
+        return True
+
+    Dispatcher.start_polling = _idle
+    Bot.delete_webhook = _no_webhook
+    asyncio.run(main.main())
+
+
+def _rss_kib(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def _measure(envs: list[dict[str, str]], settle: float) -> tuple[list[int], int]:
+    redis = Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    before = len(redis.client_list())
+    procs = [
+        subprocess.Popen(
+            [sys.executable, __file__, "--child"],
+            env={**os.environ, **env},
+            cwd=ROOT,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        for env in envs
+    ]
+    try:
+        # started children keep growing for a while; wait until none does
+        deadline = time.monotonic() + 60
+        time.sleep(settle)
+        last: list[int] = []
+        while time.monotonic() < deadline:
+            for proc in procs:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"child exited with {proc.returncode}")
+            rss = [_rss_kib(proc.pid) for proc in procs]
+            if rss == last:
+                break
+            last = rss
+            time.sleep(2)
+        return last, len(redis.client_list()) - before
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+        redis.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--settle", type=float, default=3.0)
+    parser.add_argument("--child", action="store_true")
+    args = parser.parse_args()
+    if args.child:
+        _child()
+        return
+    # syntactically valid tokens; Bot() checks the format only
+    tokens = ",".join(f"{name}:{i + 1}:{'x' * 35}" for i, name in enumerate(PERSONALITIES))
+    with tempfile.TemporaryDirectory() as tmp:
+        base = {"BOT_TOKENS": tokens, "BOT_TOKEN": "", "PERSONALITY": ""}
+        separate, separate_conns = _measure(
+            [
+                {**base, "PERSONALITY": name, "DB_PATH": f"{tmp}/{name}.db"}
+                for name in PERSONALITIES
+            ],
+            args.settle,
+        )
+        shared, shared_conns = _measure([{**base, "DB_PATH": f"{tmp}/all.db"}], args.settle)
+    print(f"redis: {os.getenv('REDIS_URL', 'redis://localhost:6379/0')}")
+    for name, rss in zip(PERSONALITIES, separate):
+        print(f"process per personality  {name:<9} {rss / 1024:6.1f} MiB")
+    print(f"process per personality  total     {sum(separate) / 1024:6.1f} MiB  "
+          f"redis connections={separate_conns}")
+    print(f"one process              total     {shared[0] / 1024:6.1f} MiB "
+          f"({shared[0] / sum(separate):.0%})  redis connections={shared_conns}")
+
+
+if __name__ == "__main__":
+    main()
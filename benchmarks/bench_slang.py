@@ -0,0 +1,102 @@
+"""Benchmark slang lookup over chat-like text.
+
+Compares the compiled trie regex used by ``bot.slang`` with a plain regex
+alternation and a naive substring loop, for the real dictionary and for a
+synthetic one with hundreds of entries::
+
+    python benchmarks/bench_slang.py --terms 500
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot.personalities import SLANG_DICT  # noqa: E402
+from bot.slang import SlangMatcher, _stem  # noqa: E402
+
+WORDS = (
+    "привет как дела сегодня стрим будет или опять нет кто смотрел вчера "
+    "ахах ну ты даёшь согласен вообще не понял о чём речь скинь ссылку "
+    "донат пришёл чат опять взорвался модеры где бан ему игра лагает "
+    "мэддисон обещал поиграть когда-нибудь вечером посмотрим"
+).split()
+
+
+def _chat_messages(count: int, terms: list[str], rate: float) -> list[str]:
+    rnd = random.Random(42)
+    messages = []
+    for _ in range(count):
+        words = rnd.choices(WORDS, k=rnd.randint(3, 25))
+        if terms and rnd.random() < rate:
+            words.insert(rnd.randrange(len(words) + 1), rnd.choice(terms))
+        messages.append(" ".join(words))
+    return messages
+
+
+def _synthetic_terms(count: int) -> dict[str, str]:
+    rnd = random.Random(7)
+    alphabet = "абвгдежзиклмнопрстуфхцчшщыэюя"
+    terms = dict(SLANG_DICT)
+    while len(terms) < count:
+        term = "".join(rnd.choices(alphabet, k=rnd.randint(4, 12)))
+        terms[term] = "значение " + term
+    return terms
+
+
+def _naive(terms: dict[str, str], texts: list[str]) -> set[str]:
+    stems = {term: _stem(term) for term in terms}
+    found = set()
+    for text in texts:
+        lower = text.lower()
+        for term, stem in stems.items():
+            if stem in lower:
+                found.add(term)
+    return found
+
+
+def _alternation(terms: dict[str, str]):
+    stems = {_stem(term): term for term in terms}
+    pattern = "|".join(re.escape(s) for s in sorted(stems, key=len, reverse=True))
+    regex = re.compile(rf"(?<!\w)({pattern})(?!\d)", re.IGNORECASE)
+
+    def find(texts: list[str]) -> set[str]:
+        return {stems[m.group(1).lower()] for text in texts for m in regex.finditer(text)}
+
+    return find
+
+
+def _bench(name: str, func, windows: list[list[str]]) -> None:
+    start = time.perf_counter()
+    for window in windows:
+        func(window)
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<12} {elapsed / len(windows) * 1e6:8.1f} us per prompt")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--terms", type=int, default=500)
+    parser.add_argument("--prompts", type=int, default=2000)
+    args = parser.parse_args()
+
+    for label, terms in (("real", dict(SLANG_DICT)), ("synthetic", _synthetic_terms(args.terms))):
+        messages = _chat_messages(args.prompts * 11, list(terms), rate=0.05)
+        # one prompt = 10 history messages + the message being answered
+        windows = [messages[i:i + 11] for i in range(0, len(messages), 11)]
+        matcher = SlangMatcher(terms)
+        full = sum(len(k) + len(v) + 2 for k, v in terms.items())
+        picked = sum(
+            sum(len(k) + len(v) + 2 for k, v in matcher.find(w).items()) for w in windows
+        ) / len(windows)
+        print(f"{label}: {len(terms)} terms, slang chars per prompt {full} -> {picked:.0f}")
+        _bench("trie regex", matcher.find, windows)
+        _bench("alternation", _alternation(terms), windows)
+        _bench("naive", lambda w: _naive(terms, w), windows)
+
+
+if __name__ == "__main__":
+    main()
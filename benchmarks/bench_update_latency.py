@@ -0,0 +1,181 @@
+"""Update-to-handler latency with long polling vs webhooks, against a fake Telegram.
+
+A local aiohttp server stands in for the Bot API: ``getUpdates`` long-polls
+a queue of injected updates, and in webhook mode the server posts each
+update to ``bot.webhook.build_app`` with the secret header, at most
+``--connections`` at a time like Telegram's ``max_connections``. The handler
+records the time from injection to its call, then optionally works for
+``--work-ms`` to imitate a handler that awaits Redis or the LLM::
+
+    python benchmarks/bench_update_latency.py --updates 2000 --rate 200 --work-ms 50
+
+Everything runs in one event loop, so the numbers compare the two ingestion
+paths rather than predict Telegram's own delivery delay.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("WEBHOOK_SECRET", "bench-secret")
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.types import Message  # noqa: E402
+from aiohttp import ClientSession, web  # noqa: E402
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import webhook  # noqa: E402
+
+TOKEN = f"123456:{'x' * 35}"
+ME = {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeTelegram:
+    """Just enough of the Bot API for getUpdates, webhooks and sendMessage."""
+
+    def __init__(self):
+        self.updates: list[dict] = []
+        self.arrived = asyncio.Event()
+        self.webhook_url: str | None = None
+        self.deliveries: asyncio.Semaphore | None = None
+        self.client: ClientSession | None = None
+        self.tasks: set[asyncio.Task] = set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = dict(await request.post()) if request.can_read_body else {}
+        if method == "getMe":
+            return self._ok(ME)
+        if method == "getUpdates":
+            return self._ok(await self._get_updates(int(data.get("offset") or 0), float(data.get("timeout") or 0)))
+        if method in ("deleteWebhook", "setWebhook"):
+            return self._ok(True)
+        if method == "sendMessage":
+            return self._ok({"message_id": 1, "date": int(time.time()), "chat": {"id": int(data["chat_id"]), "type": "private"}})
+        return web.json_response({"ok": False, "error_code": 404, "description": "Not Found"}, status=404)
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, offset: int, timeout: float) -> list[dict]:
+        self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates:
+            self.arrived.clear()
+            try:
+                await asyncio.wait_for(self.arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:100]
+
+    def inject(self, update: dict) -> None:
+        if self.webhook_url:
+            task = asyncio.create_task(self._deliver(update))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        else:
+            self.updates.append(update)
+            self.arrived.set()
+
+    async def _deliver(self, update: dict) -> None:
+        async with self.deliveries:
+            headers = {"X-Telegram-Bot-Api-Secret-Token": os.environ["WEBHOOK_SECRET"]}
+            async with self.client.post(self.webhook_url, json=update, headers=headers) as resp:
+                resp.raise_for_status()
+
+
+def _update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 2, "is_bot": False, "first_name": "User"},
+            "text": str(time.perf_counter()),
+        },
+    }
+
+
+async def _serve(app: web.Application) -> tuple[web.AppRunner, int]:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+async def _run(mode: str, args) -> list[float]:
+    fake = FakeTelegram()
+    api = web.Application()
+    api.router.add_route("*", "/bot{token}/{method}", fake.handle)
+    api_runner, api_port = await _serve(api)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{api_port}"))
+    bot = Bot(TOKEN, session=session)
+    latencies: list[float] = []
+    done = asyncio.Event()
+    dp = Dispatcher()
+
+    @dp.message()
+    async def on_message(message: Message) -> None:
+        latencies.append(time.perf_counter() - float(message.text))
+        if args.work_ms:
+            await asyncio.sleep(args.work_ms / 1000)
+        if len(latencies) == args.updates:
+            done.set()
+
+    hook_runner = polling = None
+    if mode == "webhook":
+        hook_runner, hook_port = await _serve(webhook.build_app({"Bench": (dp, bot)}))
+        fake.webhook_url = f"http://127.0.0.1:{hook_port}{webhook.webhook_path('Bench')}"
+        fake.deliveries = asyncio.Semaphore(args.connections)
+        fake.client = ClientSession()
+    else:
+        polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+        await asyncio.sleep(0.2)
+    try:
+        for update_id in range(1, args.updates + 1):
+            fake.inject(_update(update_id))
+            await asyncio.sleep(1 / args.rate)
+        await asyncio.wait_for(done.wait(), 60)
+    finally:
+        if polling:
+            await dp.stop_polling()
+            await polling
+        if fake.client:
+            await fake.client.close()
+        if hook_runner:
+            await hook_runner.cleanup()
+        await session.close()
+        await api_runner.cleanup()
+    return latencies
+
+
+def _report(mode: str, latencies: list[float]) -> None:
+    ms = sorted(x * 1000 for x in latencies)
+    print(
+        f"{mode:<8} updates={len(ms)} p50={statistics.median(ms):7.2f}ms "
+        f"p95={ms[int(len(ms) * 0.95) - 1]:7.2f}ms max={ms[-1]:7.2f}ms"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=200, help="updates per second")
+    parser.add_argument("--work-ms", type=float, default=0)
+    parser.add_argument("--connections", type=int, default=40)
+    parser.add_argument("--modes", default="polling,webhook")
+    args = parser.parse_args()
+    for mode in args.modes.split(","):
+        _report(mode, await _run(mode, args))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
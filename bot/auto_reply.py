@@ -1,48 +1,180 @@
+import asyncio
 import json
+import socket
+import time
+
 from aiogram import Bot
+from redis.exceptions import ResponseError
 
-from .config import logger
+from .config import (
+    AUTO_REPLY_CLAIM_IDLE,
+    AUTO_REPLY_CONCURRENCY,
+    AUTO_REPLY_CONSUMER,
+    AUTO_REPLY_MAX_DELIVERIES,
+    AUTO_REPLY_MAXLEN,
+    logger,
+)
+from .history import redis
 
-CHANNEL = "auto_reply"
+GROUP = "responders"
+# stable across restarts of a container, so it picks up its own pending entries
+CONSUMER = AUTO_REPLY_CONSUMER or socket.gethostname()
 
 
-async def listen_auto_replies(bot: Bot, personality: str) -> None:
-    from .history import redis
-    from .handlers.common import respond_with_personality_to_chat
+def stream_key(personality: str) -> str:
+    return f"auto_reply:{personality}"
 
-    pubsub = redis.pubsub()
-    await pubsub.subscribe(CHANNEL)
-    async for msg in pubsub.listen():
-        if msg.get("type") != "message":
-            continue
-        raw = msg.get("data")
-        try:
-            data = json.loads(raw)
-        except Exception:
-            logger.error(f"[AUTO_REPLY_BAD_PAYLOAD] data={raw}")
-            continue
-        if data.get("personality") != personality:
-            continue
-        chat_id = data.get("chat_id")
-        user_id = data.get("user_id")
-        thread_id = data.get("thread_id")
-        msg_id = data.get("msg_id")
-        text = data.get("text", "")
-        if not isinstance(thread_id, int):
-            thread_id = 0
-        if not isinstance(chat_id, int) or not isinstance(msg_id, int):
+
+async def publish_auto_reply(payload: dict) -> str:
+    """Queue an auto-reply for the personality named in ``payload``."""
+    return await redis.xadd(
+        stream_key(payload["personality"]),
+        {"data": json.dumps(payload)},
+        maxlen=AUTO_REPLY_MAXLEN,
+        approximate=True,
+    )
+
+
+async def _ensure_group(key: str) -> None:
+    try:
+        await redis.xgroup_create(key, GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def _parse(fields: dict | None) -> dict | None:
+    raw = (fields or {}).get("data")
+    try:
+        data = json.loads(raw)
+    except Exception:
+        logger.error(f"[AUTO_REPLY_BAD_PAYLOAD] data={raw}")
+        return None
+    chat_id = data.get("chat_id")
+    thread_id = data.get("thread_id")
+    msg_id = data.get("msg_id")
+    if not isinstance(thread_id, int):
+        thread_id = 0
+    if not isinstance(chat_id, int) or not isinstance(msg_id, int):
+        return None
+    return {
+        "chat_id": chat_id,
+        "user_id": int(data.get("user_id") or 0),
+        "thread_id": thread_id,
+        "msg_id": msg_id,
+        "text": data.get("text", ""),
+    }
+
+
+async def _reclaim(key: str, active: set[str]) -> list[tuple[str, dict | None]]:
+    """Take over entries other consumers received but did not acknowledge.
+
+    Entries delivered ``AUTO_REPLY_MAX_DELIVERIES`` times are dropped.
+    """
+    idle_ms = int(AUTO_REPLY_CLAIM_IDLE * 1000)
+    pending = await redis.xpending_range(key, GROUP, "-", "+", 100, idle=idle_ms)
+    claim: list[str] = []
+    drop: list[str] = []
+    for entry in pending:
+        entry_id = entry["message_id"]
+        if entry_id in active:
             continue
+        if entry["times_delivered"] >= AUTO_REPLY_MAX_DELIVERIES:
+            drop.append(entry_id)
+        else:
+            claim.append(entry_id)
+    if drop:
+        await redis.xack(key, GROUP, *drop)
+        logger.warning(f"[AUTO_REPLY_DROP] stream={key} ids={drop}")
+    if not claim:
+        return []
+    claimed = await redis.xclaim(key, GROUP, CONSUMER, idle_ms, claim)
+    logger.info(f"[AUTO_REPLY_RECLAIM] stream={key} count={len(claimed)}")
+    return claimed
+
+
+async def _handle(
+    bot: Bot, personality: str, key: str, entry_id: str, fields: dict | None
+) -> None:
+    from .handlers.common import respond_with_personality_to_chat
+
+    data = _parse(fields)
+    if data is not None:
         try:
             await respond_with_personality_to_chat(
                 bot,
-                chat_id,
-                int(user_id or 0),
-                thread_id,
+                data["chat_id"],
+                data["user_id"],
+                data["thread_id"],
                 personality,
-                text,
-                reply_to_message_id=msg_id,
+                data["text"],
+                reply_to_message_id=data["msg_id"],
                 delay_range=(60, 180),
             )
         except Exception as e:
-            logger.error(f"[AUTO_REPLY_FAIL] chat_id={chat_id} err={e}")
+            # left pending; another delivery is attempted after AUTO_REPLY_CLAIM_IDLE
+            logger.error(f"[AUTO_REPLY_FAIL] chat_id={data['chat_id']} err={e}")
+            return
+    await redis.xack(key, GROUP, entry_id)
+
+
+async def listen_auto_replies(bots: dict[str, Bot]) -> None:
+    """Serve the auto-reply streams of ``bots`` (personality -> bot) as one consumer.
 
+    Several containers with the same personality share a stream; each entry
+    goes to one of them and is acknowledged once answered. All streams are
+    read with a single ``XREADGROUP`` call and each entry is answered by the
+    bot of its personality.
+    """
+    personalities = {stream_key(personality): personality for personality in bots}
+    for key in personalities:
+        await _ensure_group(key)
+    slots = asyncio.Semaphore(AUTO_REPLY_CONCURRENCY)
+    active: dict[str, set[str]] = {key: set() for key in personalities}
+    tasks: set[asyncio.Task] = set()
+    backlog: list[tuple[str, str, dict | None]] = []
+    # entries this consumer received before a restart come first
+    start = {key: "0" for key in personalities}
+    last_claim = 0.0
+
+    def _done(task: asyncio.Task, key: str, entry_id: str) -> None:
+        tasks.discard(task)
+        active[key].discard(entry_id)
+        slots.release()
+
+    while True:
+        await slots.acquire()
+        try:
+            if not backlog and time.monotonic() - last_claim >= AUTO_REPLY_CLAIM_IDLE / 4:
+                last_claim = time.monotonic()
+                for key in personalities:
+                    backlog.extend((key, *entry) for entry in await _reclaim(key, active[key]))
+            if not backlog:
+                # wake up in time for the next reclaim check
+                catching_up = any(pos != ">" for pos in start.values())
+                block = None if catching_up else int(min(5, AUTO_REPLY_CLAIM_IDLE / 4) * 1000) or 1
+                resp = await redis.xreadgroup(
+                    GROUP, CONSUMER, dict(start), count=AUTO_REPLY_CONCURRENCY, block=block
+                )
+                read = {key: entries for key, entries in resp or []}
+                for key, pos in start.items():
+                    if pos != ">":
+                        # pending entries come back after the given id, page by page
+                        entries = read.get(key)
+                        start[key] = entries[-1][0] if entries else ">"
+                for key, entries in read.items():
+                    backlog.extend((key, *entry) for entry in entries)
+        except Exception as e:
+            slots.release()
+            logger.error(f"[AUTO_REPLY_READ_FAIL] streams={list(personalities)} err={e}")
+            await asyncio.sleep(1)
+            continue
+        if not backlog:
+            slots.release()
+            continue
+        key, entry_id, fields = backlog.pop(0)
+        personality = personalities[key]
+        active[key].add(entry_id)
+        task = asyncio.create_task(_handle(bots[personality], personality, key, entry_id, fields))
+        tasks.add(task)
+        task.add_done_callback(lambda t, key=key, entry_id=entry_id: _done(t, key, entry_id))
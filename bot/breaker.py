@@ -0,0 +1,120 @@
+import time
+from collections import deque
+from enum import Enum
+
+from .config import (
+    LLM_BREAKER_FAILURE_RATE,
+    LLM_BREAKER_MIN_CALLS,
+    LLM_BREAKER_OPEN_SECONDS,
+    LLM_BREAKER_SLOW_CALL,
+    LLM_BREAKER_WINDOW,
+    LLM_FALLBACKS,
+    logger,
+)
+
+
+class State(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when neither the model nor its fallback accepts requests."""
+
+
+class CircuitBreaker:
+    """Count-based circuit breaker for one (endpoint, model) pair.
+
+    Slow calls count as failures. While open, one probe request is let
+    through every ``open_seconds``; its outcome closes or re-opens the
+    circuit.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = LLM_BREAKER_WINDOW,
+        min_calls: int = LLM_BREAKER_MIN_CALLS,
+        failure_rate: float = LLM_BREAKER_FAILURE_RATE,
+        slow_call: float = LLM_BREAKER_SLOW_CALL,
+        open_seconds: float = LLM_BREAKER_OPEN_SECONDS,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.open_seconds = open_seconds
+        self.state = State.CLOSED
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._next_probe = 0.0
+
+    def allow(self) -> bool:
+        if self.state == State.CLOSED:
+            return True
+        now = time.monotonic()
+        if now < self._next_probe:
+            return False
+        self._next_probe = now + self.open_seconds
+        self._transition(State.HALF_OPEN)
+        return True
+
+    def on_success(self, latency: float) -> None:
+        if latency >= self.slow_call:
+            self.on_failure()
+            return
+        if self.state == State.HALF_OPEN:
+            self._outcomes.clear()
+            self._transition(State.CLOSED)
+            return
+        self._outcomes.append(True)
+
+    def on_failure(self) -> None:
+        if self.state != State.CLOSED:
+            self._open()
+            return
+        self._outcomes.append(False)
+        if len(self._outcomes) < self.min_calls:
+            return
+        failures = self._outcomes.count(False)
+        if failures / len(self._outcomes) >= self.failure_rate:
+            self._open()
+
+    def _open(self) -> None:
+        self._next_probe = time.monotonic() + self.open_seconds
+        self._transition(State.OPEN)
+
+    def _transition(self, state: State) -> None:
+        if state != self.state:
+            logger.warning(f"[CIRCUIT] name={self.name} {self.state.value}->{state.value}")
+            self.state = state
+
+
+_breakers: dict[tuple[str, str], CircuitBreaker] = {}
+
+
+def breaker_for(url: str, model: str) -> CircuitBreaker:
+    key = (url, model)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        breaker = _breakers[key] = CircuitBreaker(model)
+    return breaker
+
+
+def route_request(url: str, payload: dict) -> tuple[str, dict]:
+    """Return the endpoint and payload to use, switching to the fallback if needed.
+
+    Raises ``CircuitOpenError`` right away when every route is open so callers
+    do not queue behind a dead upstream.
+    """
+    model = payload.get("model", "")
+    if breaker_for(url, model).allow():
+        return url, payload
+    fallback = LLM_FALLBACKS.get(model)
+    if fallback:
+        fb_model, _, fb_url = fallback.partition("@")
+        fb_url = fb_url or url
+        if breaker_for(fb_url, fb_model).allow():
+            logger.warning(f"[CIRCUIT_FALLBACK] model={model} fallback={fb_model} url={fb_url}")
+            return fb_url, {**payload, "model": fb_model}
+    raise CircuitOpenError(f"circuit open for {model}")
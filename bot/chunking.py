@@ -0,0 +1,91 @@
+"""Grouping the lines of a generated reply into Telegram messages.
+
+Every message costs a ``sendMessage`` call, a slot in the chat's send queue
+and a history write, so lines are joined into fewer messages where the
+personality's style allows it. Lines still go out as soon as their message
+is complete, while the rest of the reply is being generated.
+"""
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+# Telegram's limit for the text of one message, in UTF-16 code units
+TELEGRAM_MAX_CHARS = 4096
+
+
+@dataclass(frozen=True)
+class ChunkPolicy:
+    # lines joined into one message; lines shorter than ``short_line``
+    # characters are not counted and stick to the line after them
+    max_lines: int = 1
+    short_line: int = 0
+    # after this many messages the rest of the reply goes into the last one;
+    # 0 means no limit
+    max_messages: int = 0
+    max_chars: int = TELEGRAM_MAX_CHARS
+
+
+def _utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def split_long(text: str, max_chars: int = TELEGRAM_MAX_CHARS) -> list[str]:
+    """Split ``text`` into pieces Telegram accepts, preferring whitespace."""
+    parts = []
+    while _utf16_len(text) > max_chars:
+        cut = max_chars
+        while _utf16_len(text[:cut]) > max_chars:
+            cut -= 1
+        space = max(text.rfind("\n", 0, cut), text.rfind(" ", 0, cut))
+        if space > cut // 2:
+            cut = space
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text:
+        parts.append(text)
+    return parts
+
+
+async def chunk_lines(lines: AsyncIterator[str], policy: ChunkPolicy) -> AsyncIterator[str]:
+    """Yield message texts made of the non-empty ``lines``.
+
+    If ``lines`` fails, the lines received so far are yielded before the
+    error is raised.
+    """
+    chunk: list[str] = []
+    counted = 0
+    sent = 0
+
+    def flush() -> list[str]:
+        nonlocal chunk, counted, sent
+        texts = split_long("\n".join(chunk), policy.max_chars)
+        chunk, counted = [], 0
+        sent += len(texts)
+        return texts
+
+    async with aclosing(lines) as source:
+        try:
+            async for line in source:
+                text = line.strip()
+                if not text:
+                    continue
+                last = policy.max_messages and sent >= policy.max_messages - 1
+                if chunk and not last and (
+                    _utf16_len("\n".join([*chunk, text])) > policy.max_chars
+                ):
+                    for part in flush():
+                        yield part
+                chunk.append(text)
+                if len(text) >= policy.short_line:
+                    counted += 1
+                if counted >= policy.max_lines and not last:
+                    for part in flush():
+                        yield part
+        except Exception:
+            if chunk:
+                for part in flush():
+                    yield part
+            raise
+    if chunk:
+        for part in flush():
+            yield part
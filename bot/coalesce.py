@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import Counter, OrderedDict
+from typing import AsyncIterator, Callable
+
+from .config import LLM_CACHE_SIZE, LLM_CACHE_TTL, logger
+from .personalities import MOOD_LINES
+
+
+def _without_mood(message: dict) -> dict:
+    """Drop the randomly picked mood line from a system prompt."""
+    if message.get("role") != "system":
+        return message
+    lines = message.get("content", "").split("\n")
+    content = "\n".join(line for line in lines if line not in MOOD_LINES)
+    return {**message, "content": content}
+
+
+def request_key(payload: dict) -> str:
+    """Hash the parts of a completion request that determine its answer.
+
+    The mood line is left out: it is picked at random for every request, so
+    otherwise identical requests would never share an answer.
+    """
+    messages = [_without_mood(m) for m in payload.get("messages") or []]
+    raw = json.dumps(
+        [payload.get("model"), messages, payload.get("temperature")],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """Lines of one upstream request, replayed to every waiting caller."""
+
+    def __init__(self):
+        self.lines: list[str] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.task: asyncio.Task | None = None
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def push(self, line: str) -> None:
+        self.lines.append(line)
+        self._notify()
+
+    def finish(self, error: BaseException | None = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def follow(self) -> AsyncIterator[str]:
+        idx = 0
+        while True:
+            changed = self._changed
+            while idx < len(self.lines):
+                yield self.lines[idx]
+                idx += 1
+            if self.done:
+                if self.error:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class Coalescer:
+    """Share one upstream call between identical concurrent requests.
+
+    Finished replies are kept for ``ttl`` seconds (at most ``max_entries``,
+    least recently used first out) so exact repeats are answered from memory.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._inflight: dict[str, _Flight] = {}
+        self._cache: OrderedDict[str, tuple[float, list[str]]] = OrderedDict()
+        self.stats: Counter[str] = Counter()
+
+    def _cached(self, key: str) -> list[str] | None:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires, lines = entry
+        if expires <= time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return lines
+
+    def _store(self, key: str, lines: list[str]) -> None:
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        self._cache[key] = (time.monotonic() + self.ttl, lines)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def _pump(self, key: str, flight: _Flight, produce: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            async for line in produce():
+                flight.push(line)
+        except BaseException as e:
+            flight.finish(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        else:
+            flight.finish()
+            self._store(key, flight.lines)
+        finally:
+            self._inflight.pop(key, None)
+
+    async def lines(self, key: str, produce: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        cached = self._cached(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            logger.info(f"[LLM_COALESCE] cache_hit key={key[:12]}")
+            for line in cached:
+                yield line
+            return
+        flight = self._inflight.get(key)
+        if flight is not None:
+            self.stats["coalesced"] += 1
+            logger.info(f"[LLM_COALESCE] joined key={key[:12]}")
+        else:
+            self.stats["misses"] += 1
+            flight = self._inflight[key] = _Flight()
+            # the upstream call runs on its own so one caller leaving early does not cut it for others
+            flight.task = asyncio.create_task(self._pump(key, flight, produce))
+        async for line in flight.follow():
+            yield line
+
+    def snapshot(self) -> dict[str, int]:
+        return {
+            "hits": self.stats["hits"],
+            "coalesced": self.stats["coalesced"],
+            "misses": self.stats["misses"],
+            "cached": len(self._cache),
+            "inflight": len(self._inflight),
+        }
+
+
+coalescer = Coalescer(LLM_CACHE_TTL, LLM_CACHE_SIZE)
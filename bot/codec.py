@@ -0,0 +1,143 @@
+"""Encoding of history entries stored in Redis.
+
+A stored value starts with a one-byte tag naming its codec. Values without
+a tag are JSON (or plain text) written by older versions and are still
+decoded, so the writer can be switched with ``HISTORY_CODEC`` at any time.
+"""
+import json
+from abc import ABC, abstractmethod
+from typing import ClassVar
+
+from .config import HISTORY_CODEC, HISTORY_ZSTD_MIN, logger
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional
+    zstandard = None
+
+
+# Codes are stored in Redis: only ever append to these tuples.
+ROLES = ("user", "assistant", "system")
+NAMES = ("JoePeach", "Mrazota", "Kuplinov")
+_ROLE_CODES = {role: i for i, role in enumerate(ROLES)}
+_NAME_CODES = {name: i for i, name in enumerate(NAMES)}
+
+
+def _message(role: str, content: str, name: str | None) -> dict:
+    msg = {"role": role, "content": content}
+    if name:
+        msg["name"] = name
+    return msg
+
+
+class Codec(ABC):
+    tag: ClassVar[bytes]
+
+    @abstractmethod
+    def encode(self, role: str, content: str, name: str | None) -> bytes:
+        """Return the stored value, tag included."""
+
+    @abstractmethod
+    def decode(self, body: bytes) -> dict:
+        """Decode a stored value with its tag already stripped."""
+
+
+class JsonCodec(Codec):
+    """Untagged JSON, readable by every version."""
+
+    tag = b""
+
+    def encode(self, role: str, content: str, name: str | None) -> bytes:
+        return json.dumps(_message(role, content, name), ensure_ascii=False).encode()
+
+    def decode(self, body: bytes) -> dict:
+        data = json.loads(body)
+        if not isinstance(data, dict):
+            raise ValueError("not an object")
+        return _message(data.get("role", "user"), data.get("content", ""), data.get("name"))
+
+
+class MsgpackCodec(Codec):
+    """``[role, name, content]`` with known roles and names as small ints."""
+
+    tag = b"\x01"
+
+    def pack(self, role: str, content: str, name: str | None) -> bytes:
+        return msgpack.packb(
+            [_ROLE_CODES.get(role, role), _NAME_CODES.get(name, name), content]
+        )
+
+    def unpack(self, body: bytes) -> dict:
+        role, name, content = msgpack.unpackb(body)
+        if isinstance(role, int):
+            role = ROLES[role]
+        if isinstance(name, int):
+            name = NAMES[name]
+        return _message(role, content, name)
+
+    def encode(self, role: str, content: str, name: str | None) -> bytes:
+        return self.tag + self.pack(role, content, name)
+
+    def decode(self, body: bytes) -> dict:
+        return self.unpack(body)
+
+
+class ZstdMsgpackCodec(MsgpackCodec):
+    """Msgpack, zstd-compressed when the message is long enough to gain."""
+
+    tag = b"\x02"
+
+    def encode(self, role: str, content: str, name: str | None) -> bytes:
+        packed = self.pack(role, content, name)
+        if len(packed) >= HISTORY_ZSTD_MIN:
+            compressed = zstandard.ZstdCompressor(level=3).compress(packed)
+            if len(compressed) < len(packed):
+                return self.tag + compressed
+        return MsgpackCodec.tag + packed
+
+    def decode(self, body: bytes) -> dict:
+        return self.unpack(zstandard.ZstdDecompressor().decompress(body))
+
+
+CODECS: dict[str, Codec] = {
+    "json": JsonCodec(),
+    "msgpack": MsgpackCodec(),
+    "msgpack+zstd": ZstdMsgpackCodec(),
+}
+_BY_TAG = {codec.tag: codec for codec in CODECS.values() if codec.tag}
+
+
+def get_codec(name: str) -> Codec:
+    """Return the codec called ``name``, falling back to what is installed."""
+    if name == "msgpack+zstd" and zstandard is None:
+        logger.warning("[HISTORY_CODEC_UNAVAILABLE] install zstandard to compress history")
+        name = "msgpack"
+    if name == "msgpack" and msgpack is None:
+        logger.warning("[HISTORY_CODEC_UNAVAILABLE] install msgpack to pack history")
+        name = "json"
+    return CODECS.get(name) or CODECS["json"]
+
+
+writer = get_codec(HISTORY_CODEC)
+
+
+def encode_entry(role: str, content: str, name: str | None = None) -> bytes:
+    return writer.encode(role, content, name)
+
+
+def decode_entry(raw: bytes | str) -> dict | None:
+    """Decode a stored value into a role-based dict; ``None`` if unreadable."""
+    if isinstance(raw, str):
+        raw = raw.encode()
+    codec = _BY_TAG.get(raw[:1])
+    try:
+        if codec is not None:
+            return codec.decode(raw[1:])
+        return CODECS["json"].decode(raw)
+    except Exception:
+        return None
@@ -0,0 +1,114 @@
+"""Merging of comments a user leaves on a channel post in quick succession.
+
+Pending comments are kept in Redis as plain text, per chat and user: a list
+of texts and a hash with the message to reply to. The pair is scheduled in
+a per-personality sorted set ``COMMENT_MERGE_WINDOW`` seconds after its last
+comment; each new comment pushes that time back. Any container of the
+personality may take a due pair; taking it is atomic and fails if a comment
+arrived in the meantime, so only the last comment's window fires.
+"""
+import asyncio
+import time
+
+from aiogram import Bot
+
+from .config import COMMENT_MERGE_MAX, COMMENT_MERGE_WINDOW, DELAYED_POLL, logger
+from .history import redis
+
+# pending comments expire if no worker takes them
+_TTL = 3600
+
+
+def _due_key(personality: str) -> str:
+    return f"comments:{personality}"
+
+
+def _buffer_keys(chat_id: int, user_id: int) -> list[str]:
+    return [f"comments:{chat_id}:{user_id}:texts", f"comments:{chat_id}:{user_id}"]
+
+
+# KEYS: due set, texts list, reply target hash
+# ARGV: text, message id, thread id, due time, member, cap, ttl seconds
+_PUSH = redis.register_script(
+    """
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    redis.call('LTRIM', KEYS[2], -tonumber(ARGV[6]), -1)
+    redis.call('HSET', KEYS[3], 'msg', ARGV[2], 'thread', ARGV[3])
+    redis.call('EXPIRE', KEYS[2], ARGV[7])
+    redis.call('EXPIRE', KEYS[3], ARGV[7])
+    redis.call('ZADD', KEYS[1], ARGV[4], ARGV[5])
+    return redis.call('LLEN', KEYS[2])
+    """
+)
+
+# Take the comments of ARGV[1] if it is still due at ARGV[2]; nil if another
+# worker took them or a newer comment moved the due time.
+# KEYS: due set, texts list, reply target hash
+_TAKE = redis.register_script(
+    """
+    local due = redis.call('ZSCORE', KEYS[1], ARGV[1])
+    if not due or tonumber(due) > tonumber(ARGV[2]) then
+        return nil
+    end
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    local texts = redis.call('LRANGE', KEYS[2], 0, -1)
+    local target = redis.call('HMGET', KEYS[3], 'msg', 'thread')
+    redis.call('DEL', KEYS[2], KEYS[3])
+    return {target[1] or '', target[2] or '', texts}
+    """
+)
+
+
+async def push_comment(
+    personality: str, chat_id: int, user_id: int, message_id: int, thread_id: int, text: str
+) -> int:
+    """Add a comment to the user's pending ones; returns how many are pending."""
+    due = time.time() + COMMENT_MERGE_WINDOW
+    return await _PUSH(
+        keys=[_due_key(personality), *_buffer_keys(chat_id, user_id)],
+        args=[text, message_id, thread_id, due, f"{chat_id}:{user_id}", COMMENT_MERGE_MAX, _TTL],
+    )
+
+
+async def _fire(bot: Bot, personality: str, member: str) -> None:
+    from .handlers.common import respond_with_personality_to_chat
+    from .llm_queue import Priority
+
+    chat_id, user_id = (int(part) for part in member.split(":"))
+    taken = await _TAKE(
+        keys=[_due_key(personality), *_buffer_keys(chat_id, user_id)],
+        args=[member, time.time()],
+    )
+    if not taken:
+        return
+    msg_id, thread_id, texts = taken
+    if not msg_id or not texts:
+        return
+    thread_id = int(thread_id or 0)
+    logger.info(f"[COMMENT_MERGED] chat={chat_id} user={user_id} count={len(texts)}")
+    await respond_with_personality_to_chat(
+        bot,
+        chat_id,
+        user_id,
+        thread_id,
+        personality,
+        " ".join(texts),
+        reply_to_message_id=int(msg_id),
+        recent_history=True,
+        send_thread_id=thread_id or None,
+        delay_range=(15, 25),
+        priority=Priority.REPLY,
+    )
+
+
+async def run_comment_debouncer(bot: Bot, personality: str) -> None:
+    """Answer this personality's merged comments once their window has passed."""
+    key = _due_key(personality)
+    while True:
+        try:
+            members = await redis.zrangebyscore(key, "-inf", time.time(), start=0, num=50)
+            for member in members:
+                await _fire(bot, personality, member)
+        except Exception as e:
+            logger.error(f"[COMMENT_DEBOUNCE_FAIL] personality={personality} err={e}")
+        await asyncio.sleep(DELAYED_POLL)
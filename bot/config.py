@@ -14,9 +14,31 @@ except Exception:
     logger = logging.getLogger("bot")
     _LOGURU = False
 
+
+def _env_flag(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).strip().lower() in {"1", "true", "yes", "on"}
+
+
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# "Personality:token" pairs; without PERSONALITY all of them run in one process
+BOT_TOKENS: dict[str, str] = {
+    name.strip(): token.strip()
+    for name, sep, token in (
+        part.partition(":") for part in os.getenv("BOT_TOKENS", "").split(",")
+    )
+    if sep and name.strip() and token.strip()
+}
 # optional personality for single-bot container
 PERSONALITY = os.getenv("PERSONALITY", "")
+# webhook mode: public base URL Telegram posts updates to (long polling when
+# empty), secret Telegram sends with every update, local listen address and
+# path prefix, and connections Telegram may open at once per bot
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = "/" + os.getenv("WEBHOOK_PATH", "/webhook").strip("/")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
 _GROUP_IDS_RAW = os.getenv("GROUP_IDS", "").strip()
 _GROUP_ID_SINGLE = os.getenv("GROUP_ID", "0").strip()
@@ -25,7 +47,51 @@ DB_PATH = Path(os.getenv("DB_PATH", "data/bot.db"))
 DEEPSEEK_URL = "https://api.deepseek.com/v1/chat/completions"
 DEEPSEEK_TEMPERATURE = float(os.getenv("DEEPSEEK_TEMPERATURE", "1.1"))
 DEEPSEEK_PRESENCE_PENALTY = float(os.getenv("DEEPSEEK_PRESENCE_PENALTY", "1.5"))
+# send reply lines to Telegram as soon as they arrive from the SSE stream
+DEEPSEEK_STREAM = _env_flag("DEEPSEEK_STREAM")
+# shared DeepSeek HTTP client (connection pool)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP2 = _env_flag("LLM_HTTP2")
+# retry budget for one DeepSeek request: attempts, total deadline and backoff (seconds)
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "45"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# global limit of parallel DeepSeek requests and the priority queue in front of it
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "50"))
+LLM_SHED_DEPTH = int(os.getenv("LLM_SHED_DEPTH", "10"))
+# circuit breaker per model: error rate over the last calls, slow calls count as errors
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+LLM_BREAKER_SLOW_CALL = float(os.getenv("LLM_BREAKER_SLOW_CALL", "40"))
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+# identical requests in flight share one call; finished replies are reused for a short time
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "30"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "256"))
+# prompt size limit: which history messages to drop first, "oldest" or "longest"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_TRIM = os.getenv("CONTEXT_TRIM", "oldest")
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# chat history in Redis: per-stream message cap, idle expiry, reply hops,
+# message ids kept in each user's view and how many stream entries
+# get_history scans back for users whose view is shorter than asked
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "5000"))
+HISTORY_TTL = int(os.getenv("HISTORY_TTL", str(30 * 24 * 3600)))
+HISTORY_CHAIN_HOPS = int(os.getenv("HISTORY_CHAIN_HOPS", "50"))
+HISTORY_USER_VIEW = int(os.getenv("HISTORY_USER_VIEW", "50"))
+HISTORY_SCAN = int(os.getenv("HISTORY_SCAN", "1000"))
+# how stored messages are encoded: json, msgpack or msgpack+zstd; messages
+# packed to at least HISTORY_ZSTD_MIN bytes are compressed
+HISTORY_CODEC = os.getenv("HISTORY_CODEC", "msgpack+zstd")
+HISTORY_ZSTD_MIN = int(os.getenv("HISTORY_ZSTD_MIN", "256"))
+# in-process cache of recent history per chat, thread and user
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "2000"))
+HISTORY_CACHE_BYTES = int(os.getenv("HISTORY_CACHE_BYTES", str(16 * 1024 * 1024)))
 PROMPTS_DIR = Path(os.getenv("PROMPTS_DIR", "data/prompts"))
 
 def setup_logging():
@@ -41,6 +107,63 @@ def setup_logging():
             format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level:<8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan> - <level>{message}</level>",
         )
 
+def _parse_pairs(raw: str) -> dict[str, str]:
+    """Parse ``key=value`` pairs separated by commas."""
+    pairs: dict[str, str] = {}
+    for part in raw.split(","):
+        key, sep, value = part.partition("=")
+        if sep and key.strip() and value.strip():
+            pairs[key.strip()] = value.strip()
+    return pairs
+
+
+# model=fallback[@url]
+LLM_FALLBACKS: dict[str, str] = _parse_pairs(
+    os.getenv("LLM_FALLBACKS", "deepseek-reasoner=deepseek-chat")
+)
+# prompt token budget per model, e.g. "deepseek-chat=6000,deepseek-reasoner=4000"
+CONTEXT_BUDGETS: dict[str, str] = _parse_pairs(os.getenv("CONTEXT_BUDGETS", ""))
+# random auto-reply trigger: every Nth counted message per thread, with
+# per-chat overrides "chat_id=N,..." (0 disables); one counted message per
+# cooldown seconds
+RANDOM_REPLY_EVERY = int(os.getenv("RANDOM_REPLY_EVERY", "10"))
+RANDOM_REPLY_THRESHOLDS: dict[str, str] = _parse_pairs(os.getenv("RANDOM_REPLY_THRESHOLDS", ""))
+RANDOM_REPLY_COOLDOWN = int(os.getenv("RANDOM_REPLY_COOLDOWN", "60"))
+# auto-reply streams: length cap, replies handled at once per container,
+# seconds before an unacknowledged entry is handed to another consumer and
+# deliveries before it is dropped
+AUTO_REPLY_MAXLEN = int(os.getenv("AUTO_REPLY_MAXLEN", "1000"))
+AUTO_REPLY_CONCURRENCY = int(os.getenv("AUTO_REPLY_CONCURRENCY", "4"))
+AUTO_REPLY_CLAIM_IDLE = float(os.getenv("AUTO_REPLY_CLAIM_IDLE", "600"))
+AUTO_REPLY_MAX_DELIVERIES = int(os.getenv("AUTO_REPLY_MAX_DELIVERIES", "3"))
+AUTO_REPLY_CONSUMER = os.getenv("AUTO_REPLY_CONSUMER", "")
+# delayed replies: jobs sent at once per container, seconds a claimed job is
+# held before another worker may take it, and how often the queue is polled
+DELAYED_CONCURRENCY = int(os.getenv("DELAYED_CONCURRENCY", "8"))
+DELAYED_LEASE = float(os.getenv("DELAYED_LEASE", "300"))
+DELAYED_POLL = float(os.getenv("DELAYED_POLL", "0.5"))
+# a failed job is queued again after DELAYED_RETRY_BASE seconds, doubling up
+# to DELAYED_RETRY_MAX, and dropped after DELAYED_MAX_ATTEMPTS runs
+DELAYED_MAX_ATTEMPTS = int(os.getenv("DELAYED_MAX_ATTEMPTS", "5"))
+DELAYED_RETRY_BASE = float(os.getenv("DELAYED_RETRY_BASE", "15"))
+DELAYED_RETRY_MAX = float(os.getenv("DELAYED_RETRY_MAX", "600"))
+# generate delayed replies while they wait; the draft is used if the
+# history and message are unchanged when the reply is due
+DELAYED_SPECULATIVE = _env_flag("DELAYED_SPECULATIVE", "1")
+# comments to a channel post sent by one user within this many seconds of
+# each other are answered together; at most this many are kept per answer
+COMMENT_MERGE_WINDOW = float(os.getenv("COMMENT_MERGE_WINDOW", "10"))
+COMMENT_MERGE_MAX = int(os.getenv("COMMENT_MERGE_MAX", "20"))
+# outgoing messages per second to one chat, per minute to one group and per
+# second per bot overall (Telegram's flood limits), and failed sends before a
+# message is dropped (waits Telegram asks for with 429 do not count)
+OUTBOX_CHAT_RATE = float(os.getenv("OUTBOX_CHAT_RATE", "1"))
+OUTBOX_GROUP_PER_MINUTE = int(os.getenv("OUTBOX_GROUP_PER_MINUTE", "20"))
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", "25"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+# seconds queued messages may still be sent for on shutdown
+OUTBOX_DRAIN_TIMEOUT = float(os.getenv("OUTBOX_DRAIN_TIMEOUT", "8"))
+
 def _parse_group_ids(raw: str) -> set[int]:
     ids: set[int] = set()
     if not raw:
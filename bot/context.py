@@ -0,0 +1,70 @@
+import math
+import re
+
+from .config import CONTEXT_BUDGETS, CONTEXT_TOKEN_BUDGET, CONTEXT_TRIM, logger
+
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+# chat-format overhead for role, name and separators of one message
+MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the DeepSeek tokenizer without loading it.
+
+    Latin words average about four characters per token, Cyrillic words
+    about two and a half; punctuation is one token per symbol.
+    """
+    tokens = 0
+    for match in _TOKEN_RE.finditer(text):
+        word = match.group()
+        if not word[0].isalnum() and word[0] != "_":
+            tokens += 1
+        elif word.isascii():
+            tokens += math.ceil(len(word) / 4)
+        else:
+            tokens += math.ceil(len(word) / 2.5)
+    return tokens
+
+
+def message_tokens(message: dict) -> int:
+    return (
+        MESSAGE_OVERHEAD
+        + estimate_tokens(message.get("content", ""))
+        + estimate_tokens(message.get("name", ""))
+    )
+
+
+def budget_for(model: str) -> int:
+    try:
+        return int(CONTEXT_BUDGETS.get(model, CONTEXT_TOKEN_BUDGET))
+    except ValueError:
+        return CONTEXT_TOKEN_BUDGET
+
+
+def pack_messages(messages: list[dict], budget: int, strategy: str = CONTEXT_TRIM) -> list[dict]:
+    """Drop history messages until the prompt fits ``budget`` tokens.
+
+    The system prompt (first) and the message being answered (last) are
+    never dropped. ``strategy`` is ``"oldest"`` or ``"longest"`` and says
+    which history messages go first.
+    """
+    sizes = [message_tokens(m) for m in messages]
+    total = sum(sizes)
+    if total <= budget or len(messages) <= 2:
+        return messages
+    candidates = list(range(1, len(messages) - 1))
+    if strategy == "longest":
+        candidates.sort(key=lambda i: sizes[i], reverse=True)
+    dropped: set[int] = set()
+    for idx in candidates:
+        if total <= budget:
+            break
+        dropped.add(idx)
+        total -= sizes[idx]
+    saved = sum(sizes[i] for i in dropped)
+    logger.info(
+        f"[CONTEXT_PACK] budget={budget} tokens={total} saved={saved} "
+        f"dropped={len(dropped)} strategy={strategy}"
+    )
+    return [m for i, m in enumerate(messages) if i not in dropped]
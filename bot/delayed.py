@@ -0,0 +1,335 @@
+"""Replies sent after a human-like pause, queued in Redis.
+
+Jobs wait in a sorted set per personality scored by due time, so nothing is
+held in memory while waiting and pending replies survive restarts. Workers
+in any container of that personality claim due jobs atomically; a claimed
+job is leased for ``DELAYED_LEASE`` seconds, renewed while it runs, and
+handed out again if the worker dies before finishing it. A job that fails is queued again with
+backoff, up to ``DELAYED_MAX_ATTEMPTS`` runs.
+
+The container that queues a job may also generate its reply right away and
+keep it as a draft next to the job. The draft is sent when the job is due if
+the history and request it would be generated from are unchanged, so users
+wait only for the delay, not the delay plus the LLM call.
+"""
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from collections import Counter, deque
+from dataclasses import MISSING, dataclass, fields
+
+from aiogram import Bot
+
+from .config import (
+    DELAYED_CONCURRENCY,
+    DELAYED_LEASE,
+    DELAYED_MAX_ATTEMPTS,
+    DELAYED_POLL,
+    DELAYED_RETRY_BASE,
+    DELAYED_RETRY_MAX,
+    logger,
+)
+from .history import redis
+
+
+@dataclass
+class ReplyJob:
+    chat_id: int
+    user_id: int
+    thread_id: int
+    text: str
+    reply_to: int | None = None
+    # answer from recent history instead of the reply chain of ``reply_to``
+    recent_history: bool = False
+    # only the first line replies to ``reply_to``
+    reply_once: bool = False
+    send_thread_id: int | None = None
+    priority: int = 2
+    model: str = "deepseek-chat"
+    error_message: str | None = None
+    additional_context: str | None = None
+    due: float = 0.0
+    id: str = ""
+    # failed runs so far
+    attempts: int = 0
+
+    def dumps(self) -> str:
+        # fields left at their default are not stored
+        data = {
+            f.name: getattr(self, f.name)
+            for f in fields(self)
+            if f.default is MISSING or getattr(self, f.name) != f.default
+        }
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, raw: str) -> "ReplyJob":
+        return cls(**json.loads(raw))
+
+
+def _keys(personality: str) -> list[str]:
+    return [f"delayed:{personality}", f"delayed:{personality}:leased"]
+
+
+def _draft_key(personality: str, job_id: str) -> str:
+    return f"delayed:{personality}:draft:{job_id}"
+
+
+# Claim up to ARGV[3] jobs: leases that ran out first, then jobs due by
+# ARGV[1]; each is leased until ARGV[2].
+# KEYS: due jobs, leased jobs
+_CLAIM = redis.register_script(
+    """
+    local now = tonumber(ARGV[1])
+    local limit = tonumber(ARGV[3])
+    local out = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now, 'LIMIT', 0, limit)
+    local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'LIMIT', 0, limit - #out)
+    for _, job in ipairs(due) do
+        redis.call('ZREM', KEYS[1], job)
+        out[#out + 1] = job
+    end
+    for _, job in ipairs(out) do
+        redis.call('ZADD', KEYS[2], ARGV[2], job)
+    end
+    return out
+    """
+)
+
+# Extend the lease on ARGV[1] to ARGV[3] if it still ends at ARGV[2]; 0 if
+# it ran out and another worker took the job over.
+# KEYS: leased jobs
+_RENEW = redis.register_script(
+    """
+    local until_ = redis.call('ZSCORE', KEYS[1], ARGV[1])
+    if not until_ or tonumber(until_) ~= tonumber(ARGV[2]) then
+        return 0
+    end
+    redis.call('ZADD', KEYS[1], 'XX', ARGV[3], ARGV[1])
+    return 1
+    """
+)
+
+# Give up the lease on ARGV[1] if it still ends at ARGV[2], and queue ARGV[3]
+# at ARGV[4] instead if given; 0 if the lease was taken over.
+# KEYS: due jobs, leased jobs
+_RELEASE = redis.register_script(
+    """
+    local until_ = redis.call('ZSCORE', KEYS[2], ARGV[1])
+    if not until_ or tonumber(until_) ~= tonumber(ARGV[2]) then
+        return 0
+    end
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    if ARGV[3] then
+        redis.call('ZADD', KEYS[1], ARGV[4], ARGV[3])
+    end
+    return 1
+    """
+)
+
+stats: Counter[str] = Counter()
+LATENESS: deque[float] = deque(maxlen=500)
+
+
+async def schedule(personality: str, job: ReplyJob, delay: float) -> None:
+    """Queue ``job`` for ``personality`` to run ``delay`` seconds from now."""
+    job.due = round(time.time() + delay, 3)
+    job.id = job.id or uuid.uuid4().hex[:12]
+    await redis.zadd(_keys(personality)[0], {job.dumps(): job.due})
+    stats["scheduled"] += 1
+    logger.info(f"[DELAYED_SCHEDULED] personality={personality} chat={job.chat_id} delay={delay:.0f}s")
+
+
+def fingerprint(*parts) -> str:
+    """Hash what a reply is generated from, to tell whether a draft is stale."""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def save_draft(
+    personality: str, job_id: str, fingerprint: str, lines: list[str], ttl: float
+) -> None:
+    """Keep the reply generated ahead of time for job ``job_id``."""
+    data = json.dumps({"key": fingerprint, "lines": lines}, ensure_ascii=False)
+    await redis.set(_draft_key(personality, job_id), data, ex=max(1, int(ttl)))
+    stats["drafted"] += 1
+
+
+async def take_draft(personality: str, job_id: str, fingerprint: str) -> list[str] | None:
+    """Pop the draft of ``job_id``; ``None`` if missing or made from other input."""
+    raw = await redis.getdel(_draft_key(personality, job_id))
+    if raw is None:
+        stats["draft_missing"] += 1
+        return None
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        data = {}
+    if data.get("key") != fingerprint:
+        stats["draft_stale"] += 1
+        logger.info(f"[DELAYED_DRAFT_STALE] personality={personality} job={job_id}")
+        return None
+    stats["draft_hit"] += 1
+    return data.get("lines") or []
+
+
+async def queue_depth(personality: str) -> dict[str, int]:
+    due, leased = _keys(personality)
+    return {"waiting": await redis.zcard(due), "leased": await redis.zcard(leased)}
+
+
+def lateness_stats() -> dict[str, float]:
+    if not LATENESS:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(LATENESS)
+    return {
+        "count": len(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+class _Lease:
+    """The lease on one running job, renewed until the job is released."""
+
+    def __init__(self, personality: str, raw: str, until: float):
+        self.keys = _keys(personality)
+        self.raw = raw
+        self.until = until
+
+    async def keep(self) -> None:
+        while True:
+            await asyncio.sleep(DELAYED_LEASE / 3)
+            until = time.time() + DELAYED_LEASE
+            try:
+                renewed = await _RENEW(keys=self.keys[1:], args=[self.raw, self.until, until])
+            except Exception as e:
+                logger.error(f"[DELAYED_RENEW_FAIL] job={self.raw} err={e}")
+                continue
+            if renewed:
+                self.until = until
+            else:
+                logger.warning(f"[DELAYED_LEASE_LOST] job={self.raw}")
+
+    async def release(self, again: ReplyJob | None = None) -> None:
+        """Drop the job, or queue ``again`` in its place."""
+        args = [self.raw, self.until]
+        if again is not None:
+            args += [again.dumps(), again.due]
+        await _RELEASE(keys=self.keys, args=args)
+
+
+async def _retry(personality: str, lease: _Lease, job: ReplyJob) -> None:
+    """Queue a failed job again with backoff, or drop it after the last attempt."""
+    job.attempts += 1
+    if job.attempts >= DELAYED_MAX_ATTEMPTS:
+        stats["gave_up"] += 1
+        logger.error(f"[DELAYED_GAVE_UP] personality={personality} chat={job.chat_id} attempts={job.attempts}")
+        await lease.release()
+        return
+    delay = min(DELAYED_RETRY_MAX, DELAYED_RETRY_BASE * 2 ** (job.attempts - 1))
+    job.due = round(time.time() + delay, 3)
+    await lease.release(job)
+    stats["retried"] += 1
+
+
+async def _run(bot: Bot, personality: str, lease: _Lease) -> None:
+    """Send the reply of the leased job, renewing the lease meanwhile."""
+    keeper = asyncio.create_task(lease.keep())
+    try:
+        await _send(bot, personality, lease)
+    finally:
+        keeper.cancel()
+
+
+async def _send(bot: Bot, personality: str, lease: _Lease) -> None:
+    from .handlers.common import respond_with_personality_to_chat
+    from .llm_queue import Priority
+
+    try:
+        job = ReplyJob.loads(lease.raw)
+    except Exception:
+        logger.error(f"[DELAYED_BAD_JOB] job={lease.raw}")
+        await lease.release()
+        return
+    late = max(0.0, time.time() - job.due)
+    LATENESS.append(late)
+    kwargs = {}
+    if job.error_message:
+        kwargs["error_message"] = job.error_message
+    try:
+        await respond_with_personality_to_chat(
+            bot,
+            job.chat_id,
+            job.user_id,
+            job.thread_id,
+            personality,
+            job.text,
+            reply_to_message_id=job.reply_to,
+            additional_context=job.additional_context,
+            model=job.model,
+            priority=Priority(job.priority),
+            recent_history=job.recent_history,
+            reply_once=job.reply_once,
+            send_thread_id=job.send_thread_id,
+            draft_id=job.id,
+            # the lease is kept until Telegram accepted the reply, or for
+            # half a lease at most while it waits in the send queue
+            wait_sent=DELAYED_LEASE / 2,
+            **kwargs,
+        )
+    except Exception as e:
+        stats["failed"] += 1
+        logger.error(
+            f"[DELAYED_FAIL] personality={personality} chat={job.chat_id} "
+            f"attempt={job.attempts + 1} late={late:.1f}s err={e}"
+        )
+        await _retry(personality, lease, job)
+        return
+    stats["done"] += 1
+    await lease.release()
+
+
+async def run_delayed_jobs(bot: Bot, personality: str) -> None:
+    """Claim and send this personality's due replies until cancelled."""
+    keys = _keys(personality)
+    tasks: set[asyncio.Task] = set()
+    # leases of the jobs this worker runs; a job whose lease ran out anyway is
+    # claimed again by this worker, but not started a second time
+    running: dict[str, _Lease] = {}
+    last_report = time.monotonic()
+    while True:
+        free = DELAYED_CONCURRENCY - len(tasks)
+        if free <= 0:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            continue
+        now = time.time()
+        until = now + DELAYED_LEASE
+        try:
+            jobs = await _CLAIM(keys=keys, args=[now, until, free])
+        except Exception as e:
+            jobs = []
+            logger.error(f"[DELAYED_CLAIM_FAIL] personality={personality} err={e}")
+        for raw in jobs:
+            if raw in running:
+                running[raw].until = until
+                continue
+            running[raw] = _Lease(personality, raw, until)
+            task = asyncio.create_task(_run(bot, personality, running[raw]))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            task.add_done_callback(lambda _, raw=raw: running.pop(raw, None))
+        if time.monotonic() - last_report >= 60:
+            last_report = time.monotonic()
+            try:
+                depth = await queue_depth(personality)
+            except Exception:
+                depth = {}
+            logger.info(
+                f"[DELAYED_STATS] personality={personality} depth={depth} "
+                f"lateness={lateness_stats()} {dict(stats)}"
+            )
+        if not jobs:
+            await asyncio.sleep(DELAYED_POLL)
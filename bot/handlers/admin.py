@@ -17,6 +17,7 @@ from ..db import (
     set_question,
 )
 from ..keyboards import buttons_menu, kuplinov_menu, main_menu, personalities_menu
+from ..prompts import invalidate_prompt
 from ..states import (
     ButtonAddState,
     ButtonEditState,
@@ -314,5 +315,6 @@ async def process_personality_text(message: Message, state: FSMContext) -> None:
         return
     file = PROMPTS_DIR / f"{name}.txt"
     file.write_text(message.text or "", encoding="utf-8")
+    invalidate_prompt(name)
     await message.answer("Личность обновлена", reply_markup=personalities_menu())
     await state.clear()
@@ -1,21 +1,30 @@
 import asyncio
-import json
 import random
-from typing import Any
-
-from httpx import AsyncClient, AsyncHTTPTransport
+from contextlib import aclosing
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Iterable
 
 from aiogram import Bot
 from aiogram.types import CallbackQuery, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from ..auto_reply import CHANNEL as AUTO_REPLY_CHANNEL
+from ..auto_reply import publish_auto_reply
+from ..breaker import route_request
+from ..chunking import chunk_lines
+from ..coalesce import coalescer, request_key
+from ..comments import push_comment
+from ..context import budget_for, pack_messages
 from ..config import (
     ADMIN_ID,
     DEEPSEEK_API_KEY,
     DEEPSEEK_PRESENCE_PENALTY,
+    DEEPSEEK_STREAM,
     DEEPSEEK_TEMPERATURE,
     DEEPSEEK_URL,
+    DELAYED_LEASE,
+    DELAYED_SPECULATIVE,
+    LLM_MAX_ATTEMPTS,
+    LLM_TIMEOUT,
     is_group_allowed,
     logger,
 )
@@ -27,18 +36,17 @@ from ..db import (
     get_question,
     is_banned,
 )
-from ..history import add_message, get_history, get_thread, increment_count, redis
-from ..personalities import MAIN_PROMPT, SLANG_DICT, get_mood_prompt, get_prompt
+from ..delayed import ReplyJob, fingerprint, save_draft, schedule, take_draft
+from ..history import add_message, get_history, get_thread, increment_count
+from ..llm import RetryPolicy, post_json, stream_lines
+from ..llm_queue import LLMOverloaded, Priority, scheduler
+from ..outbox import enqueue
+from ..personalities import get_chunk_policy
+from ..prompts import build_system_prompt
 from ..utils import btn_id
 from ..tarot import draw_cards
 
 
-transport = AsyncHTTPTransport(retries=3)
-
-COMMENT_MERGE_WINDOW = 10
-_comment_buffers: dict[tuple[int, int], dict[str, Any]] = {}
-
-
 async def welcome(message: Message) -> None:
     if not is_group_allowed(message.chat.id):
         return
@@ -142,20 +150,9 @@ def _build_prompt(
     priority_text: str,
     additional_context: str,
 ) -> tuple[str, str]:
-    prompt = get_prompt(personality_key)
-    mood = get_mood_prompt(personality_key)
-    slang = ", ".join(f"{k}={v}" for k, v in SLANG_DICT.items())
     system_prompt = "\n".join(
         [
-            MAIN_PROMPT,
-            (
-                f"Словарь сленга (ИСПОЛЬЗУЙ ТОЛЬКО ДЛЯ ПОНИМАНИЯ, НЕ ВСТАВЛЯЙ В ОТВЕТЫ): {slang}\n"
-                if slang
-                else ""
-            ),
-            prompt,
-            mood,
-            (additional_context if additional_context else ""),
+            build_system_prompt(personality_key, additional_context, [context, priority_text]),
             "Сначала идет сообщение пользователя (если есть), затем история чата:\n",
         ]
     )
@@ -166,24 +163,11 @@ def _build_prompt(
     return system_prompt, user_prompt
 
 
-def _build_system_prompt(personality_key: str, additional_context: str | None) -> str:
+def _build_system_prompt(
+    personality_key: str, additional_context: str | None, texts: Iterable[str] = ()
+) -> str:
     """Construct the system prompt for a given personality."""
-
-    prompt = get_prompt(personality_key)
-    mood = get_mood_prompt(personality_key)
-    slang = ", ".join(f"{k}={v}" for k, v in SLANG_DICT.items())
-    parts = [
-        MAIN_PROMPT,
-        (
-            f"Словарь сленга (ИСПОЛЬЗУЙ ТОЛЬКО ДЛЯ ПОНИМАНИЯ, НЕ ВСТАВЛЯЙ В ОТВЕТЫ): {slang}\n"
-            if slang
-            else ""
-        ),
-        prompt,
-        mood,
-        (additional_context if additional_context else ""),
-    ]
-    return "\n".join(parts)
+    return build_system_prompt(personality_key, additional_context, texts)
 
 
 def _history_to_messages(system_prompt: str, history: list[dict]) -> list[dict]:
@@ -201,23 +185,171 @@ def _history_to_messages(system_prompt: str, history: list[dict]) -> list[dict]:
     return messages
 
 
-async def _httpx_post_with_retries(url: str, json_payload: dict, headers: dict, max_attempts: int = 3, timeout: int = 30) -> dict:
-    """POST with retries. Retries on network errors and 5xx/429 responses."""
-    attempt = 0
-    backoff = 1
-    while attempt < max_attempts:
-        attempt += 1
-        try:
-            async with AsyncClient(transport=transport, timeout=timeout) as client:
-                resp = await client.post(url, json=json_payload, headers=headers)
-                resp.raise_for_status()
-                return resp.json()
-        except Exception as e:
-            logger.warning(f"[DEEPSEEK_FAIL] attempt={attempt} err={e}")
-            if attempt >= max_attempts:
-                raise
-            await asyncio.sleep(backoff)
-            backoff *= 2
+async def _httpx_post_with_retries(url: str, json_payload: dict, headers: dict, max_attempts: int = LLM_MAX_ATTEMPTS, timeout: float = LLM_TIMEOUT) -> dict:
+    """POST within the retry budget. Retries on network errors, 5xx and retryable 4xx."""
+    policy = RetryPolicy(max_attempts=max_attempts, attempt_timeout=timeout)
+    return await post_json(url, json_payload, headers, policy)
+
+
+async def _httpx_stream_lines(url: str, json_payload: dict, headers: dict, max_attempts: int = LLM_MAX_ATTEMPTS, timeout: float = LLM_TIMEOUT) -> AsyncIterator[str]:
+    """Stream completion lines. Retries only until the first line was received."""
+    policy = RetryPolicy(max_attempts=max_attempts, attempt_timeout=timeout)
+    async for line in stream_lines(url, json_payload, headers, policy):
+        yield line
+
+
+async def _upstream_lines(url: str, payload: dict, headers: dict, priority: Priority) -> AsyncIterator[str]:
+    """Yield reply lines, as they stream in when DEEPSEEK_STREAM is enabled."""
+    if DEEPSEEK_STREAM:
+        async with scheduler.slot(priority):
+            async for line in _httpx_stream_lines(url, payload, headers):
+                yield line
+        return
+    async with scheduler.slot(priority):
+        data = await _httpx_post_with_retries(url, payload, headers)
+    reply = data["choices"][0]["message"]["content"].strip()
+    for line in reply.split("\n"):
+        yield line
+
+
+async def _generate_lines(payload: dict, headers: dict, priority: Priority) -> AsyncIterator[str]:
+    """Yield reply lines; identical concurrent requests share one upstream call."""
+    # fail fast (or switch to the fallback model) before queueing for a slot
+    url, payload = route_request(DEEPSEEK_URL, payload)
+    produce = partial(_upstream_lines, url, payload, headers, priority)
+    async for line in coalescer.lines(request_key(payload), produce):
+        yield line
+
+
+async def _next_line(
+    lines: AsyncIterator[str], personality_key: str, priority: Priority
+) -> tuple[str | None, bool]:
+    """Return the next generated line, or ``(None, failed)`` once the reply is over.
+
+    A shed request only fails visibly if someone waits for it; auto-replies
+    are dropped silently.
+    """
+    try:
+        return await anext(lines), False
+    except StopAsyncIteration:
+        return None, False
+    except LLMOverloaded:
+        logger.warning(f"[DEEPSEEK_SHED] personality={personality_key} priority={priority.name}")
+        return None, priority < Priority.AUTO
+    except Exception as e:
+        logger.error(f"[DEEPSEEK_ERROR] personality={personality_key} err={e}")
+        return None, True
+
+
+async def _chat_payload(
+    chat_id: int,
+    user_id: int,
+    thread_id: int | None,
+    personality_key: str,
+    priority_text: str,
+    reply_to_message_id: int | None,
+    additional_context: str | None,
+    model: str,
+) -> tuple[dict, str]:
+    """Build the completion request for a reply in ``chat_id``.
+
+    Also returns a fingerprint of its inputs; the system prompt itself is not
+    hashed since the mood in it is picked at random.
+    """
+    if reply_to_message_id:
+        history = await get_thread(chat_id, user_id, thread_id, reply_to_message_id)
+    else:
+        history = await get_history(chat_id, user_id, thread_id, limit=10)
+    logger.info(f"[HISTORY] {history}")
+
+    system_prompt = _build_system_prompt(
+        personality_key,
+        additional_context,
+        [m.get("content", "") for m in history] + [priority_text],
+    )
+    _msgs = _history_to_messages(system_prompt, history)
+    if priority_text and (
+        not history or history[-1].get("content") != priority_text
+    ):
+        _msgs.append({"role": "user", "content": priority_text})
+    _msgs = pack_messages(_msgs, budget_for(model))
+
+    payload = {
+        "model": model,
+        "messages": _msgs,
+        "temperature": DEEPSEEK_TEMPERATURE,
+        "presence_penalty": DEEPSEEK_PRESENCE_PENALTY,
+    }
+    return payload, fingerprint(history, priority_text, additional_context, model)
+
+
+async def _replay(lines: list[str]) -> AsyncIterator[str]:
+    for line in lines:
+        yield line
+
+
+# drafts being generated in this process, by job id
+_drafts: dict[str, asyncio.Task] = {}
+
+
+async def _draft_reply(personality_key: str, job: ReplyJob, delay: float) -> None:
+    """Generate the reply of a queued job now and store it as its draft."""
+    try:
+        payload, key = await _chat_payload(
+            job.chat_id,
+            job.user_id,
+            job.thread_id,
+            personality_key,
+            job.text,
+            job.reply_to if not job.recent_history else None,
+            job.additional_context,
+            job.model,
+        )
+        headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}"}
+        lines = []
+        async with aclosing(_generate_lines(payload, headers, Priority(job.priority))) as gen:
+            async for line in gen:
+                lines.append(line)
+        await save_draft(personality_key, job.id, key, lines, delay + DELAYED_LEASE)
+    except Exception as e:
+        # the job generates its reply itself when it is due
+        logger.warning(f"[DELAYED_DRAFT_FAIL] personality={personality_key} chat={job.chat_id} err={e}")
+
+
+async def _queue_reply(personality_key: str, job: ReplyJob, delay_range: tuple[int, int]) -> None:
+    delay = random.uniform(*delay_range)
+    await schedule(personality_key, job, delay)
+    if DELAYED_SPECULATIVE:
+        task = asyncio.create_task(_draft_reply(personality_key, job, delay))
+        _drafts[job.id] = task
+        task.add_done_callback(lambda _, job_id=job.id: _drafts.pop(job_id, None))
+
+
+def _send_line(
+    bot: Bot,
+    send: Callable[[], Awaitable[Message]],
+    chat_id: int,
+    user_id: int,
+    thread_id: int | None,
+    text: str,
+    reply_id: int | None,
+    personality_key: str,
+) -> asyncio.Future:
+    """Queue one reply message; it is added to history once Telegram accepted it."""
+
+    async def record(sent: Message) -> None:
+        await add_message(
+            chat_id,
+            user_id,
+            thread_id,
+            sent.message_id,
+            text,
+            reply_id,
+            role="assistant",
+            name=personality_key,
+        )
+
+    return enqueue(bot, chat_id, send, record)
 
 
 async def respond_with_personality(
@@ -230,6 +362,7 @@ async def respond_with_personality(
     additional_context: str | None = None,
     model: str = "deepseek-chat",
     delay_range: tuple[int, int] | None = None,
+    priority: Priority = Priority.COMMAND,
 ) -> None:
     if not is_group_allowed(message.chat.id):
         title = message.chat.title or ""
@@ -244,43 +377,45 @@ async def respond_with_personality(
     thread_id = getattr(message, "message_thread_id", 0) or 0
     user_id = message.from_user.id
     if delay_range:
-        await asyncio.sleep(random.uniform(*delay_range))
+        if reply_to_comment:
+            target = {
+                "reply_to": reply_to_comment.message_id,
+                "recent_history": True,
+                "send_thread_id": getattr(reply_to_comment, "message_thread_id", None),
+            }
+        else:
+            topic = getattr(message, "is_topic_message", False)
+            target = {
+                "reply_to": reply_to.message_id if reply_to else None,
+                "reply_once": True,
+                "send_thread_id": message.message_thread_id if topic else None,
+            }
+        job = ReplyJob(
+            message.chat.id,
+            user_id,
+            thread_id,
+            priority_text,
+            priority=int(priority),
+            model=model,
+            error_message=error_message,
+            additional_context=additional_context,
+            **target,
+        )
+        await _queue_reply(personality_key, job, delay_range)
+        return
     await message.bot.send_chat_action(message.chat.id, "typing")
     logger.info(f"[REQUEST] personality={personality_key} user={user.id}")
-    if reply_to and not reply_to_comment:
-        history = await get_thread(
-            message.chat.id, user_id, thread_id, reply_to.message_id
-        )
-        logger.info(f"[RESPONSE] history={history}")
-    else:
-        history = await get_history(message.chat.id, user_id, thread_id, limit=10)
-
-    logger.info(f"[HISTORY] {history}")
-    system_prompt = _build_system_prompt(personality_key, additional_context)
+    payload, _ = await _chat_payload(
+        message.chat.id,
+        user_id,
+        thread_id,
+        personality_key,
+        priority_text,
+        reply_to.message_id if reply_to and not reply_to_comment else None,
+        additional_context,
+        model,
+    )
     headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}"}
-
-    _msgs = _history_to_messages(system_prompt, history)
-    if priority_text and (
-        not history or history[-1].get("content") != priority_text
-    ):
-        _msgs.append({"role": "user", "content": priority_text})
-
-    payload = {
-        "model": model,
-        "messages": _msgs,
-        "temperature": DEEPSEEK_TEMPERATURE,
-        "presence_penalty": DEEPSEEK_PRESENCE_PENALTY,
-    }
-    try:
-        data = await _httpx_post_with_retries(DEEPSEEK_URL, payload, headers, max_attempts=3, timeout=30)
-    except Exception as e:
-        logger.error(f"[DEEPSEEK_ERROR] personality={personality_key} err={e}")
-        if reply_to:
-            await reply_to.reply(error_message)
-        else:
-            await message.answer(error_message)
-        return
-    reply = data["choices"][0]["message"]["content"].strip()
     already_replied = False
     comment_thread_id = (
         getattr(reply_to_comment, "message_thread_id", None)
@@ -292,30 +427,32 @@ async def respond_with_personality(
         if reply_to_comment
         else None
     )
-    for mes_ in reply.split("\n"):
-        text = mes_.strip()
-
-        if text:
-            if reply_to and not already_replied:
-                sent = await reply_to.reply(text)
-                await add_message(
-                    message.chat.id,
-                    user_id,
-                    thread_id,
-                    sent.message_id,
-                    text,
-                    reply_to.message_id,
-                    role="assistant",
-                    name=personality_key,
-                )
-                already_replied = True
-            else:
-                if (
+    sent_any = False
+    source = chunk_lines(_generate_lines(payload, headers, priority), get_chunk_policy(personality_key))
+    async with aclosing(source) as lines:
+        while True:
+            mes_, failed = await _next_line(lines, personality_key, priority)
+            if mes_ is None:
+                if failed and not sent_any:
+                    if reply_to:
+                        enqueue(message.bot, message.chat.id, partial(reply_to.reply, error_message))
+                    else:
+                        enqueue(message.bot, message.chat.id, partial(message.answer, error_message))
+                return
+            text = mes_.strip()
+
+            if text:
+                if reply_to and not already_replied:
+                    send = partial(reply_to.reply, text)
+                    reply_id = reply_to.message_id
+                    already_replied = True
+                elif (
                     reply_to_comment
                     and comment_thread_id
                     and getattr(message, "bot", None)
                 ):
-                    sent = await message.bot.send_message(
+                    send = partial(
+                        message.bot.send_message,
                         message.chat.id,
                         text,
                         reply_to_message_id=comment_reply_to_id,
@@ -323,19 +460,12 @@ async def respond_with_personality(
                     )
                     reply_id = comment_reply_to_id
                 else:
-                    sent = await message.answer(text)
+                    send = partial(message.answer, text)
                     reply_id = message.message_id
-                await add_message(
-                    message.chat.id,
-                    user_id,
-                    thread_id,
-                    sent.message_id,
-                    text,
-                    reply_id,
-                    role="assistant",
-                    name=personality_key,
+                _send_line(
+                    message.bot, send, message.chat.id, user_id, thread_id, text, reply_id, personality_key
                 )
-            await asyncio.sleep(0.7)
+                sent_any = True
 
 
 async def respond_with_personality_to_chat(
@@ -350,56 +480,96 @@ async def respond_with_personality_to_chat(
     additional_context: str | None = None,
     model: str = "deepseek-chat",
     delay_range: tuple[int, int] | None = None,
+    priority: Priority = Priority.AUTO,
+    recent_history: bool = False,
+    reply_once: bool = False,
+    send_thread_id: int | None = None,
+    draft_id: str | None = None,
+    wait_sent: float = 0,
 ) -> None:
+    """Answer in ``chat_id``, or queue the answer when ``delay_range`` is given.
+
+    Replies to the reply chain of ``reply_to_message_id`` unless
+    ``recent_history`` is set; with ``reply_once`` only the first line is sent
+    as a reply to it. ``draft_id`` names a delayed job whose draft is sent
+    instead of a new completion if it was made from the same prompt. With
+    ``wait_sent`` it waits up to that many seconds for the queued messages to
+    be sent, and raises ``MessageDropped`` if none of them was.
+    """
     if delay_range:
-        await asyncio.sleep(random.uniform(*delay_range))
+        job = ReplyJob(
+            chat_id,
+            user_id,
+            thread_id or 0,
+            priority_text,
+            reply_to=reply_to_message_id,
+            recent_history=recent_history,
+            reply_once=reply_once,
+            send_thread_id=send_thread_id,
+            priority=int(priority),
+            model=model,
+            error_message=error_message,
+            additional_context=additional_context,
+        )
+        await _queue_reply(personality_key, job, delay_range)
+        return
     await bot.send_chat_action(chat_id, "typing")
     logger.info(f"[REQUEST] personality={personality_key} chat={chat_id}")
-    if reply_to_message_id:
-        history = await get_thread(chat_id, user_id, thread_id, reply_to_message_id)
-    else:
-        history = await get_history(chat_id, user_id, thread_id, limit=10)
-
-    system_prompt = _build_system_prompt(personality_key, additional_context)
+    send_kwargs = {"message_thread_id": send_thread_id} if send_thread_id else {}
+    payload, key = await _chat_payload(
+        chat_id,
+        user_id,
+        thread_id,
+        personality_key,
+        priority_text,
+        reply_to_message_id if not recent_history else None,
+        additional_context,
+        model,
+    )
     headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}"}
-    _msgs = _history_to_messages(system_prompt, history)
-    if priority_text and (
-        not history or history[-1].get("content") != priority_text
-    ):
-        _msgs.append({"role": "user", "content": priority_text})
-
-    payload = {
-        "model": model,
-        "messages": _msgs,
-        "temperature": DEEPSEEK_TEMPERATURE,
-        "presence_penalty": DEEPSEEK_PRESENCE_PENALTY,
-    }
-    try:
-        data = await _httpx_post_with_retries(
-            DEEPSEEK_URL, payload, headers, max_attempts=3, timeout=30
-        )
-    except Exception as e:
-        logger.error(f"[DEEPSEEK_ERROR] personality={personality_key} err={e}")
-        await bot.send_message(chat_id, error_message, reply_to_message_id=reply_to_message_id)
-        return
-    reply = data["choices"][0]["message"]["content"].strip()
-    for mes_ in reply.split("\n"):
-        text = mes_.strip()
-        if text:
-            sent = await bot.send_message(
-                chat_id, text, reply_to_message_id=reply_to_message_id
-            )
-            await add_message(
-                chat_id,
-                user_id,
-                thread_id,
-                sent.message_id,
-                text,
-                reply_to_message_id,
-                role="assistant",
-                name=personality_key,
-            )
-            await asyncio.sleep(0.7)
+    draft = None
+    if draft_id and DELAYED_SPECULATIVE:
+        pending = _drafts.get(draft_id)
+        if pending:
+            # generating again would cost more than waiting for the draft
+            await asyncio.wait([pending])
+        draft = await take_draft(personality_key, draft_id, key)
+    if draft is not None:
+        source = _replay(draft)
+    else:
+        source = _generate_lines(payload, headers, priority)
+    queued: list[asyncio.Future] = []
+    async with aclosing(chunk_lines(source, get_chunk_policy(personality_key))) as lines:
+        while True:
+            mes_, failed = await _next_line(lines, personality_key, priority)
+            if mes_ is None:
+                if failed and not queued:
+                    queued.append(enqueue(
+                        bot,
+                        chat_id,
+                        partial(
+                            bot.send_message,
+                            chat_id,
+                            error_message,
+                            reply_to_message_id=reply_to_message_id,
+                            **send_kwargs,
+                        ),
+                    ))
+                break
+            text = mes_.strip()
+            if text:
+                reply_id = None if reply_once and queued else reply_to_message_id
+                send = partial(
+                    bot.send_message, chat_id, text, reply_to_message_id=reply_id, **send_kwargs
+                )
+                queued.append(_send_line(
+                    bot, send, chat_id, user_id, thread_id, text, reply_to_message_id, personality_key
+                ))
+    if wait_sent and queued:
+        _, pending = await asyncio.wait(queued, timeout=wait_sent)
+        # a reply that got out in part, or is still queued, is not sent again
+        if not pending and all(f.exception() for f in queued):
+            raise queued[0].exception()
 
 
 async def cmd_kuplinov(message: Message) -> None:
@@ -510,25 +680,6 @@ def should_count_for_random(message: Message, personality_key: str) -> bool:
     )
 
 
-async def _process_comment_buffer(key: tuple[int, int], personality_key: str) -> None:
-    try:
-        await asyncio.sleep(COMMENT_MERGE_WINDOW)
-    except asyncio.CancelledError:
-        return
-    data = _comment_buffers.pop(key, None)
-    if not data:
-        return
-    text = " ".join(data["texts"])
-    message = data["last_message"]
-    await respond_with_personality(
-        message,
-        personality_key,
-        text,
-        reply_to=message,
-        reply_to_comment=message,
-        delay_range=(15, 25),
-    )
-
 async def handle_message(message: Message, personality_key: str) -> None:
     if not is_group_allowed(message.chat.id):
         return
@@ -561,7 +712,7 @@ async def handle_message(message: Message, personality_key: str) -> None:
     triggered = False
     if should_count_for_random(message, personality_key):
         logger.info("TRIGGERED LONG MESSAGE")
-        triggered = await increment_count(message.chat.id, message.message_id)
+        triggered = await increment_count(message.chat.id, message.message_id, thread_id)
     if (
         personality_key == "Mrazota"
         and message.reply_to_message
@@ -574,19 +725,9 @@ async def handle_message(message: Message, personality_key: str) -> None:
             )
         )
     ):
-        user_id = getattr(user_obj, "id", None)
-        if user_id is None:
-            return
-        key = (message.chat.id, user_id)
-        data = _comment_buffers.get(key)
-        if data:
-            data["texts"].append(message.text)
-            data["last_message"] = message
-            data["task"].cancel()
-        else:
-            data = {"texts": [message.text], "last_message": message}
-            _comment_buffers[key] = data
-        data["task"] = asyncio.create_task(_process_comment_buffer(key, personality_key))
+        await push_comment(
+            personality_key, message.chat.id, user_id, message.message_id, thread_id, message.text
+        )
         return
     if (
         message.reply_to_message
@@ -599,6 +740,7 @@ async def handle_message(message: Message, personality_key: str) -> None:
             message.text,
             reply_to=message,
             delay_range=(15, 25),
+            priority=Priority.REPLY,
         )
         return
     if triggered and random.random() < 0.5:
@@ -613,4 +755,4 @@ async def handle_message(message: Message, personality_key: str) -> None:
             "text": message.text,
             "personality": personality,
         }
-        await redis.publish(AUTO_REPLY_CHANNEL, json.dumps(payload))
+        await publish_auto_reply(payload)
@@ -1,15 +1,480 @@
-import json
+import asyncio
+import uuid
+from collections import Counter, OrderedDict
+
 from redis.asyncio import Redis
 
-from .config import REDIS_URL
+from .codec import decode_entry, encode_entry
+from .config import (
+    HISTORY_CACHE_BYTES,
+    HISTORY_CACHE_SIZE,
+    HISTORY_CHAIN_HOPS,
+    HISTORY_MAX_MESSAGES,
+    HISTORY_SCAN,
+    HISTORY_TTL,
+    HISTORY_USER_VIEW,
+    RANDOM_REPLY_COOLDOWN,
+    RANDOM_REPLY_EVERY,
+    RANDOM_REPLY_THRESHOLDS,
+    REDIS_URL,
+    logger,
+)
 
 
 redis: Redis
 redis = Redis.from_url(REDIS_URL, decode_responses=True)
+# stored messages are binary (see codec.py), so their scripts use bytes
+_raw = Redis.from_url(REDIS_URL)
+
+# Every thread has one stream of messages. All entries carry the same fields
+# so the stream stores the field names once per node instead of per entry:
+# m=message id, u=user id, p=replied-to id, d=role, name and content encoded
+# by codec.py. Entries written before the codec hold r=role, c=content and
+# n=name instead of d. A hash indexes message ids to stream entry ids for
+# reply lookups.
+_STREAM_LUA = """
+local function fields_of(flat)
+    local f = {}
+    for i = 1, #flat, 2 do
+        f[flat[i]] = flat[i + 1]
+    end
+    return f
+end
+
+local function entry_value(f)
+    if f['d'] then
+        return f['d']
+    end
+    local data = {role = f['r'], content = f['c'], reply = tonumber(f['p']) or 0}
+    if f['n'] and f['n'] ~= '' then
+        data['name'] = f['n']
+    end
+    return cjson.encode(data)
+end
+
+local function id_less(a, b)
+    local ams, aseq = string.match(a, '(%d+)-(%d+)')
+    local bms, bseq = string.match(b, '(%d+)-(%d+)')
+    if ams ~= bms then
+        return tonumber(ams) < tonumber(bms)
+    end
+    return tonumber(aseq) < tonumber(bseq)
+end
+
+-- Drop index entries that point before the start of the trimmed stream.
+local function prune(stream, index, slack)
+    if redis.call('HLEN', index) <= redis.call('XLEN', stream) + slack then
+        return 0
+    end
+    local first = redis.call('XRANGE', stream, '-', '+', 'COUNT', 1)[1]
+    local flat = redis.call('HGETALL', index)
+    local stale = {}
+    for i = 1, #flat, 2 do
+        if not first or id_less(flat[i + 1], first[1]) then
+            stale[#stale + 1] = flat[i]
+        end
+    end
+    for i = 1, #stale, 500 do
+        redis.call('HDEL', index, unpack(stale, i, math.min(i + 499, #stale)))
+    end
+    return #stale
+end
+
+-- Once the stream holds more than ``cap`` entries, drop the oldest down to
+-- 80% of it. Ancestors (up to ``hops`` replies back) of the entries that stay
+-- are kept in place, at most half of the dropped batch, so recent reply
+-- chains remain walkable even if they started long ago.
+local function trim(stream, index, cap, hops)
+    local size = redis.call('XLEN', stream)
+    if cap <= 0 or size <= cap then
+        return 0
+    end
+    local oldest = redis.call('XRANGE', stream, '-', '+', 'COUNT', size - math.floor(cap * 0.8))
+    local evict = {}
+    for _, e in ipairs(oldest) do
+        local f = fields_of(e[2])
+        evict[f['m']] = {sid = e[1], parent = f['p'] or '0'}
+    end
+    local budget = math.floor(#oldest / 2)
+    -- newest first, so the most recent chains are kept if the budget runs out
+    local kept = redis.call('XREVRANGE', stream, '+', '(' .. oldest[#oldest][1])
+    for _, e in ipairs(kept) do
+        if budget == 0 then break end
+        local current = fields_of(e[2])['p'] or '0'
+        for _ = 1, hops do
+            local old = evict[current]
+            if not old or old.keep or budget == 0 then break end
+            old.keep = true
+            budget = budget - 1
+            current = old.parent
+        end
+    end
+    local sids, ids = {}, {}
+    for id, old in pairs(evict) do
+        if not old.keep then
+            sids[#sids + 1] = old.sid
+            ids[#ids + 1] = id
+        end
+    end
+    for i = 1, #sids, 500 do
+        redis.call('XDEL', stream, unpack(sids, i, math.min(i + 499, #sids)))
+        redis.call('HDEL', index, unpack(ids, i, math.min(i + 499, #ids)))
+    end
+    return #sids
+end
+"""
+
+# A message already in the index is skipped, so containers storing the same
+# incoming message do not duplicate it. The id of a new message is appended
+# to the view of the user it belongs to, which keeps their last ARGV[10] ids,
+# and it is announced on the ARGV[7] channel with payload ARGV[8] so other
+# processes drop cached history.
+# KEYS: thread stream, message index, user view
+# ARGV: message id, user id, reply id, encoded message, cap, ttl seconds,
+#       invalidation channel, invalidation payload, chain hops, view size
+_ADD_MESSAGE = _raw.register_script(
+    _STREAM_LUA
+    + """
+    if redis.call('HEXISTS', KEYS[2], ARGV[1]) == 1 then
+        return 0
+    end
+    local id = redis.call('XADD', KEYS[1], '*',
+        'm', ARGV[1], 'u', ARGV[2], 'p', ARGV[3], 'd', ARGV[4])
+    redis.call('HSET', KEYS[2], ARGV[1], id)
+    local view = tonumber(ARGV[10])
+    if view > 0 then
+        redis.call('RPUSH', KEYS[3], ARGV[1])
+        redis.call('LTRIM', KEYS[3], -view, -1)
+    end
+    local ttl = tonumber(ARGV[6])
+    if ttl > 0 then
+        for i = 1, 3 do
+            redis.call('EXPIRE', KEYS[i], ttl)
+        end
+    end
+    local cap = tonumber(ARGV[5])
+    if cap > 0 then
+        trim(KEYS[1], KEYS[2], cap, tonumber(ARGV[9]))
+        prune(KEYS[1], KEYS[2], math.max(100, math.floor(cap / 5)))
+    end
+    redis.call('PUBLISH', ARGV[7], ARGV[8])
+    return 1
+    """
+)
+
+# Newest ARGV[2] messages of user ARGV[1], returned oldest first, looked up
+# through the user's view. A shorter view (messages stored before views
+# existed) is topped up by scanning at most ARGV[3] stream entries back, then
+# from the keys written before streams: the chat-scoped view and hash, then
+# the per-user history list.
+# KEYS: thread stream, message index, user view, chat-scoped user view,
+#       chat messages hash, user history list
+_GET_HISTORY = _raw.register_script(
+    _STREAM_LUA
+    + """
+    local user = ARGV[1]
+    local limit = tonumber(ARGV[2])
+    local scan = tonumber(ARGV[3])
+    local recent = {}
+    local seen = {}
+    -- trimmed messages in the view still count, the ones before them are gone too
+    local found = 0
+    for _, m in ipairs(redis.call('LRANGE', KEYS[3], -limit, -1)) do
+        seen[m] = true
+        found = found + 1
+        local sid = redis.call('HGET', KEYS[2], m)
+        local e = sid and redis.call('XRANGE', KEYS[1], sid, sid)[1]
+        if e then
+            recent[#recent + 1] = fields_of(e[2])
+        end
+    end
+    local last = '+'
+    local scanned = 0
+    while found < limit and scanned < scan do
+        local batch = redis.call('XREVRANGE', KEYS[1], last, '-',
+            'COUNT', math.min(100, scan - scanned))
+        if #batch == 0 then break end
+        for _, e in ipairs(batch) do
+            local f = fields_of(e[2])
+            if f['u'] == user and not seen[f['m']] then
+                recent[#recent + 1] = f
+                found = found + 1
+                if found == limit then break end
+            end
+        end
+        scanned = scanned + #batch
+        last = '(' .. batch[#batch][1]
+    end
+    local out = {}
+    local need = limit - found
+    if need > 0 then
+        local ids = redis.call('LRANGE', KEYS[4], -need, -1)
+        if #ids < need then
+            out = redis.call('LRANGE', KEYS[6], #ids - need, -1)
+        end
+        if #ids > 0 then
+            local values = redis.call('HMGET', KEYS[5], unpack(ids))
+            for i = 1, #ids do
+                if values[i] then out[#out + 1] = values[i] end
+            end
+        end
+    end
+    -- by message id: entries migrated from old keys may follow newer ones
+    table.sort(recent, function(a, b) return tonumber(a['m']) < tonumber(b['m']) end)
+    for _, f in ipairs(recent) do
+        out[#out + 1] = entry_value(f)
+    end
+    return out
+    """
+)
+
+# Walk reply pointers starting at ARGV[1], newest first, for at most ARGV[2]
+# hops; stops at a missing message or one that was already visited. Messages
+# not in the stream are looked up in the hashes written before streams.
+# KEYS: message index, thread stream, chat messages hash, user messages hash
+_GET_THREAD = _raw.register_script(
+    _STREAM_LUA
+    + """
+    local current = ARGV[1]
+    local hops = tonumber(ARGV[2])
+    local seen = {}
+    local out = {}
+    while current ~= '0' and #out < hops and not seen[current] do
+        seen[current] = true
+        local raw, parent
+        local sid = redis.call('HGET', KEYS[1], current)
+        local e = sid and redis.call('XRANGE', KEYS[2], sid, sid)[1]
+        if e then
+            local f = fields_of(e[2])
+            raw = entry_value(f)
+            parent = f['p']
+        else
+            raw = redis.call('HGET', KEYS[3], current)
+                or redis.call('HGET', KEYS[4], current)
+            if not raw then break end
+            local ok, data = pcall(cjson.decode, raw)
+            if ok and type(data) == 'table' then
+                parent = tostring(data['reply'] or 0)
+            end
+        end
+        out[#out + 1] = raw
+        if not parent then break end
+        current = parent
+    end
+    return out
+    """
+)
+
+# Count a message towards the random reply and decide in one step: at most
+# one message per ARGV[3] seconds is counted, and the ARGV[2]th resets the
+# count and returns 1.
+# KEYS: cooldown key, count key; ARGV: message id, threshold, cooldown, ttl
+_TRIGGER = redis.register_script(
+    """
+    local cooldown = tonumber(ARGV[3])
+    if cooldown > 0 and not redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', cooldown) then
+        return 0
+    end
+    local count = redis.call('INCR', KEYS[2])
+    local ttl = tonumber(ARGV[4])
+    if ttl > 0 then
+        redis.call('EXPIRE', KEYS[2], ttl)
+    end
+    if count >= tonumber(ARGV[2]) then
+        redis.call('SET', KEYS[2], 0, 'KEEPTTL')
+        return 1
+    end
+    return 0
+    """
+)
+
+# Trim a thread stream to the current cap, drop stale index entries and give
+# both keys a TTL if they have none.
+# KEYS: thread stream, message index; ARGV: cap, ttl seconds, chain hops
+_COMPACT = _raw.register_script(
+    _STREAM_LUA
+    + """
+    local removed = trim(KEYS[1], KEYS[2], tonumber(ARGV[1]), tonumber(ARGV[3]))
+    prune(KEYS[1], KEYS[2], 0)
+    local ttl = tonumber(ARGV[2])
+    if ttl > 0 then
+        for i = 1, 2 do
+            if redis.call('TTL', KEYS[i]) == -1 then
+                redis.call('EXPIRE', KEYS[i], ttl)
+            end
+        end
+    end
+    return removed
+    """
+)
+
+
+INVALIDATE_CHANNEL = "history:invalidate"
+INSTANCE_ID = uuid.uuid4().hex[:12]
+
+_WindowKey = tuple[int, int, int]
+
+
+def _message_size(msg: dict) -> int:
+    # rough in-memory footprint of a decoded message dict
+    return 240 + 2 * (len(msg.get("content", "")) + len(msg.get("name", "")))
+
+
+class HistoryCache:
+    """Decoded ``get_history`` windows per (chat, thread, user).
+
+    Windows are updated write-through by :func:`add_message`; writes from
+    other processes arrive on ``INVALIDATE_CHANNEL`` and drop the window.
+    The cache is only used while that subscription is up (``live``), and is
+    capped at ``max_entries`` windows and about ``max_bytes`` of messages,
+    least recently used first out.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.live = False
+        self.bytes = 0
+        # bumped by every invalidation and local write so a read that raced
+        # one is not stored
+        self.epoch = 0
+        # keys with a local write in flight; reads finishing meanwhile are not stored
+        self._writing: Counter[_WindowKey] = Counter()
+        self._windows: OrderedDict[_WindowKey, tuple[int, list[dict]]] = OrderedDict()
+        self._sizes: dict[_WindowKey, int] = {}
+        self.stats: Counter[str] = Counter()
+
+    @property
+    def enabled(self) -> bool:
+        return self.live and self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key: _WindowKey, limit: int) -> list[dict] | None:
+        if not self.enabled:
+            return None
+        entry = self._windows.get(key)
+        if entry is None or entry[0] < limit:
+            self.stats["misses"] += 1
+            return None
+        self._windows.move_to_end(key)
+        self.stats["hits"] += 1
+        return [dict(m) for m in entry[1][-limit:]]
+
+    def put(self, key: _WindowKey, limit: int, messages: list[dict], epoch: int) -> None:
+        if not self.enabled or epoch != self.epoch or self._writing[key]:
+            return
+        self._set(key, limit, list(messages[-limit:]))
+
+    def begin_write(self, key: _WindowKey) -> None:
+        self._writing[key] += 1
+
+    def end_write(self, key: _WindowKey, msg: dict | None) -> None:
+        """Finish a local write; ``msg`` is appended if it was stored."""
+        self.epoch += 1
+        self._writing[key] -= 1
+        if self._writing[key] <= 0:
+            del self._writing[key]
+        if msg is not None:
+            self.append(key, msg)
+
+    def append(self, key: _WindowKey, msg: dict) -> None:
+        entry = self._windows.get(key)
+        if entry is None:
+            return
+        limit, messages = entry
+        self._set(key, limit, (messages + [msg])[-limit:])
+
+    def invalidate(self, key: _WindowKey) -> None:
+        self.epoch += 1
+        if self._drop(key):
+            self.stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        self.epoch += 1
+        self._windows.clear()
+        self._sizes.clear()
+        self.bytes = 0
+
+    def _set(self, key: _WindowKey, limit: int, messages: list[dict]) -> None:
+        self._drop(key)
+        size = sum(_message_size(m) for m in messages)
+        self._windows[key] = (limit, messages)
+        self._sizes[key] = size
+        self.bytes += size
+        while self._windows and (
+            len(self._windows) > self.max_entries or self.bytes > self.max_bytes
+        ):
+            self._drop(next(iter(self._windows)))
+            self.stats["evictions"] += 1
+
+    def _drop(self, key: _WindowKey) -> bool:
+        if self._windows.pop(key, None) is None:
+            return False
+        self.bytes -= self._sizes.pop(key)
+        return True
+
+    def snapshot(self) -> dict[str, float]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "hits": self.stats["hits"],
+            "misses": self.stats["misses"],
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "invalidations": self.stats["invalidations"],
+            "evictions": self.stats["evictions"],
+            "windows": len(self._windows),
+            "bytes": self.bytes,
+        }
+
+
+cache = HistoryCache(HISTORY_CACHE_SIZE, HISTORY_CACHE_BYTES)
+_listener: asyncio.Task | None = None
+
+
+def _invalidation_payload(key: _WindowKey) -> str:
+    return " ".join(map(str, (INSTANCE_ID, *key)))
+
+
+async def _listen_invalidations() -> None:
+    while True:
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATE_CHANNEL)
+            cache.live = True
+            async for msg in pubsub.listen():
+                if msg.get("type") != "message":
+                    continue
+                origin, *key = str(msg.get("data", "")).split()
+                if origin == INSTANCE_ID or len(key) != 3:
+                    continue
+                cache.invalidate(tuple(map(int, key)))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[HISTORY_CACHE_OFFLINE] err={e}")
+        finally:
+            # without the subscription other writers cannot reach us
+            cache.live = False
+            cache.clear()
+            await pubsub.aclose()
+        await asyncio.sleep(1)
 
 
 async def init_history() -> None:
-    ...
+    """Start following other processes' writes so the history cache can be used."""
+    global _listener
+    if _listener is None or _listener.done():
+        _listener = asyncio.create_task(_listen_invalidations())
+
+
+def _thread_key(chat_id: int, thread_id: int | None, kind: str) -> str:
+    return f"chat:{chat_id}:thread:{thread_id or 0}:{kind}"
+
+
+def _chat_key(chat_id: int) -> str:
+    return f"chat:{chat_id}:messages"
+
+
+def _user_key(chat_id: int, thread_id: int | None, user_id: int, kind: str) -> str:
+    return f"chat:{chat_id}:thread:{thread_id or 0}:user:{user_id}:{kind}"
 
 
 async def add_message(
@@ -25,24 +490,48 @@ async def add_message(
 ) -> None:
     """Store a message in Redis with role-based metadata.
 
-    Messages are stored twice:
-    - in a list for quick retrieval of the last messages
-    - in a hash with reply mapping for building threads
-    """
+    The message is appended once to the thread's stream, together with the
+    id of the user whose history it belongs to (bot replies belong to the
+    user they answer), and its id is indexed for reply lookups.
 
-    tid = thread_id or 0
-    hist_key = f"chat:{chat_id}:thread:{tid}:user:{user_id}:history"
-    msg_data: dict[str, str | int] = {"role": role, "content": text}
-    if name:
-        msg_data["name"] = name
-    await redis.rpush(hist_key, json.dumps(msg_data))
-    await redis.ltrim(hist_key, -100, -1)
+    The id is also appended to that user's view, which ``get_history``
+    reads instead of scanning the stream.
 
-    msg_key = f"chat:{chat_id}:thread:{tid}:user:{user_id}:messages"
-    data = {"role": role, "content": text, "reply": reply_to or 0}
+    The writes run atomically in one round trip through a Lua script. The
+    keys expire ``HISTORY_TTL`` seconds after the last write. Past
+    ``HISTORY_MAX_MESSAGES`` entries the oldest are dropped, except the
+    ancestors of recent replies. Role, name and text are stored as one
+    value encoded with ``HISTORY_CODEC``.
+    """
+
+    key = (chat_id, thread_id or 0, user_id)
+    msg = {"role": role, "content": text}
     if name:
-        data["name"] = name
-    await redis.hset(msg_key, msg_id, json.dumps(data))
+        msg["name"] = name
+    cache.begin_write(key)
+    added = 0
+    try:
+        added = await _ADD_MESSAGE(
+            keys=[
+                _thread_key(chat_id, thread_id, "stream"),
+                _thread_key(chat_id, thread_id, "index"),
+                _user_key(chat_id, thread_id, user_id, "view"),
+            ],
+            args=[
+                msg_id,
+                user_id,
+                reply_to or 0,
+                encode_entry(role, text, name),
+                HISTORY_MAX_MESSAGES,
+                HISTORY_TTL,
+                INVALIDATE_CHANNEL,
+                _invalidation_payload(key),
+                HISTORY_CHAIN_HOPS,
+                HISTORY_USER_VIEW,
+            ],
+        )
+    finally:
+        cache.end_write(key, msg if added == 1 else None)
 
 
 async def get_history(
@@ -50,63 +539,91 @@ async def get_history(
 ) -> list[dict]:
     """Return the last messages for a chat as role-based dicts."""
 
-    tid = thread_id or 0
-    key = f"chat:{chat_id}:thread:{tid}:user:{user_id}:history"
-    raw_messages = await redis.lrange(key, -limit, -1)
+    key = (chat_id, thread_id or 0, user_id)
+    cached = cache.get(key, limit)
+    if cached is not None:
+        return cached
+    epoch = cache.epoch
+    raw_messages = await _GET_HISTORY(
+        keys=[
+            _thread_key(chat_id, thread_id, "stream"),
+            _thread_key(chat_id, thread_id, "index"),
+            _user_key(chat_id, thread_id, user_id, "view"),
+            _user_key(chat_id, thread_id, user_id, "ids"),
+            _chat_key(chat_id),
+            _user_key(chat_id, thread_id, user_id, "history"),
+        ],
+        args=[user_id, limit, HISTORY_SCAN],
+    )
     messages: list[dict] = []
     for raw in raw_messages:
-        try:
-            data = json.loads(raw)
-            if not isinstance(data, dict):
-                raise ValueError
-        except Exception:
+        msg = decode_entry(raw)
+        if msg is None:
             # Fall back to treating the raw string as a user message
-            data = {"role": "user", "content": raw}
-        msg: dict[str, str] = {
-            "role": data.get("role", "user"),
-            "content": data.get("content", ""),
-        }
-        name = data.get("name")
-        if name:
-            msg["name"] = name
+            msg = {"role": "user", "content": raw.decode(errors="replace")}
         messages.append(msg)
+    cache.put(key, limit, messages, epoch)
     return messages
 
 
 async def get_thread(
-    chat_id: int, user_id: int, thread_id: int | None, msg_id: int
+    chat_id: int,
+    user_id: int,
+    thread_id: int | None,
+    msg_id: int,
+    max_hops: int = HISTORY_CHAIN_HOPS,
 ) -> list[dict]:
-    """Return a message thread starting at ``msg_id`` as role-based dicts."""
+    """Return a message thread ending at ``msg_id`` as role-based dicts.
+
+    The reply chain is walked inside Redis in a single call and follows
+    replies across users; ``user_id`` only selects the per-user hash that is
+    consulted for messages stored by older versions.
+    """
 
-    tid = thread_id or 0
-    msg_key = f"chat:{chat_id}:thread:{tid}:user:{user_id}:messages"
+    if not msg_id:
+        return []
+    raw_chain = await _GET_THREAD(
+        keys=[
+            _thread_key(chat_id, thread_id, "index"),
+            _thread_key(chat_id, thread_id, "stream"),
+            _chat_key(chat_id),
+            _user_key(chat_id, thread_id, user_id, "messages"),
+        ],
+        args=[msg_id, max_hops],
+    )
     msgs: list[dict] = []
-    current = msg_id
-    while current:
-        raw = await redis.hget(msg_key, current)
-        if not raw:
-            break
-        data = json.loads(raw)
-        msg: dict[str, str] = {
-            "role": data.get("role", "user"),
-            "content": data.get("content", ""),
-        }
-        name = data.get("name")
-        if name:
-            msg["name"] = name
-        msgs.append(msg)
-        current = data.get("reply") or 0
-    return list(reversed(msgs))
+    for raw in reversed(raw_chain):
+        msg = decode_entry(raw)
+        if msg is not None:
+            msgs.append(msg)
+    return msgs
 
 
-async def increment_count(chat_id: int, msg_id: int) -> bool:
-    last_key = f"chat:{chat_id}:last_msg"
-    if not await redis.set(last_key, msg_id, nx=True, ex=60):
+def trigger_threshold(chat_id: int) -> int:
+    try:
+        return int(RANDOM_REPLY_THRESHOLDS.get(str(chat_id), RANDOM_REPLY_EVERY))
+    except ValueError:
+        return RANDOM_REPLY_EVERY
+
+
+async def increment_count(chat_id: int, msg_id: int, thread_id: int | None = None) -> bool:
+    """Count a message in its thread; True when it should trigger a random reply."""
+    threshold = trigger_threshold(chat_id)
+    if threshold <= 0:
         return False
-    key = f"chat:{chat_id}:count"
-    val = await redis.incr(key)
-    if val >= 10:
-        await redis.set(key, 0)
-        return True
-    return False
+    triggered = await _TRIGGER(
+        keys=[
+            _thread_key(chat_id, thread_id, "last_msg"),
+            _thread_key(chat_id, thread_id, "count"),
+        ],
+        args=[msg_id, threshold, RANDOM_REPLY_COOLDOWN, HISTORY_TTL],
+    )
+    return triggered == 1
+
 
+async def compact_thread(chat_id: int, thread_id: int) -> int:
+    """Trim one thread stream and give its keys a TTL; returns removed count."""
+    return await _COMPACT(
+        keys=[_thread_key(chat_id, thread_id, "stream"), _thread_key(chat_id, thread_id, "index")],
+        args=[HISTORY_MAX_MESSAGES, HISTORY_TTL, HISTORY_CHAIN_HOPS],
+    )
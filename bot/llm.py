@@ -0,0 +1,355 @@
+import asyncio
+import json
+import random
+import time
+from collections import Counter, deque
+from contextlib import aclosing
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator
+
+from httpx import AsyncClient, AsyncHTTPTransport, HTTPStatusError, Limits, Response, Timeout, TransportError
+
+from .breaker import breaker_for
+from .config import (
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    LLM_DEADLINE,
+    LLM_HTTP2,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_MAX_ATTEMPTS,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE,
+    LLM_TIMEOUT,
+    logger,
+)
+
+
+# 4xx codes that may succeed on retry; every other 4xx is a client error
+RETRYABLE_STATUSES = {408, 409, 425, 429}
+
+_client: AsyncClient | None = None
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = LLM_MAX_ATTEMPTS
+    deadline: float = LLM_DEADLINE
+    attempt_timeout: float = LLM_TIMEOUT
+    backoff_base: float = LLM_BACKOFF_BASE
+    backoff_max: float = LLM_BACKOFF_MAX
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before attempt ``attempt + 1``."""
+        cap = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return random.uniform(0, cap)
+
+
+@dataclass
+class Attempt:
+    attempt: int
+    latency: float
+    status: int | None = None
+    error: str | None = None
+
+
+class LLMRequestError(Exception):
+    """Raised when a request failed and no retry is possible or allowed."""
+
+    def __init__(self, message: str, attempts: list[Attempt]):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+# recent attempts and whole-request latencies, for tail latency reporting
+ATTEMPTS: deque[Attempt] = deque(maxlen=1000)
+REQUEST_LATENCIES: deque[float] = deque(maxlen=1000)
+# summed ``usage`` fields per model, including DeepSeek's prefix cache hits
+USAGE: dict[str, Counter[str]] = {}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _create_client() -> AsyncClient:
+    http2 = LLM_HTTP2 and _http2_available()
+    if LLM_HTTP2 and not http2:
+        logger.warning("[LLM_HTTP2_UNAVAILABLE] install httpx[http2] to enable HTTP/2")
+    limits = Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+    # no transport-level retries: RetryPolicy is the only retry loop
+    transport = AsyncHTTPTransport(http2=http2, limits=limits)
+    return AsyncClient(transport=transport, timeout=Timeout(LLM_TIMEOUT))
+
+
+def get_llm_client() -> AsyncClient:
+    """Return the process-wide DeepSeek client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+    return _client
+
+
+async def init_llm_client() -> AsyncClient:
+    client = get_llm_client()
+    logger.info(
+        f"[LLM_CLIENT] max_connections={LLM_MAX_CONNECTIONS} "
+        f"keepalive={LLM_MAX_KEEPALIVE} http2={LLM_HTTP2}"
+    )
+    return client
+
+
+async def close_llm_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, HTTPStatusError):
+        status = exc.response.status_code
+        return status >= 500 or status in RETRYABLE_STATUSES
+    return isinstance(exc, (TransportError, asyncio.TimeoutError))
+
+
+def retry_after(resp: Response) -> float | None:
+    """Parse ``Retry-After`` given either in seconds or as an HTTP date."""
+    value = resp.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_provider_failure(exc: Exception) -> bool:
+    """Client errors such as 400 say nothing about the provider's health."""
+    attempts = getattr(exc, "attempts", None)
+    status = attempts[-1].status if attempts else None
+    return status is None or status >= 500 or status in RETRYABLE_STATUSES
+
+
+def _record(attempt: Attempt) -> None:
+    ATTEMPTS.append(attempt)
+    latency_ms = int(attempt.latency * 1000)
+    if attempt.error:
+        logger.warning(
+            f"[DEEPSEEK_FAIL] attempt={attempt.attempt} status={attempt.status} "
+            f"latency_ms={latency_ms} err={attempt.error}"
+        )
+    else:
+        logger.debug(f"[DEEPSEEK_ATTEMPT] attempt={attempt.attempt} latency_ms={latency_ms}")
+
+
+def record_usage(model: str, usage: dict | None) -> None:
+    if not usage:
+        return
+    hit = usage.get("prompt_cache_hit_tokens", 0)
+    miss = usage.get("prompt_cache_miss_tokens", 0)
+    totals = USAGE.setdefault(model, Counter())
+    totals["requests"] += 1
+    for field in ("prompt_tokens", "completion_tokens", "prompt_cache_hit_tokens", "prompt_cache_miss_tokens"):
+        totals[field] += usage.get(field, 0) or 0
+    logger.info(
+        f"[DEEPSEEK_USAGE] model={model} prompt={usage.get('prompt_tokens')} "
+        f"completion={usage.get('completion_tokens')} cache_hit={hit} cache_miss={miss}"
+    )
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def latency_stats() -> dict[str, float]:
+    """Return request latency percentiles (seconds) and attempt counters."""
+    latencies = list(REQUEST_LATENCIES)
+    return {
+        "requests": len(latencies),
+        "attempts": len(ATTEMPTS),
+        "failed_attempts": sum(1 for a in ATTEMPTS if a.error),
+        "p50": _percentile(latencies, 0.5),
+        "p95": _percentile(latencies, 0.95),
+        "p99": _percentile(latencies, 0.99),
+    }
+
+
+async def _wait_before_retry(
+    exc: Exception, attempt: int, policy: RetryPolicy, deadline: float, attempts: list[Attempt]
+) -> None:
+    """Sleep before the next attempt or raise if the budget does not allow one."""
+    if not is_retryable(exc):
+        raise LLMRequestError(f"non-retryable error: {exc}", attempts) from exc
+    if attempt >= policy.max_attempts:
+        raise LLMRequestError(f"gave up after {attempt} attempts: {exc}", attempts) from exc
+    delay = policy.backoff(attempt)
+    if isinstance(exc, HTTPStatusError) and exc.response.status_code == 429:
+        delay = retry_after(exc.response) or delay
+    if time.monotonic() + delay >= deadline:
+        raise LLMRequestError(f"deadline exceeded after {attempt} attempts: {exc}", attempts) from exc
+    await asyncio.sleep(delay)
+
+
+def _attempt_timeout(policy: RetryPolicy, deadline: float) -> float:
+    return max(0.1, min(policy.attempt_timeout, deadline - time.monotonic()))
+
+
+async def post_json(
+    url: str, json_payload: dict, headers: dict, policy: RetryPolicy | None = None
+) -> dict:
+    """POST a completion request within the policy's attempt and time budget."""
+    policy = policy or RetryPolicy()
+    breaker = breaker_for(url, json_payload.get("model", ""))
+    started = time.monotonic()
+    try:
+        data = await _post_json(url, json_payload, headers, policy)
+    except Exception as e:
+        if _is_provider_failure(e):
+            breaker.on_failure()
+        raise
+    breaker.on_success(time.monotonic() - started)
+    record_usage(json_payload.get("model", ""), data.get("usage"))
+    return data
+
+
+async def _post_json(url: str, json_payload: dict, headers: dict, policy: RetryPolicy) -> dict:
+    started = time.monotonic()
+    deadline = started + policy.deadline
+    attempts: list[Attempt] = []
+    attempt = 0
+    while True:
+        attempt += 1
+        attempt_started = time.monotonic()
+        timeout = _attempt_timeout(policy, deadline)
+        try:
+            # httpx timeouts bound each read, not a body that keeps trickling in
+            async with asyncio.timeout(timeout):
+                resp = await get_llm_client().post(
+                    url, json=json_payload, headers=headers, timeout=timeout
+                )
+                resp.raise_for_status()
+                data = resp.json()
+        except Exception as e:
+            status = e.response.status_code if isinstance(e, HTTPStatusError) else None
+            attempts.append(Attempt(attempt, time.monotonic() - attempt_started, status, repr(e)))
+            _record(attempts[-1])
+            await _wait_before_retry(e, attempt, policy, deadline, attempts)
+            continue
+        attempts.append(Attempt(attempt, time.monotonic() - attempt_started, resp.status_code))
+        _record(attempts[-1])
+        REQUEST_LATENCIES.append(time.monotonic() - started)
+        return data
+
+
+async def stream_chat_completion(
+    url: str, json_payload: dict, headers: dict, timeout: float = LLM_TIMEOUT
+) -> AsyncIterator[str]:
+    """POST a ``stream=true`` completion and yield content deltas from the SSE body."""
+    client = get_llm_client()
+    payload = {**json_payload, "stream": True, "stream_options": {"include_usage": True}}
+    async with client.stream(
+        "POST", url, json=payload, headers=headers, timeout=timeout
+    ) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                # blank separators and ": keep-alive" comments
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            # the last chunk carries usage and no choices
+            record_usage(json_payload.get("model", ""), chunk.get("usage"))
+            choices = chunk.get("choices") or []
+            if not choices:
+                continue
+            # deepseek-reasoner streams reasoning_content first, only content is the answer
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                yield content
+
+
+async def iter_lines(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Regroup streamed text chunks into complete lines."""
+    buffer = ""
+    async for chunk in chunks:
+        buffer += chunk
+        while "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            yield line
+    if buffer:
+        yield buffer
+
+
+async def stream_lines(
+    url: str, json_payload: dict, headers: dict, policy: RetryPolicy | None = None
+) -> AsyncIterator[str]:
+    """Stream completion lines; retries are only possible before the first line."""
+    policy = policy or RetryPolicy()
+    breaker = breaker_for(url, json_payload.get("model", ""))
+    started = time.monotonic()
+    first_line = None
+    deadline = started + policy.deadline
+    attempts: list[Attempt] = []
+    attempt = 0
+    while True:
+        attempt += 1
+        attempt_started = time.monotonic()
+        received = False
+        try:
+            timeout = _attempt_timeout(policy, deadline)
+            lines = iter_lines(stream_chat_completion(url, json_payload, headers, timeout))
+            async with aclosing(lines):
+                while True:
+                    # the first line within this attempt's time, the rest
+                    # within the deadline; a yield must not be inside a timeout
+                    remaining = timeout if not received else deadline - time.monotonic()
+                    try:
+                        async with asyncio.timeout(max(0.0, remaining)):
+                            line = await anext(lines)
+                    except StopAsyncIteration:
+                        break
+                    if not received:
+                        received = True
+                        first_line = time.monotonic() - started
+                        attempts.append(Attempt(attempt, time.monotonic() - attempt_started, 200))
+                        _record(attempts[-1])
+                    yield line
+        except Exception as e:
+            if received:
+                breaker.on_failure()
+                raise
+            status = e.response.status_code if isinstance(e, HTTPStatusError) else None
+            attempts.append(Attempt(attempt, time.monotonic() - attempt_started, status, repr(e)))
+            _record(attempts[-1])
+            try:
+                await _wait_before_retry(e, attempt, policy, deadline, attempts)
+            except LLMRequestError as exc:
+                if _is_provider_failure(exc):
+                    breaker.on_failure()
+                raise
+            continue
+        if not received:
+            attempts.append(Attempt(attempt, time.monotonic() - attempt_started, 200))
+            _record(attempts[-1])
+        REQUEST_LATENCIES.append(time.monotonic() - started)
+        # for streams the time to the first line is what users wait for
+        breaker.on_success(first_line if first_line is not None else REQUEST_LATENCIES[-1])
+        return
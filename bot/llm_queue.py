@@ -0,0 +1,113 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import AsyncIterator
+
+from .config import LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_SHED_DEPTH, logger
+
+
+class Priority(IntEnum):
+    """Lower value is served first."""
+
+    COMMAND = 0
+    REPLY = 1
+    AUTO = 2
+
+
+class LLMOverloaded(Exception):
+    """Raised when a request is shed instead of waiting for a slot."""
+
+
+class LLMScheduler:
+    """Bounded-concurrency gate in front of DeepSeek with priority lanes.
+
+    Waiters are served by priority, then FIFO. Auto-replies are refused once
+    ``shed_depth`` requests are waiting; when the queue is full, a newcomer
+    evicts the lowest-priority waiter that is less important than itself.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, shed_depth: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.shed_depth = shed_depth
+        self._active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self.stats: Counter[str] = Counter()
+        self.wait_time: Counter[str] = Counter()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _shed(self, priority: Priority) -> None:
+        self.stats[f"shed_{priority.name.lower()}"] += 1
+        logger.warning(
+            f"[LLM_SHED] priority={priority.name} queue={len(self._waiters)} active={self._active}"
+        )
+        raise LLMOverloaded(f"LLM queue is full, {priority.name} request shed")
+
+    def _evict_lower(self, priority: Priority) -> bool:
+        victim = max(self._waiters, default=None)
+        if victim is None or victim[0] <= priority:
+            return False
+        self._waiters.remove(victim)
+        heapq.heapify(self._waiters)
+        victim_priority = Priority(victim[0])
+        self.stats[f"shed_{victim_priority.name.lower()}"] += 1
+        logger.warning(f"[LLM_SHED] priority={victim_priority.name} evicted_by={priority.name}")
+        victim[2].set_exception(LLMOverloaded(f"{victim_priority.name} request evicted"))
+        return True
+
+    async def acquire(self, priority: Priority) -> None:
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            self.stats[f"granted_{priority.name.lower()}"] += 1
+            return
+        if priority >= Priority.AUTO and len(self._waiters) >= self.shed_depth:
+            self._shed(priority)
+        if len(self._waiters) >= self.max_queue and not self._evict_lower(priority):
+            self._shed(priority)
+        fut = asyncio.get_running_loop().create_future()
+        item = (int(priority), next(self._seq), fut)
+        heapq.heappush(self._waiters, item)
+        started = time.monotonic()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                # the slot was handed over just before cancellation
+                self.release()
+            elif item in self._waiters:
+                self._waiters.remove(item)
+                heapq.heapify(self._waiters)
+            raise
+        self.stats[f"granted_{priority.name.lower()}"] += 1
+        self.wait_time[priority.name.lower()] += time.monotonic() - started
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                # hand the slot over directly, _active stays the same
+                fut.set_result(None)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority) -> AsyncIterator[None]:
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+scheduler = LLMScheduler(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_SHED_DEPTH)
@@ -0,0 +1,111 @@
+"""One-shot maintenance of the Redis history keys.
+
+    python -m bot.migrate compact
+    python -m bot.migrate streams
+"""
+import argparse
+import asyncio
+import json
+import re
+
+from .config import logger, setup_logging
+from .history import add_message, compact_thread, redis
+
+
+_STREAM_KEY = re.compile(r"chat:(-?\d+):thread:(\d+):stream")
+
+
+async def compact() -> None:
+    """Trim every thread stream to the configured cap and give it a TTL."""
+    keys = removed = 0
+    async for key in redis.scan_iter(match="chat:*:thread:*:stream", count=500):
+        match = _STREAM_KEY.fullmatch(key)
+        if not match:
+            continue
+        removed += await compact_thread(int(match.group(1)), int(match.group(2)))
+        keys += 1
+    logger.info(f"[MIGRATE_COMPACT] keys={keys} removed={removed}")
+
+
+_USER_KEY = re.compile(r"chat:(-?\d+):thread:(\d+):user:(\d+):(messages|history|ids)")
+_CHAT_KEY = re.compile(r"chat:(-?\d+):messages")
+
+
+async def _history_keys() -> dict[int, list[str]]:
+    chats: dict[int, list[str]] = {}
+    async for key in redis.scan_iter(match="chat:*", count=500):
+        match = _USER_KEY.fullmatch(key) or _CHAT_KEY.fullmatch(key)
+        if match:
+            chats.setdefault(int(match.group(1)), []).append(key)
+    return chats
+
+
+async def _migrate_chat(chat_id: int, keys: list[str]) -> int:
+    """Copy one chat's list and hash history into thread streams, oldest first."""
+    owners: dict[str, tuple[int, int]] = {}
+    for key in keys:
+        match = _USER_KEY.fullmatch(key)
+        if match and match.group(4) == "ids":
+            owner = (int(match.group(2)), int(match.group(3)))
+            for msg_id in await redis.lrange(key, 0, -1):
+                owners[msg_id] = owner
+    entries: dict[str, tuple[int, int, dict]] = {}
+    for key in keys:
+        match = _USER_KEY.fullmatch(key)
+        if match and match.group(4) != "messages":
+            continue
+        for msg_id, raw in (await redis.hgetall(key)).items():
+            try:
+                data = json.loads(raw)
+            except ValueError:
+                continue
+            if not isinstance(data, dict):
+                continue
+            if match:
+                owner = (int(match.group(2)), int(match.group(3)))
+            else:
+                owner = owners.get(msg_id, (0, int(data.get("user", 0))))
+            entries.setdefault(msg_id, (*owner, data))
+    for msg_id in sorted(entries, key=int):
+        thread_id, user_id, data = entries[msg_id]
+        await add_message(
+            chat_id,
+            user_id,
+            thread_id,
+            int(msg_id),
+            data.get("content", ""),
+            data.get("reply") or None,
+            role=data.get("role", "user"),
+            name=data.get("name"),
+        )
+    await redis.delete(*keys)
+    return len(entries)
+
+
+async def streams() -> None:
+    """Rewrite list and hash history keys into one stream per thread."""
+    chats = await _history_keys()
+    messages = 0
+    for chat_id, keys in chats.items():
+        messages += await _migrate_chat(chat_id, keys)
+    logger.info(f"[MIGRATE_STREAMS] chats={len(chats)} messages={messages}")
+
+
+COMMANDS = {
+    "compact": compact,
+    # streams also reads the chat-scoped keys the old command wrote
+    "chat-scope": streams,
+    "streams": streams,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m bot.migrate")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args()
+    setup_logging()
+    asyncio.run(COMMANDS[args.command]())
+
+
+if __name__ == "__main__":
+    main()
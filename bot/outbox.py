@@ -0,0 +1,237 @@
+"""Outgoing Telegram messages, paced to stay inside flood limits.
+
+Handlers enqueue each message with the call that sends it and return. Every
+chat has a FIFO queue drained by one task while it is non-empty, so the
+lines of a reply go out in order. A send waits for a token from the chat's
+bucket (``OUTBOX_CHAT_RATE``), for groups also from a per-minute bucket
+(``OUTBOX_GROUP_PER_MINUTE``), and from the bot's bucket
+(``OUTBOX_GLOBAL_RATE``). ``TelegramRetryAfter`` pauses the chat for the
+time Telegram asks and the message is sent again from the head of the queue.
+``enqueue`` returns a future that resolves once Telegram accepted the
+message, for callers that must not consider a reply done before that.
+"""
+import asyncio
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from .config import (
+    OUTBOX_CHAT_RATE,
+    OUTBOX_GLOBAL_RATE,
+    OUTBOX_GROUP_PER_MINUTE,
+    OUTBOX_MAX_ATTEMPTS,
+    logger,
+)
+
+
+class MessageDropped(Exception):
+    """A queued message was given up without Telegram accepting it."""
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``burst``."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available."""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill(time.monotonic())
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def idle(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return now >= self.paused_until and self.tokens >= self.burst
+
+
+@dataclass
+class Outgoing:
+    chat_id: int
+    # makes the Telegram call; called again on every attempt
+    send: Callable[[], Awaitable[Any]]
+    # gets the sent message, e.g. to store it in history
+    on_sent: Callable[[Any], Awaitable[None]] | None = None
+    # resolves to the sent message, or fails with MessageDropped
+    done: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+    enqueued: float = field(default_factory=time.monotonic)
+    # failed attempts; flood waits asked for by Telegram are not counted
+    attempts: int = 0
+
+
+_queues: dict[tuple[int, int], deque[Outgoing]] = {}
+_workers: dict[tuple[int, int], asyncio.Task] = {}
+_chat_buckets: dict[tuple[int, int], list[TokenBucket]] = {}
+_bot_buckets: dict[int, TokenBucket] = {}
+stats: Counter[str] = Counter()
+LATENCY: deque[float] = deque(maxlen=1000)
+_last_report = time.monotonic()
+
+
+def _buckets(bot_id: int, chat_id: int) -> list[TokenBucket]:
+    key = (bot_id, chat_id)
+    buckets = _chat_buckets.get(key)
+    if buckets is None:
+        if len(_chat_buckets) > 10_000:
+            # a full bucket behaves like a new one
+            for stale in [k for k, b in _chat_buckets.items() if all(x.idle() for x in b)]:
+                del _chat_buckets[stale]
+        buckets = [TokenBucket(OUTBOX_CHAT_RATE, 1)]
+        if chat_id < 0:
+            buckets.append(TokenBucket(OUTBOX_GROUP_PER_MINUTE / 60, OUTBOX_GROUP_PER_MINUTE))
+        _chat_buckets[key] = buckets
+    bot_bucket = _bot_buckets.get(bot_id)
+    if bot_bucket is None:
+        bot_bucket = _bot_buckets[bot_id] = TokenBucket(OUTBOX_GLOBAL_RATE, OUTBOX_GLOBAL_RATE)
+    return [*buckets, bot_bucket]
+
+
+def _bot_id(bot: Any) -> int:
+    try:
+        return int(bot.id)
+    except Exception:
+        return 0
+
+
+def enqueue(
+    bot: Any,
+    chat_id: int,
+    send: Callable[[], Awaitable[Any]],
+    on_sent: Callable[[Any], Awaitable[None]] | None = None,
+) -> asyncio.Future:
+    """Queue a message for ``chat_id``; ``send`` performs the Telegram call.
+
+    The returned future need not be awaited.
+    """
+    key = (_bot_id(bot), chat_id)
+    item = Outgoing(chat_id, send, on_sent)
+    # nobody may await it; don't warn about an unretrieved exception
+    item.done.add_done_callback(lambda fut: fut.cancelled() or fut.exception())
+    _queues.setdefault(key, deque()).append(item)
+    stats["queued"] += 1
+    worker = _workers.get(key)
+    if worker is None or worker.done():
+        _workers[key] = asyncio.create_task(_drain_chat(key))
+    return item.done
+
+
+def _drop(item: Outgoing, err: Exception) -> None:
+    stats["dropped"] += 1
+    logger.error(f"[OUTBOX_DROP] chat={item.chat_id} attempts={item.attempts} err={err}")
+    if not item.done.done():
+        item.done.set_exception(MessageDropped(str(err)))
+
+
+async def _send(key: tuple[int, int], item: Outgoing) -> bool:
+    """Try to send ``item``; ``False`` if it should be tried again."""
+    buckets = _buckets(*key)
+    while True:
+        delay = max((bucket.wait_time() for bucket in buckets), default=0)
+        if delay <= 0:
+            break
+        await asyncio.sleep(delay)
+    for bucket in buckets:
+        bucket.take()
+    try:
+        sent = await item.send()
+    except TelegramRetryAfter as e:
+        # Telegram says when to try again; that is not a failed attempt
+        stats["retry_after"] += 1
+        logger.warning(f"[OUTBOX_RETRY_AFTER] chat={item.chat_id} retry_after={e.retry_after}s")
+        buckets[0].pause(e.retry_after)
+        return False
+    except (TelegramNetworkError, TelegramServerError) as e:
+        item.attempts += 1
+        if item.attempts >= OUTBOX_MAX_ATTEMPTS:
+            _drop(item, e)
+            return True
+        stats["retry"] += 1
+        logger.warning(f"[OUTBOX_RETRY] chat={item.chat_id} attempt={item.attempts} err={e}")
+        buckets[0].pause(min(30, 2 ** item.attempts))
+        return False
+    except Exception as e:
+        stats["failed"] += 1
+        _drop(item, e)
+        return True
+    stats["sent"] += 1
+    LATENCY.append(time.monotonic() - item.enqueued)
+    if item.on_sent:
+        try:
+            await item.on_sent(sent)
+        except Exception as e:
+            logger.error(f"[OUTBOX_ON_SENT_FAIL] chat={item.chat_id} err={e}")
+    if not item.done.done():
+        item.done.set_result(sent)
+    return True
+
+
+async def _drain_chat(key: tuple[int, int]) -> None:
+    queue = _queues[key]
+    try:
+        while queue:
+            if await _send(key, queue[0]):
+                queue.popleft()
+            _report()
+    finally:
+        if not queue:
+            _queues.pop(key, None)
+        if _workers.get(key) is asyncio.current_task():
+            del _workers[key]
+
+
+def queue_depth() -> dict[str, int]:
+    return {"messages": sum(len(q) for q in _queues.values()), "chats": len(_queues)}
+
+
+def latency_stats() -> dict[str, float]:
+    if not LATENCY:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(LATENCY)
+    return {
+        "count": len(ordered),
+        "p50": round(ordered[len(ordered) // 2], 3),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def _report() -> None:
+    global _last_report
+    if time.monotonic() - _last_report < 60:
+        return
+    _last_report = time.monotonic()
+    logger.info(f"[OUTBOX_STATS] depth={queue_depth()} latency={latency_stats()} {dict(stats)}")
+
+
+async def drain(timeout: float | None = None) -> None:
+    """Wait until every queued message was sent or dropped, at most ``timeout`` seconds."""
+    try:
+        async with asyncio.timeout(timeout):
+            while _workers:
+                await asyncio.gather(*list(_workers.values()), return_exceptions=True)
+    except TimeoutError:
+        logger.warning(f"[OUTBOX_DRAIN_TIMEOUT] depth={queue_depth()}")
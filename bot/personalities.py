@@ -2,6 +2,7 @@ import random
 from dataclasses import dataclass
 from typing import ClassVar, Dict, Optional
 
+from .chunking import ChunkPolicy
 from .config import PROMPTS_DIR
 
 
@@ -43,10 +44,20 @@ MOOD_PROMPTS: Dict[str, str] = {
 }
 
 
+def mood_line(mood: str) -> str:
+    return f"Сейчас у тебя {mood} настроение. {MOOD_PROMPTS[mood]}"
+
+
+# every line get_mood_prompt can add to a system prompt
+MOOD_LINES = frozenset(mood_line(mood) for mood in MOOD_PROMPTS)
+
+
 @dataclass
 class Personality:
     name: ClassVar[str]
     mood_weights: ClassVar[Dict[str, int]] = {}
+    # how reply lines are grouped into messages
+    chunking: ClassVar[ChunkPolicy] = ChunkPolicy()
 
     def get_mood_prompt(self) -> str:
         if not self.mood_weights:
@@ -54,12 +65,12 @@ class Personality:
         moods = list(MOOD_PROMPTS.keys())
         probs = [self.mood_weights.get(mood, 1) for mood in moods]
         mood = random.choices(moods, weights=probs, k=1)[0]
-        text = MOOD_PROMPTS[mood]
-        return f"Сейчас у тебя {mood} настроение. {text}"
+        return mood_line(mood)
 
 
 class JoePeach(Personality):
     name = "JoePeach"
+    chunking = ChunkPolicy(max_lines=2, short_line=40)
     mood_weights = {
         "игривое": 3,
         "веселое": 3,
@@ -71,6 +82,8 @@ class JoePeach(Personality):
 
 class Mrazota(Personality):
     name = "Mrazota"
+    # short separate lines, like in her chat, but never more than three
+    chunking = ChunkPolicy(short_line=15, max_messages=3)
     mood_weights = {
         "игривое": 1,
         "веселое": 1,
@@ -82,6 +95,7 @@ class Mrazota(Personality):
 
 class Kuplinov(Personality):
     name = "Kuplinov"
+    chunking = ChunkPolicy(max_lines=3, short_line=40)
 
 
 PERSONALITIES: Dict[str, Personality] = {
@@ -99,3 +113,9 @@ def get_mood_prompt(personality: str) -> str:
     if not pers:
         return ""
     return pers.get_mood_prompt()
+
+
+def get_chunk_policy(personality: str) -> ChunkPolicy:
+    """Return how replies of ``personality`` are split into messages."""
+    pers = get_personality(personality)
+    return pers.chunking if pers else ChunkPolicy()
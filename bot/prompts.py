@@ -0,0 +1,73 @@
+import os
+from dataclasses import dataclass
+from typing import Iterable
+
+from .config import PROMPTS_DIR, logger
+from .personalities import MAIN_PROMPT, get_mood_prompt, get_prompt
+from .slang import relevant_slang
+
+
+@dataclass
+class CompiledPrompt:
+    prefix: str
+    mtime: float
+    version: int
+
+
+_compiled: dict[str, CompiledPrompt] = {}
+
+
+def _prompt_mtime(name: str) -> float:
+    try:
+        return os.stat(PROMPTS_DIR / f"{name}.txt").st_mtime
+    except OSError:
+        return 0.0
+
+
+def _slang_line(texts: Iterable[str]) -> str:
+    slang = ", ".join(f"{k}={v}" for k, v in relevant_slang(texts).items())
+    if not slang:
+        return ""
+    return f"Словарь сленга (ИСПОЛЬЗУЙ ТОЛЬКО ДЛЯ ПОНИМАНИЯ, НЕ ВСТАВЛЯЙ В ОТВЕТЫ): {slang}\n"
+
+
+def static_prefix(name: str) -> str:
+    """Return the unchanging start of a personality's system prompt.
+
+    The prefix is rebuilt only when the prompt file changes, and it is
+    always sent first and byte-identical so DeepSeek's prefix cache hits.
+    """
+    mtime = _prompt_mtime(name)
+    compiled = _compiled.get(name)
+    if compiled and compiled.mtime == mtime:
+        return compiled.prefix
+    prefix = "\n".join([MAIN_PROMPT, get_prompt(name)])
+    version = compiled.version + 1 if compiled else 1
+    _compiled[name] = CompiledPrompt(prefix, mtime, version)
+    logger.info(f"[PROMPT_COMPILED] name={name} version={version} chars={len(prefix)}")
+    return prefix
+
+
+def invalidate_prompt(name: str | None = None) -> None:
+    if name is None:
+        _compiled.clear()
+    else:
+        _compiled.pop(name, None)
+
+
+def build_system_prompt(
+    name: str, additional_context: str | None, texts: Iterable[str] = ()
+) -> str:
+    """Static prefix followed by per-request parts.
+
+    Only slang terms mentioned in ``texts`` (history and the message being
+    answered) are explained; they come after the prefix so it stays cacheable.
+    """
+    return "\n".join(
+        [
+            static_prefix(name),
+            _slang_line(texts),
+            get_mood_prompt(name),
+            additional_context or "",
+        ]
+    )
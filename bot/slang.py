@@ -0,0 +1,74 @@
+import re
+from typing import Iterable
+
+from .personalities import SLANG_DICT
+
+
+# inflection endings dropped from a term so "теневой" also matches "теневого"
+_ENDINGS = "аеёиоуыэюяйь"
+_MIN_STEM = 4
+
+
+def _stem(term: str) -> str:
+    stem = term.lower()
+    while len(stem) > _MIN_STEM and stem[-1] in _ENDINGS:
+        stem = stem[:-1]
+    return stem
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Build a regex from a character trie so shared prefixes are matched once."""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def walk(node: dict) -> str:
+        end = "" in node
+        branches = [re.escape(char) + walk(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not end:
+            return branches[0]
+        body = "(?:" + "|".join(branches) + ")"
+        return body + "?" if end else body
+
+    return walk(trie)
+
+
+class SlangMatcher:
+    """Find which dictionary terms a text mentions, in a single regex pass."""
+
+    def __init__(self, terms: dict[str, str]):
+        self.terms = terms
+        self._by_stem: dict[str, list[str]] = {}
+        for term in terms:
+            self._by_stem.setdefault(_stem(term), []).append(term)
+        pattern = _trie_pattern(self._by_stem)
+        # a term must start a word; letter endings after the stem are allowed
+        self._regex = re.compile(rf"(?<!\w)({pattern})(?!\d)", re.IGNORECASE) if pattern else None
+
+    def find(self, texts: Iterable[str]) -> dict[str, str]:
+        if self._regex is None:
+            return {}
+        found: set[str] = set()
+        for text in texts:
+            if not text:
+                continue
+            for match in self._regex.finditer(text):
+                found.update(self._by_stem.get(match.group(1).lower(), ()))
+        # keep dictionary order so equal inputs give byte-identical prompts
+        return {term: value for term, value in self.terms.items() if term in found}
+
+
+_matcher: SlangMatcher | None = None
+
+
+def relevant_slang(texts: Iterable[str]) -> dict[str, str]:
+    """Return the SLANG_DICT entries mentioned in ``texts``."""
+    global _matcher
+    if _matcher is None or _matcher.terms is not SLANG_DICT:
+        _matcher = SlangMatcher(SLANG_DICT)
+    return _matcher.find(texts)
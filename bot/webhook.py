@@ -0,0 +1,65 @@
+"""Receiving updates through Telegram webhooks instead of long polling.
+
+Each personality gets its own path under ``WEBHOOK_PATH`` on one aiohttp
+server. Requests without the ``WEBHOOK_SECRET`` header are refused, and an
+update is acknowledged as soon as it is read and handled in a task of its
+own, so Telegram can deliver up to ``WEBHOOK_MAX_CONNECTIONS`` updates at
+once. Any number of replicas may serve the same bots behind a load balancer;
+the state handlers share lives in Redis.
+"""
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+from .config import (
+    WEBHOOK_HOST,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+    logger,
+)
+
+
+def webhook_path(personality: str) -> str:
+    return f"{WEBHOOK_PATH.rstrip('/')}/{personality}"
+
+
+async def _health(request: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+
+def build_app(routes: dict[str, tuple[Dispatcher, Bot]]) -> web.Application:
+    """aiohttp app serving the webhook of every personality in ``routes``."""
+    app = web.Application()
+    for personality, (dp, bot) in routes.items():
+        SimpleRequestHandler(
+            dp, bot, handle_in_background=True, secret_token=WEBHOOK_SECRET or None
+        ).register(app, path=webhook_path(personality))
+    # for load balancer health checks
+    app.router.add_get("/healthz", _health)
+    return app
+
+
+async def run_webhooks(routes: dict[str, tuple[Dispatcher, Bot]]) -> None:
+    """Register the webhooks with Telegram and serve them until cancelled."""
+    if not WEBHOOK_SECRET:
+        logger.warning("[WEBHOOK_NO_SECRET] anyone who knows the URL can post updates")
+    for personality, (dp, bot) in routes.items():
+        await bot.set_webhook(
+            WEBHOOK_URL + webhook_path(personality),
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+    runner = web.AppRunner(build_app(routes), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    logger.info(f"[WEBHOOK] listening={WEBHOOK_HOST}:{WEBHOOK_PORT} bots={list(routes)}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -1,35 +1,134 @@
 import asyncio
+import signal
+from contextlib import suppress
 
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisStorage
 
-from bot.config import BOT_TOKEN, PERSONALITY, setup_logging, logger
+from bot.config import (
+    BOT_TOKEN,
+    BOT_TOKENS,
+    OUTBOX_DRAIN_TIMEOUT,
+    PERSONALITY,
+    WEBHOOK_URL,
+    setup_logging,
+    logger,
+)
 from bot.db import init_db
-from bot.history import init_history
+from bot.history import init_history, redis
+from bot.llm import close_llm_client, init_llm_client
+from bot import outbox
 from bot.handlers import register_handlers
 from bot.auto_reply import listen_auto_replies
+from bot.comments import run_comment_debouncer
+from bot.delayed import run_delayed_jobs
+from bot.webhook import run_webhooks
 
 
-async def _start_single_bot(token: str, personality: str) -> None:
-    bot = Bot(token=token, parse_mode=ParseMode.HTML)
-    dp = Dispatcher(storage=MemoryStorage())
-    register_handlers(dp, personality)
-    tasks = [dp.start_polling(bot), listen_auto_replies(bot, personality)]
-    logger.info(f"bot {personality} started")
-    await asyncio.gather(*tasks)
+async def _poll(dp: Dispatcher, bot: Bot, **kwargs) -> None:
+    # getUpdates is refused while a webhook from an earlier run is set
+    await bot.delete_webhook()
+    await dp.start_polling(bot, **kwargs)
+
+
+async def _cancel(tasks: list[asyncio.Task]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _start_bots(tokens: dict[str, str]) -> None:
+    """Run a bot per personality in this process.
+
+    The bots share one Telegram connection pool and one auto-reply consumer;
+    Redis, the DeepSeek client and the database are module-level already.
+    Updates come by long polling, or through webhooks when ``WEBHOOK_URL`` is
+    set; webhook replicas keep FSM state in Redis so any of them can continue
+    a conversation. On SIGINT or SIGTERM the bots stop taking updates and the
+    replies still queued are sent before the session is closed.
+    """
+    session = AiohttpSession()
+    bots = {
+        personality: Bot(token=token, session=session, parse_mode=ParseMode.HTML)
+        for personality, token in tokens.items()
+    }
+    # on shutdown updates stop first, then the workers
+    receivers = []
+    workers = [listen_auto_replies(bots)]
+    dispatchers = []
+    routes = {}
+    for personality, bot in bots.items():
+        if WEBHOOK_URL:
+            storage = RedisStorage(redis, key_builder=DefaultKeyBuilder(with_bot_id=True))
+        else:
+            storage = MemoryStorage()
+        dp = Dispatcher(storage=storage)
+        register_handlers(dp, personality)
+        routes[personality] = (dp, bot)
+        if not WEBHOOK_URL:
+            # signals are handled here for all dispatchers, and the shared
+            # session is closed here rather than by the first one to stop
+            dispatchers.append(dp)
+            receivers.append(_poll(dp, bot, handle_signals=False, close_bot_session=False))
+        workers.append(run_delayed_jobs(bot, personality))
+        workers.append(run_comment_debouncer(bot, personality))
+        logger.info(f"bot {personality} started")
+    if WEBHOOK_URL:
+        receivers.append(run_webhooks(routes))
+    receivers = [asyncio.create_task(coro) for coro in receivers]
+    workers = [asyncio.create_task(coro) for coro in workers]
+
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    stop = asyncio.create_task(stopping.wait())
+    try:
+        done, _ = await asyncio.wait(
+            [stop, *receivers, *workers], return_when=asyncio.FIRST_COMPLETED
+        )
+        logger.info(f"[SHUTDOWN] depth={outbox.queue_depth()}")
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        stop.cancel()
+        for dp in dispatchers:
+            # raises if polling has not started yet; cancelling stops it then
+            with suppress(RuntimeError):
+                await dp.stop_polling()
+        await _cancel(receivers)
+        await _cancel(workers)
+        # replies still queued need the session
+        await outbox.drain(OUTBOX_DRAIN_TIMEOUT)
+        await session.close()
+    # a task that stopped on its own failed
+    for task in done - {stop}:
+        if not task.cancelled() and task.exception():
+            raise task.exception()
 
 
 async def main() -> None:
     await init_db()
     await init_history()
     setup_logging()
-    if PERSONALITY:
-        if not BOT_TOKEN:
-            logger.error("No token provided for personality %s", PERSONALITY)
+    await init_llm_client()
+    try:
+        if PERSONALITY:
+            token = BOT_TOKEN or BOT_TOKENS.get(PERSONALITY)
+            if not token:
+                logger.error("No token provided for personality %s", PERSONALITY)
+                return
+            await _start_bots({PERSONALITY: token})
+            return
+        if not BOT_TOKENS:
+            logger.error("Set PERSONALITY and BOT_TOKEN, or BOT_TOKENS")
             return
-        await _start_single_bot(BOT_TOKEN, PERSONALITY)
-        return
+        await _start_bots(BOT_TOKENS)
+    finally:
+        await close_llm_client()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+import sys
+import json
+import asyncio
+from pathlib import Path
+from unittest.mock import AsyncMock
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import auto_reply
+from bot.handlers import common
+
+
+def test_publish_goes_to_personality_stream(monkeypatch):
+    redis = AsyncMock()
+    monkeypatch.setattr(auto_reply, "redis", redis)
+    payload = {"chat_id": 1, "msg_id": 2, "personality": "Kuplinov"}
+    asyncio.run(auto_reply.publish_auto_reply(payload))
+    args, kwargs = redis.xadd.call_args
+    assert args == ("auto_reply:Kuplinov", {"data": json.dumps(payload)})
+    assert kwargs == {"maxlen": auto_reply.AUTO_REPLY_MAXLEN, "approximate": True}
+
+
+def test_handle_acks_only_answered_entries(monkeypatch):
+    redis = AsyncMock()
+    monkeypatch.setattr(auto_reply, "redis", redis)
+    respond = AsyncMock()
+    monkeypatch.setattr(common, "respond_with_personality_to_chat", respond)
+    fields = {"data": json.dumps({"chat_id": 1, "user_id": 5, "thread_id": None, "msg_id": 9, "text": "hi"})}
+
+    asyncio.run(auto_reply._handle("bot", "JoePeach", "auto_reply:JoePeach", "1-0", fields))
+    assert respond.call_args.args == ("bot", 1, 5, 0, "JoePeach", "hi")
+    redis.xack.assert_awaited_once_with("auto_reply:JoePeach", auto_reply.GROUP, "1-0")
+
+    redis.xack.reset_mock()
+    respond.side_effect = RuntimeError("telegram down")
+    asyncio.run(auto_reply._handle("bot", "JoePeach", "auto_reply:JoePeach", "2-0", fields))
+    redis.xack.assert_not_awaited()
+
+    # unreadable payloads are acknowledged so they are not redelivered
+    asyncio.run(auto_reply._handle("bot", "JoePeach", "auto_reply:JoePeach", "3-0", {"data": "{"}))
+    redis.xack.assert_awaited_once_with("auto_reply:JoePeach", auto_reply.GROUP, "3-0")
+
+
+def test_reclaim_skips_active_and_drops_exhausted(monkeypatch):
+    redis = AsyncMock()
+    redis.xpending_range.return_value = [
+        {"message_id": "1-0", "times_delivered": 1},
+        {"message_id": "2-0", "times_delivered": auto_reply.AUTO_REPLY_MAX_DELIVERIES},
+        {"message_id": "3-0", "times_delivered": 1},
+    ]
+    redis.xclaim.return_value = [("1-0", {"data": "{}"})]
+    monkeypatch.setattr(auto_reply, "redis", redis)
+    claimed = asyncio.run(auto_reply._reclaim("auto_reply:Mrazota", {"3-0"}))
+    assert claimed == [("1-0", {"data": "{}"})]
+    redis.xack.assert_awaited_once_with("auto_reply:Mrazota", auto_reply.GROUP, "2-0")
+    assert redis.xclaim.call_args.args[4] == ["1-0"]
+
+
+def test_one_consumer_routes_entries_to_their_bot(monkeypatch):
+    redis = AsyncMock()
+    redis.xreadgroup.side_effect = [
+        [
+            ["auto_reply:JoePeach", [("1-0", {"data": "a"})]],
+            ["auto_reply:Mrazota", [("1-0", {"data": "b"})]],
+        ],
+        asyncio.CancelledError(),
+    ]
+    monkeypatch.setattr(auto_reply, "redis", redis)
+    monkeypatch.setattr(auto_reply, "_ensure_group", AsyncMock())
+    monkeypatch.setattr(auto_reply, "_reclaim", AsyncMock(return_value=[]))
+    handle = AsyncMock()
+    monkeypatch.setattr(auto_reply, "_handle", handle)
+
+    async def run():
+        try:
+            await auto_reply.listen_auto_replies({"JoePeach": "bot1", "Mrazota": "bot2"})
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    streams = redis.xreadgroup.call_args_list[0].args[2]
+    assert streams == {"auto_reply:JoePeach": "0", "auto_reply:Mrazota": "0"}
+    assert [c.args for c in handle.call_args_list] == [
+        ("bot1", "JoePeach", "auto_reply:JoePeach", "1-0", {"data": "a"}),
+        ("bot2", "Mrazota", "auto_reply:Mrazota", "1-0", {"data": "b"}),
+    ]
+    # pending entries are paged per stream
+    assert redis.xreadgroup.call_args_list[1].args[2] == {
+        "auto_reply:JoePeach": "1-0",
+        "auto_reply:Mrazota": "1-0",
+    }
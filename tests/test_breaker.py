@@ -0,0 +1,66 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import breaker
+from bot.breaker import CircuitBreaker, CircuitOpenError, State
+
+
+def test_opens_after_failure_rate_and_probes(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(breaker.time, "monotonic", lambda: now[0])
+    cb = CircuitBreaker("m", window=4, min_calls=4, failure_rate=0.5, slow_call=10, open_seconds=30)
+    cb.on_success(1)
+    cb.on_success(1)
+    cb.on_failure()
+    assert cb.state == State.CLOSED
+    cb.on_failure()
+    assert cb.state == State.OPEN
+    assert not cb.allow()
+    now[0] += 31
+    assert cb.allow()
+    assert cb.state == State.HALF_OPEN
+    # only one probe per open interval
+    assert not cb.allow()
+    cb.on_success(1)
+    assert cb.state == State.CLOSED
+    assert cb.allow()
+
+
+def test_slow_calls_count_as_failures():
+    cb = CircuitBreaker("m", window=2, min_calls=2, failure_rate=1.0, slow_call=5, open_seconds=30)
+    cb.on_success(6)
+    cb.on_success(7)
+    assert cb.state == State.OPEN
+
+
+def test_failed_probe_reopens(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(breaker.time, "monotonic", lambda: now[0])
+    cb = CircuitBreaker("m", window=1, min_calls=1, failure_rate=1.0, slow_call=5, open_seconds=10)
+    cb.on_failure()
+    now[0] = 11
+    assert cb.allow()
+    cb.on_failure()
+    assert cb.state == State.OPEN
+    assert not cb.allow()
+
+
+def test_route_request_uses_fallback(monkeypatch):
+    monkeypatch.setattr(breaker, "_breakers", {})
+    monkeypatch.setattr(breaker, "LLM_FALLBACKS", {"deepseek-reasoner": "deepseek-chat"})
+    primary = breaker.breaker_for("http://api", "deepseek-reasoner")
+    primary.state = State.OPEN
+    primary._next_probe = float("inf")
+    url, payload = breaker.route_request("http://api", {"model": "deepseek-reasoner", "messages": []})
+    assert url == "http://api"
+    assert payload["model"] == "deepseek-chat"
+
+    fallback = breaker.breaker_for("http://api", "deepseek-chat")
+    fallback.state = State.OPEN
+    fallback._next_probe = float("inf")
+    with pytest.raises(CircuitOpenError):
+        breaker.route_request("http://api", {"model": "deepseek-reasoner"})
@@ -0,0 +1,71 @@
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot.chunking import ChunkPolicy, chunk_lines, split_long
+from bot.personalities import get_chunk_policy
+
+
+async def _source(lines, error=None):
+    for line in lines:
+        yield line
+    if error:
+        raise error
+
+
+def _chunks(lines, policy, error=None):
+    async def run():
+        return [text async for text in chunk_lines(_source(lines, error), policy)]
+
+    return asyncio.run(run())
+
+
+def test_default_policy_sends_every_line():
+    assert _chunks(["a", "", "  b ", "c"], ChunkPolicy()) == ["a", "b", "c"]
+
+
+def test_lines_grouped_and_short_lines_merged():
+    lines = ["первая строка ответа", "ну", "вторая строка ответа", "третья строка ответа"]
+    policy = ChunkPolicy(max_lines=2, short_line=5)
+    assert _chunks(lines, policy) == [
+        "первая строка ответа\nну\nвторая строка ответа",
+        "третья строка ответа",
+    ]
+
+
+def test_max_messages_puts_rest_into_last():
+    policy = ChunkPolicy(max_messages=3)
+    assert _chunks(["1", "2", "3", "4", "5"], policy) == ["1", "2", "3\n4\n5"]
+
+
+def test_message_limit_starts_new_message():
+    policy = ChunkPolicy(max_lines=10, max_chars=10)
+    assert _chunks(["12345", "1234", "123"], policy) == ["12345\n1234", "123"]
+
+
+def test_split_long_prefers_spaces_and_counts_utf16():
+    assert split_long("aaaaa bbbb cc", 8) == ["aaaaa", "bbbb cc"]
+    assert split_long("😀" * 5, 4) == ["😀😀", "😀😀", "😀"]
+
+
+def test_buffered_lines_flushed_before_error():
+    policy = ChunkPolicy(max_lines=3)
+    seen = []
+
+    async def run():
+        async for text in chunk_lines(_source(["a", "b"], RuntimeError("boom")), policy):
+            seen.append(text)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+    assert seen == ["a\nb"]
+
+
+def test_personality_policies():
+    assert get_chunk_policy("Mrazota").max_messages == 3
+    assert get_chunk_policy("Kuplinov").max_lines == 3
+    assert get_chunk_policy("Unknown") == ChunkPolicy()
@@ -0,0 +1,122 @@
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot.coalesce import Coalescer, request_key
+
+
+def test_request_key_ignores_unrelated_fields():
+    base = {"model": "m", "messages": [{"role": "user", "content": "hi"}], "temperature": 1.1}
+    assert request_key(base) == request_key({**base, "presence_penalty": 1.5})
+    assert request_key(base) != request_key({**base, "temperature": 0.5})
+
+
+def test_concurrent_requests_share_upstream_call():
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        yield "one"
+        yield "two"
+
+    async def collect(co):
+        return [line async for line in co.lines("k", produce)]
+
+    async def run():
+        co = Coalescer(ttl=60, max_entries=10)
+        results = await asyncio.gather(*(collect(co) for _ in range(5)))
+        cached = await collect(co)
+        return co, results, cached
+
+    co, results, cached = asyncio.run(run())
+    assert calls == [1]
+    assert results == [["one", "two"]] * 5
+    assert cached == ["one", "two"]
+    assert co.snapshot()["misses"] == 1
+    assert co.snapshot()["coalesced"] == 4
+    assert co.snapshot()["hits"] == 1
+
+
+def test_errors_shared_and_not_cached():
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        await asyncio.sleep(0)
+        raise RuntimeError("down")
+        yield  # pragma: no cover
+
+    async def collect(co):
+        return [line async for line in co.lines("k", produce)]
+
+    async def run():
+        co = Coalescer(ttl=60, max_entries=10)
+        results = await asyncio.gather(collect(co), collect(co), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        with pytest.raises(RuntimeError):
+            await collect(co)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_cache_evicts_least_recently_used():
+    async def produce():
+        yield "x"
+
+    async def run():
+        co = Coalescer(ttl=60, max_entries=2)
+        for key in ("a", "b", "c"):
+            async for _ in co.lines(key, produce):
+                pass
+        return co
+
+    co = asyncio.run(run())
+    assert list(co._cache) == ["b", "c"]
+
+
+def test_identical_joepeach_requests_share_one_call(monkeypatch):
+    from bot import personalities
+    from bot.handlers import common
+    from bot.prompts import build_system_prompt
+
+    calls = []
+
+    async def upstream(url, payload, headers, priority):
+        calls.append(payload)
+        await asyncio.sleep(0.01)
+        yield "привет"
+
+    moods = iter(["игривое", "злое"])
+    monkeypatch.setattr(personalities.random, "choices", lambda *a, **k: [next(moods)])
+    monkeypatch.setattr(common, "route_request", lambda url, payload: (url, payload))
+    monkeypatch.setattr(common, "_upstream_lines", upstream)
+    monkeypatch.setattr(common, "coalescer", Coalescer(ttl=60, max_entries=10))
+
+    def payload():
+        system = build_system_prompt("JoePeach", None, ["привет"])
+        return {
+            "model": "deepseek-chat",
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": "привет"},
+            ],
+            "temperature": 1.1,
+        }
+
+    first, second = payload(), payload()
+    assert first["messages"][0]["content"] != second["messages"][0]["content"]
+
+    async def collect(p):
+        return [line async for line in common._generate_lines(p, {}, common.Priority.COMMAND)]
+
+    async def run():
+        return await asyncio.gather(collect(first), collect(second))
+
+    assert asyncio.run(run()) == [["привет"], ["привет"]]
+    assert len(calls) == 1
@@ -0,0 +1,55 @@
+import sys
+import json
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import codec
+
+
+def test_msgpack_uses_codes_for_known_roles_and_names():
+    packed = codec.CODECS["msgpack"].encode("assistant", "привет", "Mrazota")
+    assert packed.startswith(codec.MsgpackCodec.tag)
+    assert codec.msgpack.unpackb(packed[1:]) == [1, 1, "привет"]
+    assert codec.decode_entry(packed) == {
+        "role": "assistant",
+        "content": "привет",
+        "name": "Mrazota",
+    }
+    other = codec.CODECS["msgpack"].encode("user", "hi", "Вася Пупкин")
+    assert codec.decode_entry(other) == {"role": "user", "content": "hi", "name": "Вася Пупкин"}
+
+
+def test_zstd_only_for_long_messages(monkeypatch):
+    monkeypatch.setattr(codec, "HISTORY_ZSTD_MIN", 64)
+    zstd = codec.CODECS["msgpack+zstd"]
+    short = zstd.encode("user", "коротко", None)
+    long = zstd.encode("user", "очень длинное сообщение " * 20, None)
+    assert short.startswith(codec.MsgpackCodec.tag)
+    assert long.startswith(codec.ZstdMsgpackCodec.tag)
+    assert len(long) < len(codec.CODECS["msgpack"].encode("user", "очень длинное сообщение " * 20, None))
+    assert codec.decode_entry(long) == {"role": "user", "content": "очень длинное сообщение " * 20}
+
+
+def test_legacy_json_and_garbage():
+    legacy = json.dumps({"role": "assistant", "content": "ответ", "reply": 3, "name": "Bot"})
+    assert codec.decode_entry(legacy) == {"role": "assistant", "content": "ответ", "name": "Bot"}
+    assert codec.decode_entry(codec.CODECS["json"].encode("user", "да", None)) == {
+        "role": "user",
+        "content": "да",
+    }
+    assert codec.decode_entry(b"plain text") is None
+    assert codec.decode_entry(b"\x01\xc1") is None
+
+
+def test_codec_must_implement_encode_and_decode():
+    class EncodeOnly(codec.Codec):
+        tag = b"\x7f"
+
+        def encode(self, role, content, name):
+            return self.tag + content.encode()
+
+    with pytest.raises(TypeError):
+        EncodeOnly()
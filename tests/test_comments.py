@@ -0,0 +1,183 @@
+import os
+import sys
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from redis.asyncio import Redis
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import comments
+from bot.handlers import common
+from bot.llm_queue import Priority
+
+TEST_REDIS_URL = os.getenv("TEST_REDIS_URL", "redis://localhost:6379/14")
+
+
+def _on_redis(monkeypatch, scenario):
+    """Run ``scenario(redis, clock)`` with the comment scripts on an empty test database.
+
+    ``clock`` is a one-item list holding what ``time.time()`` returns.
+    """
+    clock = [1000.0]
+    monkeypatch.setattr(comments.time, "time", lambda: clock[0])
+
+    async def run():
+        r = Redis.from_url(TEST_REDIS_URL, decode_responses=True)
+        try:
+            await r.ping()
+        except Exception:
+            pytest.skip(f"no Redis at {TEST_REDIS_URL}")
+        await r.flushdb()
+        monkeypatch.setattr(comments, "redis", r)
+        for name in ("_PUSH", "_TAKE"):
+            monkeypatch.setattr(comments, name, r.register_script(getattr(comments, name).script))
+        try:
+            return await scenario(r, clock)
+        finally:
+            await r.flushdb()
+            await r.aclose()
+
+    return asyncio.run(run())
+
+
+def test_push_slides_the_window(monkeypatch):
+    push = AsyncMock(return_value=1)
+    monkeypatch.setattr(comments, "_PUSH", push)
+    monkeypatch.setattr(comments.time, "time", lambda: 1000.0)
+
+    asyncio.run(comments.push_comment("Mrazota", -5, 7, 20, 10, "hi"))
+    kwargs = push.call_args.kwargs
+    assert kwargs["keys"] == ["comments:Mrazota", "comments:-5:7:texts", "comments:-5:7"]
+    assert kwargs["args"][:5] == ["hi", 20, 10, 1000.0 + comments.COMMENT_MERGE_WINDOW, "-5:7"]
+
+
+def test_fire_answers_merged_comments(monkeypatch):
+    monkeypatch.setattr(comments, "_TAKE", AsyncMock(return_value=["21", "10", ["hi", "there"]]))
+    respond = AsyncMock()
+    monkeypatch.setattr(common, "respond_with_personality_to_chat", respond)
+
+    asyncio.run(comments._fire("bot", "Mrazota", "-5:7"))
+    assert respond.call_args.args == ("bot", -5, 7, 10, "Mrazota", "hi there")
+    kwargs = respond.call_args.kwargs
+    assert kwargs["reply_to_message_id"] == 21
+    assert kwargs["recent_history"] is True
+    assert kwargs["send_thread_id"] == 10
+    assert kwargs["priority"] is Priority.REPLY
+
+
+def test_fire_skips_comments_taken_elsewhere(monkeypatch):
+    monkeypatch.setattr(comments, "_TAKE", AsyncMock(return_value=None))
+    respond = AsyncMock()
+    monkeypatch.setattr(common, "respond_with_personality_to_chat", respond)
+
+    asyncio.run(comments._fire("bot", "Mrazota", "-5:7"))
+    respond.assert_not_awaited()
+
+
+def test_comments_merged_after_window(monkeypatch):
+    respond = AsyncMock()
+    monkeypatch.setattr(common, "respond_with_personality_to_chat", respond)
+
+    async def scenario(r, clock):
+        assert await comments.push_comment("Mrazota", -5, 7, 20, 10, "hi") == 1
+        clock[0] += 1
+        assert await comments.push_comment("Mrazota", -5, 7, 21, 10, "there") == 2
+        # still inside the window of the second comment
+        await comments._fire("bot", "Mrazota", "-5:7")
+        respond.assert_not_awaited()
+        clock[0] += comments.COMMENT_MERGE_WINDOW
+        await comments._fire("bot", "Mrazota", "-5:7")
+        # a second worker finds nothing left
+        await comments._fire("bot", "Mrazota", "-5:7")
+        return await r.keys("comments*")
+
+    assert _on_redis(monkeypatch, scenario) == []
+    respond.assert_awaited_once()
+    assert respond.call_args.args == ("bot", -5, 7, 10, "Mrazota", "hi there")
+    assert respond.call_args.kwargs["reply_to_message_id"] == 21
+
+
+def test_merged_comments_capped(monkeypatch):
+    monkeypatch.setattr(comments, "COMMENT_MERGE_MAX", 3)
+
+    async def scenario(r, clock):
+        counts = [
+            await comments.push_comment("Mrazota", -5, 7, 20 + i, 0, f"c{i}") for i in range(5)
+        ]
+        return counts, await r.lrange("comments:-5:7:texts", 0, -1)
+
+    counts, texts = _on_redis(monkeypatch, scenario)
+    assert counts == [1, 2, 3, 3, 3]
+    assert texts == ["c2", "c3", "c4"]
+
+
+def test_only_latest_comment_window_fires(monkeypatch):
+    respond = AsyncMock()
+    monkeypatch.setattr(common, "respond_with_personality_to_chat", respond)
+    window = comments.COMMENT_MERGE_WINDOW
+
+    async def scenario(r, clock):
+        await comments.push_comment("Mrazota", -5, 7, 20, 0, "hi")
+        clock[0] += window - 0.5
+        await comments.push_comment("Mrazota", -5, 7, 21, 0, "there")
+        # the first comment's window is over, the second one's is not
+        clock[0] += 1
+        assert await r.zrangebyscore("comments:Mrazota", "-inf", clock[0]) == []
+        await comments._fire("bot", "Mrazota", "-5:7")
+        respond.assert_not_awaited()
+        pending = await r.lrange("comments:-5:7:texts", 0, -1)
+        clock[0] += window
+        await comments._fire("bot", "Mrazota", "-5:7")
+        return pending
+
+    assert _on_redis(monkeypatch, scenario) == ["hi", "there"]
+    respond.assert_awaited_once()
+    assert respond.call_args.args[5] == "hi there"
+    assert respond.call_args.kwargs["reply_to_message_id"] == 21
+
+
+def test_multiple_comments_combined(monkeypatch):
+    """Two comments on a channel post get one reply, to the later comment."""
+    post = SimpleNamespace(
+        message_id=10, is_automatic_forward=True, sender_chat=SimpleNamespace(type="channel")
+    )
+    user = SimpleNamespace(is_bot=False, full_name="User", id=1)
+    bot = SimpleNamespace(id=999)
+
+    def comment(text, message_id):
+        return SimpleNamespace(
+            text=text,
+            reply_to_message=post,
+            chat=SimpleNamespace(id=-5),
+            message_id=message_id,
+            from_user=user,
+            sender_chat=None,
+            bot=bot,
+            message_thread_id=10,
+        )
+
+    respond = AsyncMock()
+    monkeypatch.setattr(common, "respond_with_personality_to_chat", respond)
+    monkeypatch.setattr(common, "respond_with_personality", AsyncMock())
+    monkeypatch.setattr(common, "is_group_allowed", lambda chat_id: True)
+    monkeypatch.setattr(common, "add_message", AsyncMock())
+    monkeypatch.setattr(common, "increment_count", AsyncMock(return_value=False))
+    monkeypatch.setattr(common, "should_count_for_random", lambda m, p: False)
+
+    async def scenario(r, clock):
+        await common.handle_message(comment("hi", 20), "Mrazota")
+        clock[0] += 1
+        await common.handle_message(comment("there", 21), "Mrazota")
+        clock[0] += comments.COMMENT_MERGE_WINDOW
+        for member in await r.zrangebyscore("comments:Mrazota", "-inf", clock[0]):
+            await comments._fire(bot, "Mrazota", member)
+
+    _on_redis(monkeypatch, scenario)
+    respond.assert_awaited_once()
+    assert respond.call_args.args == (bot, -5, 1, 10, "Mrazota", "hi there")
+    assert respond.call_args.kwargs["reply_to_message_id"] == 21
+    common.respond_with_personality.assert_not_awaited()
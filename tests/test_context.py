@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot.context import estimate_tokens, message_tokens, pack_messages
+
+
+def test_estimate_tokens_counts_words_and_punctuation():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("hello, world!") == 6
+    assert estimate_tokens("привет") == 3
+
+
+def _history():
+    return [
+        {"role": "system", "content": "sys"},
+        {"role": "user", "content": "old short"},
+        {"role": "user", "content": "очень длинное сообщение " * 50},
+        {"role": "assistant", "content": "recent", "name": "Bot"},
+        {"role": "user", "content": "question"},
+    ]
+
+
+def test_pack_keeps_everything_within_budget():
+    msgs = _history()
+    assert pack_messages(msgs, 10_000) == msgs
+
+
+def test_pack_drops_oldest_first_and_pins_ends():
+    msgs = _history()
+    budget = sum(message_tokens(m) for m in msgs) - message_tokens(msgs[1])
+    packed = pack_messages(msgs, budget, "oldest")
+    assert packed == [msgs[0], msgs[2], msgs[3], msgs[4]]
+
+
+def test_pack_drops_longest_first():
+    msgs = _history()
+    budget = sum(message_tokens(m) for m in msgs) - message_tokens(msgs[2])
+    packed = pack_messages(msgs, budget, "longest")
+    assert packed == [msgs[0], msgs[1], msgs[3], msgs[4]]
+
+
+def test_pack_never_drops_system_or_last_message():
+    msgs = _history()
+    packed = pack_messages(msgs, 1, "oldest")
+    assert packed == [msgs[0], msgs[4]]
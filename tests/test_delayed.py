@@ -0,0 +1,246 @@
+import os
+import sys
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from redis.asyncio import Redis
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import delayed, outbox
+from bot.handlers import common
+from bot.llm_queue import Priority
+
+
+def test_job_roundtrip_keeps_falsy_required_fields():
+    job = delayed.ReplyJob(1, 2, 0, "hi", reply_to=5, priority=0, id="x")
+    raw = job.dumps()
+    assert '"recent_history"' not in raw
+    assert delayed.ReplyJob.loads(raw) == job
+
+
+def test_schedule_scores_by_due_time(monkeypatch):
+    redis = AsyncMock()
+    monkeypatch.setattr(delayed, "redis", redis)
+    monkeypatch.setattr(delayed.time, "time", lambda: 1000.0)
+    job = delayed.ReplyJob(1, 2, 0, "hi")
+
+    asyncio.run(delayed.schedule("JoePeach", job, 30))
+    (key, mapping), _ = redis.zadd.call_args
+    assert key == "delayed:JoePeach"
+    assert mapping == {job.dumps(): 1030.0}
+    assert job.id
+
+
+def _lease(raw, personality="Mrazota"):
+    return delayed._Lease(personality, raw, 1300.0)
+
+
+def test_run_sends_and_releases_lease(monkeypatch):
+    release = AsyncMock(return_value=1)
+    monkeypatch.setattr(delayed, "_RELEASE", release)
+    respond = AsyncMock()
+    monkeypatch.setattr(common, "respond_with_personality_to_chat", respond)
+    raw = delayed.ReplyJob(1, 2, 3, "hi", reply_to=7, reply_once=True, priority=1).dumps()
+
+    asyncio.run(delayed._run("bot", "Mrazota", _lease(raw)))
+    assert respond.call_args.args == ("bot", 1, 2, 3, "Mrazota", "hi")
+    kwargs = respond.call_args.kwargs
+    assert kwargs["reply_to_message_id"] == 7
+    assert kwargs["reply_once"] is True
+    assert kwargs["priority"] is Priority.REPLY
+    assert kwargs["wait_sent"] < delayed.DELAYED_LEASE
+    release.assert_awaited_once_with(
+        keys=["delayed:Mrazota", "delayed:Mrazota:leased"], args=[raw, 1300.0]
+    )
+
+
+def test_failed_job_is_queued_again_with_backoff(monkeypatch):
+    release = AsyncMock(return_value=1)
+    monkeypatch.setattr(delayed, "_RELEASE", release)
+    monkeypatch.setattr(delayed, "DELAYED_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(delayed.time, "time", lambda: 1000.0)
+    monkeypatch.setattr(common, "respond_with_personality_to_chat", AsyncMock(side_effect=RuntimeError("boom")))
+    raw = delayed.ReplyJob(1, 2, 3, "hi", due=990.0, id="j").dumps()
+
+    asyncio.run(delayed._run("bot", "Mrazota", _lease(raw)))
+    keys, args = release.call_args.kwargs["keys"], release.call_args.kwargs["args"]
+    assert keys == ["delayed:Mrazota", "delayed:Mrazota:leased"]
+    assert args[:2] == [raw, 1300.0]
+    again = delayed.ReplyJob.loads(args[2])
+    assert (again.attempts, again.due, args[3]) == (1, 1000.0 + delayed.DELAYED_RETRY_BASE, again.due)
+
+    asyncio.run(delayed._run("bot", "Mrazota", _lease(args[2])))
+    last = release.call_args.kwargs["args"][2]
+    assert delayed.ReplyJob.loads(last).due == 1000.0 + 2 * delayed.DELAYED_RETRY_BASE
+    # the last attempt only gives up the lease
+    asyncio.run(delayed._run("bot", "Mrazota", _lease(last)))
+    assert release.call_args.kwargs["args"] == [last, 1300.0]
+    assert release.await_count == 3
+
+
+def test_delayed_reply_is_queued_not_awaited(monkeypatch):
+    schedule = AsyncMock()
+    monkeypatch.setattr(common, "schedule", schedule)
+    monkeypatch.setattr(common, "is_group_allowed", lambda chat_id: True)
+    sleep = AsyncMock()
+    monkeypatch.setattr(common.asyncio, "sleep", sleep)
+    bot = SimpleNamespace(send_chat_action=AsyncMock())
+    msg = SimpleNamespace(
+        chat=SimpleNamespace(id=1),
+        from_user=SimpleNamespace(id=2),
+        sender_chat=None,
+        message_id=20,
+        message_thread_id=10,
+        bot=bot,
+    )
+
+    asyncio.run(
+        common.respond_with_personality(
+            msg, "Mrazota", "hi", reply_to=msg, reply_to_comment=msg,
+            delay_range=(15, 25), priority=Priority.REPLY,
+        )
+    )
+    personality, job, delay = schedule.call_args.args
+    assert personality == "Mrazota"
+    assert 15 <= delay <= 25
+    assert (job.reply_to, job.recent_history, job.send_thread_id) == (20, True, 10)
+    assert job.priority == int(Priority.REPLY)
+    bot.send_chat_action.assert_not_awaited()
+    sleep.assert_not_awaited()
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def getdel(self, key):
+        return self.data.pop(key, None)
+
+
+def test_draft_is_sent_only_for_unchanged_prompt(monkeypatch):
+    monkeypatch.setattr(delayed, "redis", FakeRedis())
+    history = [{"role": "user", "content": "hi"}]
+    monkeypatch.setattr(common, "get_history", AsyncMock(side_effect=lambda *a, **k: list(history)))
+    monkeypatch.setattr(common, "add_message", AsyncMock())
+    monkeypatch.setattr(common.asyncio, "sleep", AsyncMock())
+    calls = []
+
+    async def generate(payload, headers, priority):
+        calls.append(payload)
+        yield f"answer {len(calls)}"
+
+    monkeypatch.setattr(common, "_generate_lines", generate)
+    monkeypatch.setattr(outbox, "_buckets", lambda bot_id, chat_id: [])
+    sent = []
+
+    async def send_message(chat_id, text, **kwargs):
+        sent.append(text)
+        return SimpleNamespace(message_id=100 + len(sent))
+
+    bot = SimpleNamespace(send_chat_action=AsyncMock(), send_message=send_message)
+
+    async def run(job_id, new_message=None):
+        job = delayed.ReplyJob(1, 2, 0, "hi", recent_history=True, id=job_id)
+        await common._draft_reply("JoePeach", job, 30)
+        if new_message:
+            history.append({"role": "user", "content": new_message})
+        await common.respond_with_personality_to_chat(
+            bot, 1, 2, 0, "JoePeach", "hi", recent_history=True, draft_id=job_id
+        )
+        await outbox.drain()
+
+    asyncio.run(run("a"))
+    assert (len(calls), sent) == (1, ["answer 1"])
+
+    # a message arrived while the job waited: the draft is dropped
+    asyncio.run(run("b", "wait, one more thing"))
+    assert len(calls) == 3
+    assert sent[-1] == "answer 3"
+
+
+def test_lease_kept_until_reply_is_delivered(monkeypatch):
+    release = AsyncMock(return_value=1)
+    monkeypatch.setattr(delayed, "_RELEASE", release)
+    monkeypatch.setattr(common, "DELAYED_SPECULATIVE", False)
+    monkeypatch.setattr(common, "get_history", AsyncMock(return_value=[]))
+    monkeypatch.setattr(common, "add_message", AsyncMock())
+    monkeypatch.setattr(outbox, "_buckets", lambda bot_id, chat_id: [])
+
+    async def generate(payload, headers, priority):
+        yield "answer"
+
+    monkeypatch.setattr(common, "_generate_lines", generate)
+    events = []
+
+    async def send_message(chat_id, text, **kwargs):
+        await asyncio.sleep(0)
+        events.append("sent")
+        return SimpleNamespace(message_id=100)
+
+    async def released(**kwargs):
+        events.append("released")
+
+    release.side_effect = released
+    bot = SimpleNamespace(send_chat_action=AsyncMock(), send_message=send_message)
+    raw = delayed.ReplyJob(1, 2, 0, "hi", recent_history=True).dumps()
+    asyncio.run(delayed._run(bot, "JoePeach", _lease(raw, "JoePeach")))
+    assert events == ["sent", "released"]
+
+    # Telegram refused every message: the job is queued again, not released
+    async def refuse(chat_id, text, **kwargs):
+        raise RuntimeError("Bad Request: chat not found")
+
+    bot.send_message = refuse
+    asyncio.run(delayed._run(bot, "JoePeach", _lease(raw, "JoePeach")))
+    assert release.await_count == 2
+    assert len(release.call_args.kwargs["args"]) == 4
+
+
+TEST_REDIS_URL = os.getenv("TEST_REDIS_URL", "redis://localhost:6379/14")
+
+
+@pytest.mark.parametrize("renew", [True, False])
+def test_slow_job_runs_once(monkeypatch, renew):
+    """A job that outlives its lease is neither sent twice nor left leased."""
+    monkeypatch.setattr(delayed, "DELAYED_LEASE", 0.3)
+    monkeypatch.setattr(delayed, "DELAYED_POLL", 0.01)
+    if not renew:
+        # the lease runs out while the job runs and this worker claims it again
+        monkeypatch.setattr(delayed._Lease, "keep", lambda self: asyncio.sleep(3600))
+    calls = []
+
+    async def respond(*args, **kwargs):
+        calls.append(args)
+        await asyncio.sleep(1)
+
+    monkeypatch.setattr(common, "respond_with_personality_to_chat", respond)
+
+    async def run():
+        r = Redis.from_url(TEST_REDIS_URL, decode_responses=True)
+        try:
+            await r.ping()
+        except Exception:
+            pytest.skip(f"no Redis at {TEST_REDIS_URL}")
+        await r.flushdb()
+        monkeypatch.setattr(delayed, "redis", r)
+        for name in ("_CLAIM", "_RENEW", "_RELEASE"):
+            monkeypatch.setattr(delayed, name, r.register_script(getattr(delayed, name).script))
+        try:
+            await delayed.schedule("JoePeach", delayed.ReplyJob(1, 2, 0, "hi"), 0)
+            worker = asyncio.create_task(delayed.run_delayed_jobs("bot", "JoePeach"))
+            await asyncio.sleep(1.3)
+            worker.cancel()
+            return await r.zcard("delayed:JoePeach"), await r.zcard("delayed:JoePeach:leased")
+        finally:
+            await r.flushdb()
+            await r.aclose()
+
+    assert asyncio.run(run()) == (0, 0)
+    assert len(calls) == 1
@@ -0,0 +1,262 @@
+import os
+import sys
+import json
+import asyncio
+from pathlib import Path
+from unittest.mock import AsyncMock
+
+import pytest
+from redis.asyncio import Redis
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import history
+
+TEST_REDIS_URL = os.getenv("TEST_REDIS_URL", "redis://localhost:6379/14")
+_SCRIPTS = ("_ADD_MESSAGE", "_GET_HISTORY", "_GET_THREAD", "_COMPACT")
+
+
+def _on_redis(monkeypatch, scenario):
+    """Run ``scenario(redis)`` with the history scripts on an empty test database."""
+
+    async def run():
+        raw = Redis.from_url(TEST_REDIS_URL)
+        try:
+            await raw.ping()
+        except Exception:
+            pytest.skip(f"no Redis at {TEST_REDIS_URL}")
+        await raw.flushdb()
+        for name in _SCRIPTS:
+            monkeypatch.setattr(history, name, raw.register_script(getattr(history, name).script))
+        monkeypatch.setattr(history, "cache", history.HistoryCache(0, 0))
+        try:
+            return await scenario(raw)
+        finally:
+            await raw.flushdb()
+            await raw.aclose()
+
+    return asyncio.run(run())
+
+
+def test_add_message_single_script_call(monkeypatch):
+    script = AsyncMock()
+    monkeypatch.setattr(history, "_ADD_MESSAGE", script)
+    asyncio.run(history.add_message(1, 2, None, 30, "hi", 29, role="user", name="Вася"))
+    script.assert_awaited_once()
+    kwargs = script.call_args.kwargs
+    assert kwargs["keys"] == [
+        "chat:1:thread:0:stream",
+        "chat:1:thread:0:index",
+        "chat:1:thread:0:user:2:view",
+    ]
+    assert kwargs["args"] == [
+        30,
+        2,
+        29,
+        history.encode_entry("user", "hi", "Вася"),
+        history.HISTORY_MAX_MESSAGES,
+        history.HISTORY_TTL,
+        history.INVALIDATE_CHANNEL,
+        f"{history.INSTANCE_ID} 1 0 2",
+        history.HISTORY_CHAIN_HOPS,
+        history.HISTORY_USER_VIEW,
+    ]
+
+
+def test_get_history_reads_stream_with_legacy_fallback(monkeypatch):
+    rows = [
+        "старое сообщение".encode(),
+        json.dumps({"role": "assistant", "content": "ответ", "reply": 5, "user": 2, "name": "Bot"}).encode(),
+        history.encode_entry("user", "новое", "Вася"),
+    ]
+    script = AsyncMock(return_value=rows)
+    monkeypatch.setattr(history, "_GET_HISTORY", script)
+    msgs = asyncio.run(history.get_history(1, 2, 3, limit=5))
+    assert script.call_args.kwargs == {
+        "keys": [
+            "chat:1:thread:3:stream",
+            "chat:1:thread:3:index",
+            "chat:1:thread:3:user:2:view",
+            "chat:1:thread:3:user:2:ids",
+            "chat:1:messages",
+            "chat:1:thread:3:user:2:history",
+        ],
+        "args": [2, 5, history.HISTORY_SCAN],
+    }
+    assert msgs == [
+        {"role": "user", "content": "старое сообщение"},
+        {"role": "assistant", "content": "ответ", "name": "Bot"},
+        {"role": "user", "content": "новое", "name": "Вася"},
+    ]
+
+
+def test_get_thread_decodes_server_side_chain(monkeypatch):
+    chain = [
+        history.encode_entry("assistant", "ответ", "Bot"),
+        b"not json",
+        json.dumps({"role": "user", "content": "вопрос", "reply": 0}).encode(),
+    ]
+    script = AsyncMock(return_value=chain)
+    monkeypatch.setattr(history, "_GET_THREAD", script)
+    msgs = asyncio.run(history.get_thread(1, 2, 3, 6, max_hops=20))
+    assert script.call_args.kwargs == {
+        "keys": [
+            "chat:1:thread:3:index",
+            "chat:1:thread:3:stream",
+            "chat:1:messages",
+            "chat:1:thread:3:user:2:messages",
+        ],
+        "args": [6, 20],
+    }
+    assert msgs == [
+        {"role": "user", "content": "вопрос"},
+        {"role": "assistant", "content": "ответ", "name": "Bot"},
+    ]
+
+
+def test_increment_count_is_one_script_call_per_thread(monkeypatch):
+    script = AsyncMock(return_value=1)
+    monkeypatch.setattr(history, "_TRIGGER", script)
+    monkeypatch.setattr(history, "RANDOM_REPLY_THRESHOLDS", {"-5": "3", "-6": "0"})
+    assert asyncio.run(history.increment_count(1, 40, 7))
+    assert script.call_args.kwargs == {
+        "keys": ["chat:1:thread:7:last_msg", "chat:1:thread:7:count"],
+        "args": [40, history.RANDOM_REPLY_EVERY, history.RANDOM_REPLY_COOLDOWN, history.HISTORY_TTL],
+    }
+    asyncio.run(history.increment_count(-5, 41))
+    assert script.call_args.kwargs["args"][1] == 3
+    script.reset_mock()
+    assert not asyncio.run(history.increment_count(-6, 42))
+    script.assert_not_awaited()
+
+
+def test_view_finds_user_history_in_busy_thread(monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_SCAN", 100)
+
+    async def scenario(r):
+        await history.add_message(1, 2, 0, 1, "мой вопрос")
+        await history.add_message(1, 2, 0, 2, "ответ", 1, role="assistant", name="Bot")
+        for msg_id in range(3, 303):
+            await history.add_message(1, 3, 0, msg_id, f"шум {msg_id}")
+        return await history.get_history(1, 2, 0, limit=10), await history.get_history(1, 3, 0, limit=2)
+
+    mine, other = _on_redis(monkeypatch, scenario)
+    assert mine == [
+        {"role": "user", "content": "мой вопрос"},
+        {"role": "assistant", "content": "ответ", "name": "Bot"},
+    ]
+    assert [m["content"] for m in other] == ["шум 301", "шум 302"]
+
+
+def test_trim_keeps_ancestors_of_recent_replies(monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_MAX_MESSAGES", 20)
+
+    async def scenario(r):
+        await history.add_message(1, 2, 0, 1, "корень")
+        await history.add_message(1, 3, 0, 2, "ответ на корень", 1)
+        for msg_id in range(3, 21):
+            await history.add_message(1, 4, 0, msg_id, f"шум {msg_id}")
+        # the 21st entry trims the stream to 16, but 1 and 2 stay for the reply to 2
+        await history.add_message(1, 2, 0, 21, "продолжение", 2)
+        stream = await r.xrange("chat:1:thread:0:stream")
+        index = await r.hkeys("chat:1:thread:0:index")
+        chain = await history.get_thread(1, 2, 0, 21)
+        return [int(f[b"m"]) for _, f in stream], sorted(map(int, index)), chain
+
+    stream, index, chain = _on_redis(monkeypatch, scenario)
+    assert stream == [1, 2, *range(6, 22)]
+    assert index == stream
+    assert [m["content"] for m in chain] == ["корень", "ответ на корень", "продолжение"]
+
+
+def test_get_history_falls_back_to_scan_and_legacy_keys(monkeypatch):
+    async def scenario(r):
+        # written by a version without views
+        await r.xadd("chat:1:thread:0:stream", {"m": 5, "u": 2, "p": 0, "d": history.encode_entry("user", "из потока", None)})
+        await r.hset("chat:1:thread:0:index", "5", "0-1")
+        # chat-scoped layout, then the per-user list before it
+        await r.rpush("chat:1:thread:0:user:2:ids", 3)
+        await r.hset("chat:1:messages", "3", json.dumps({"role": "assistant", "content": "из хеша", "reply": 2, "user": 2}))
+        await r.rpush("chat:1:thread:0:user:2:history", "из списка")
+        await history.add_message(1, 2, 0, 6, "новое")
+        await history.add_message(1, 9, 0, 7, "чужое")
+        return await history.get_history(1, 2, 0, limit=10)
+
+    msgs = _on_redis(monkeypatch, scenario)
+    assert [m["content"] for m in msgs] == ["из списка", "из хеша", "из потока", "новое"]
+
+
+def test_get_thread_walks_across_users_and_legacy_hashes(monkeypatch):
+    async def scenario(r):
+        await r.hset("chat:1:thread:0:user:4:messages", "1", json.dumps({"role": "user", "content": "старый корень", "reply": 0}))
+        await r.hset("chat:1:messages", "2", json.dumps({"role": "user", "content": "из хеша чата", "reply": 1}))
+        await history.add_message(1, 3, 0, 3, "другой пользователь", 2)
+        await history.add_message(1, 3, 0, 4, "ответ бота", 3, role="assistant", name="Bot")
+        await history.add_message(1, 4, 0, 5, "вопрос", 4)
+        # a loop in the reply pointers ends the walk
+        await history.add_message(1, 4, 0, 6, "петля", 7)
+        await history.add_message(1, 4, 0, 7, "петля", 6)
+        return (
+            await history.get_thread(1, 4, 0, 5),
+            await history.get_thread(1, 4, 0, 5, max_hops=2),
+            await history.get_thread(1, 4, 0, 7),
+        )
+
+    full, short, loop = _on_redis(monkeypatch, scenario)
+    assert [m["content"] for m in full] == [
+        "старый корень",
+        "из хеша чата",
+        "другой пользователь",
+        "ответ бота",
+        "вопрос",
+    ]
+    assert full[3] == {"role": "assistant", "content": "ответ бота", "name": "Bot"}
+    assert [m["content"] for m in short] == ["ответ бота", "вопрос"]
+    assert len(loop) == 2
+
+
+def test_duplicate_write_is_skipped_and_stale_index_pruned(monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_MAX_MESSAGES", 10)
+
+    async def scenario(r):
+        assert await history._ADD_MESSAGE(
+            keys=["chat:1:thread:0:stream", "chat:1:thread:0:index", "chat:1:thread:0:user:2:view"],
+            args=[1, 2, 0, history.encode_entry("user", "a", None), 10, 60, "test", "x", 5, 50],
+        ) == 1
+        await history.add_message(1, 2, 0, 1, "a")
+        # index entries left behind by the old MAXLEN trimming
+        await r.hset("chat:1:thread:0:index", mapping={str(i): "0-1" for i in range(1000, 1200)})
+        await history.add_message(1, 2, 0, 2, "b")
+        view = await r.lrange("chat:1:thread:0:user:2:view", 0, -1)
+        return await r.xlen("chat:1:thread:0:stream"), await r.hlen("chat:1:thread:0:index"), view
+
+    length, index, view = _on_redis(monkeypatch, scenario)
+    assert (length, index) == (2, 2)
+    assert view == [b"1", b"2"]
+
+
+def test_compact_applies_cap_ttl_and_chain_hops(monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_TTL", 0)
+
+    async def scenario(r):
+        # a chain 1 <- 2 <- 3 <- 4 <- 5 among noise, stored without a cap or TTL
+        monkeypatch.setattr(history, "HISTORY_MAX_MESSAGES", 0)
+        for msg_id in range(1, 6):
+            await history.add_message(1, 2, 0, msg_id, f"звено {msg_id}", msg_id - 1 or None)
+        for msg_id in range(6, 41):
+            await history.add_message(1, 3, 0, msg_id, f"шум {msg_id}")
+        await history.add_message(1, 2, 0, 41, "свежий ответ", 5)
+        monkeypatch.setattr(history, "HISTORY_MAX_MESSAGES", 20)
+        monkeypatch.setattr(history, "HISTORY_TTL", 3600)
+        monkeypatch.setattr(history, "HISTORY_CHAIN_HOPS", 3)
+        removed = await history.compact_thread(1, 0)
+        stream = await r.xrange("chat:1:thread:0:stream")
+        ttls = [await r.ttl(f"chat:1:thread:0:{kind}") for kind in ("stream", "index")]
+        return removed, [int(f[b"m"]) for _, f in stream], ttls, await history.compact_thread(1, 0)
+
+    removed, stream, ttls, again = _on_redis(monkeypatch, scenario)
+    # 41 entries down to 16, plus the three ancestors of 41 within the hop limit
+    assert stream == [3, 4, 5, *range(26, 42)]
+    assert removed == 41 - len(stream)
+    assert all(0 < ttl <= 3600 for ttl in ttls)
+    assert again == 0
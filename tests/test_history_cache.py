@@ -0,0 +1,119 @@
+import sys
+import asyncio
+from pathlib import Path
+from unittest.mock import AsyncMock
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import history
+from bot.history import HistoryCache
+
+
+def _live(max_entries=10, max_bytes=1 << 20) -> HistoryCache:
+    cache = HistoryCache(max_entries, max_bytes)
+    cache.live = True
+    return cache
+
+
+def test_not_used_without_subscription():
+    cache = HistoryCache(10, 1 << 20)
+    cache.put((1, 0, 2), 10, [{"role": "user", "content": "a"}], cache.epoch)
+    assert cache.get((1, 0, 2), 10) is None
+    assert cache.snapshot()["windows"] == 0
+
+
+def test_write_through_and_window_limit():
+    cache = _live()
+    msgs = [{"role": "user", "content": str(i)} for i in range(3)]
+    cache.put((1, 0, 2), 3, msgs, cache.epoch)
+    cache.append((1, 0, 2), {"role": "assistant", "content": "3"})
+    assert [m["content"] for m in cache.get((1, 0, 2), 3)] == ["1", "2", "3"]
+    assert [m["content"] for m in cache.get((1, 0, 2), 2)] == ["2", "3"]
+    assert cache.get((1, 0, 2), 5) is None
+    cache.append((1, 0, 3), {"role": "user", "content": "x"})
+    assert cache.snapshot()["windows"] == 1
+    assert cache.snapshot()["hit_rate"] == 2 / 3
+
+
+def test_invalidation_during_read_is_not_stored():
+    cache = _live()
+    epoch = cache.epoch
+    cache.invalidate((1, 0, 2))
+    cache.put((1, 0, 2), 10, [{"role": "user", "content": "stale"}], epoch)
+    assert cache.get((1, 0, 2), 10) is None
+
+
+def test_caps_evict_least_recently_used():
+    cache = _live(max_entries=2)
+    for user in (1, 2, 3):
+        cache.put((1, 0, user), 10, [{"role": "user", "content": "a"}], cache.epoch)
+    assert cache.get((1, 0, 1), 10) is None
+    assert cache.snapshot()["evictions"] == 1
+
+    small = _live(max_bytes=2 * history._message_size({"content": "a" * 10}))
+    for user in (1, 2):
+        small.put((1, 0, user), 10, [{"role": "user", "content": "a" * 10}], small.epoch)
+    small.append((1, 0, 2), {"role": "user", "content": "a" * 10})
+    assert small.snapshot()["windows"] == 1
+    assert small.bytes <= small.max_bytes
+
+
+def test_get_history_served_from_cache(monkeypatch):
+    cache = _live()
+    monkeypatch.setattr(history, "cache", cache)
+    script = AsyncMock(return_value=[history.encode_entry("user", "привет", None)])
+    monkeypatch.setattr(history, "_GET_HISTORY", script)
+    monkeypatch.setattr(history, "_ADD_MESSAGE", AsyncMock(return_value=1))
+
+    async def run():
+        first = await history.get_history(1, 2, 0, limit=10)
+        await history.add_message(1, 2, 0, 7, "ответ", 6, role="assistant", name="Bot")
+        second = await history.get_history(1, 2, 0, limit=10)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == [{"role": "user", "content": "привет"}]
+    assert second == first + [{"role": "assistant", "content": "ответ", "name": "Bot"}]
+    assert script.await_count == 1
+
+
+def test_read_racing_local_write_is_not_stored(monkeypatch):
+    cache = _live()
+    monkeypatch.setattr(history, "cache", cache)
+    before = [history.encode_entry("user", "привет", None)]
+    after = before + [history.encode_entry("assistant", "ответ", "Bot")]
+    script_ran = asyncio.Event()
+    release = asyncio.Event()
+    results = [before, after]
+
+    async def get_script(keys, args):
+        rows = results.pop(0)
+        if rows is before:
+            # the read's script ran before the write; its reply comes back late
+            script_ran.set()
+            await release.wait()
+        return rows
+
+    monkeypatch.setattr(history, "_GET_HISTORY", get_script)
+    monkeypatch.setattr(history, "_ADD_MESSAGE", AsyncMock(return_value=1))
+
+    async def run():
+        reader = asyncio.create_task(history.get_history(1, 2, 0, limit=10))
+        await script_ran.wait()
+        await history.add_message(1, 2, 0, 7, "ответ", 6, role="assistant", name="Bot")
+        release.set()
+        stale = await reader
+        return stale, await history.get_history(1, 2, 0, limit=10)
+
+    stale, fresh = asyncio.run(run())
+    assert stale == [{"role": "user", "content": "привет"}]
+    assert fresh == stale + [{"role": "assistant", "content": "ответ", "name": "Bot"}]
+
+
+def test_read_finishing_during_local_write_is_not_stored():
+    cache = _live()
+    epoch = cache.epoch
+    cache.begin_write((1, 0, 2))
+    cache.put((1, 0, 2), 10, [{"role": "user", "content": "maybe stale"}], epoch)
+    cache.end_write((1, 0, 2), {"role": "user", "content": "new"})
+    assert cache.get((1, 0, 2), 10) is None
@@ -0,0 +1,21 @@
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import llm
+
+
+def test_llm_client_is_shared():
+    async def run():
+        first = llm.get_llm_client()
+        second = llm.get_llm_client()
+        assert first is second
+        await llm.close_llm_client()
+        assert first.is_closed
+        third = llm.get_llm_client()
+        assert third is not first
+        await llm.close_llm_client()
+
+    asyncio.run(run())
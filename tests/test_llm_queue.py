@@ -0,0 +1,105 @@
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot.llm_queue import LLMOverloaded, LLMScheduler, Priority
+
+
+def test_waiters_served_by_priority():
+    order = []
+
+    async def worker(sched, priority, name):
+        async with sched.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    async def run():
+        sched = LLMScheduler(max_concurrency=1, max_queue=10, shed_depth=10)
+        await sched.acquire(Priority.COMMAND)
+        tasks = [
+            asyncio.create_task(worker(sched, Priority.AUTO, "auto")),
+            asyncio.create_task(worker(sched, Priority.REPLY, "reply")),
+            asyncio.create_task(worker(sched, Priority.COMMAND, "command")),
+        ]
+        await asyncio.sleep(0)
+        assert sched.queue_depth() == 3
+        sched.release()
+        await asyncio.gather(*tasks)
+        assert sched.active == 0
+
+    asyncio.run(run())
+    assert order == ["command", "reply", "auto"]
+
+
+def test_auto_replies_shed_when_queue_deep():
+    async def run():
+        sched = LLMScheduler(max_concurrency=1, max_queue=10, shed_depth=1)
+        await sched.acquire(Priority.COMMAND)
+        waiting = asyncio.create_task(sched.acquire(Priority.REPLY))
+        await asyncio.sleep(0)
+        with pytest.raises(LLMOverloaded):
+            await sched.acquire(Priority.AUTO)
+        sched.release()
+        await waiting
+        assert sched.stats["shed_auto"] == 1
+
+    asyncio.run(run())
+
+
+def test_full_queue_evicts_lower_priority():
+    async def run():
+        sched = LLMScheduler(max_concurrency=1, max_queue=1, shed_depth=10)
+        await sched.acquire(Priority.COMMAND)
+        auto = asyncio.create_task(sched.acquire(Priority.AUTO))
+        await asyncio.sleep(0)
+        command = asyncio.create_task(sched.acquire(Priority.COMMAND))
+        await asyncio.sleep(0)
+        with pytest.raises(LLMOverloaded):
+            await auto
+        sched.release()
+        await command
+        assert sched.active == 1
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def run():
+        sched = LLMScheduler(max_concurrency=1, max_queue=10, shed_depth=10)
+        await sched.acquire(Priority.COMMAND)
+        task = asyncio.create_task(sched.acquire(Priority.REPLY))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert sched.queue_depth() == 0
+        sched.release()
+        assert sched.active == 0
+
+    asyncio.run(run())
+
+
+def test_evicted_then_cancelled_waiter_does_not_release():
+    async def run():
+        sched = LLMScheduler(max_concurrency=1, max_queue=1, shed_depth=10)
+        await sched.acquire(Priority.COMMAND)
+        auto = asyncio.create_task(sched.acquire(Priority.AUTO))
+        await asyncio.sleep(0)
+        command = asyncio.create_task(sched.acquire(Priority.COMMAND))
+        await asyncio.sleep(0)
+        # evicted, then cancelled before it could see the exception
+        auto.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await auto
+        await asyncio.sleep(0)
+        assert not command.done()
+        assert sched.active == 1
+        sched.release()
+        await command
+        assert sched.active == 1
+
+    asyncio.run(run())
@@ -0,0 +1,134 @@
+import sys
+import asyncio
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import llm
+
+
+def _run_with_responses(monkeypatch, responses, policy):
+    calls = []
+    sleeps = []
+
+    def handler(request):
+        calls.append(request)
+        return responses[len(calls) - 1]
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(llm.asyncio, "sleep", fake_sleep)
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(llm, "_client", client)
+        try:
+            return await llm.post_json("http://test/v1", {"model": "m"}, {}, policy)
+        finally:
+            await client.aclose()
+
+    return run, calls, sleeps
+
+
+def test_retry_after_honored_on_429(monkeypatch):
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "2"}),
+        httpx.Response(200, json={"ok": True}),
+    ]
+    run, calls, sleeps = _run_with_responses(monkeypatch, responses, llm.RetryPolicy(deadline=10))
+    assert asyncio.run(run()) == {"ok": True}
+    assert len(calls) == 2
+    assert sleeps == [2.0]
+
+
+def test_non_retryable_4xx_fails_fast(monkeypatch):
+    responses = [httpx.Response(400), httpx.Response(200, json={})]
+    run, calls, sleeps = _run_with_responses(monkeypatch, responses, llm.RetryPolicy())
+    with pytest.raises(llm.LLMRequestError) as exc:
+        asyncio.run(run())
+    assert len(calls) == 1
+    assert sleeps == []
+    assert exc.value.attempts[0].status == 400
+
+
+def test_retry_after_beyond_deadline_gives_up(monkeypatch):
+    responses = [httpx.Response(429, headers={"Retry-After": "60"}), httpx.Response(200, json={})]
+    run, calls, sleeps = _run_with_responses(monkeypatch, responses, llm.RetryPolicy(deadline=5))
+    with pytest.raises(llm.LLMRequestError):
+        asyncio.run(run())
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_server_errors_retried_up_to_max_attempts(monkeypatch):
+    responses = [httpx.Response(503)] * 3
+    policy = llm.RetryPolicy(max_attempts=3, deadline=100, backoff_base=1, backoff_max=4)
+    run, calls, sleeps = _run_with_responses(monkeypatch, responses, policy)
+    with pytest.raises(llm.LLMRequestError) as exc:
+        asyncio.run(run())
+    assert len(calls) == 3
+    assert len(sleeps) == 2
+    assert all(0 <= s <= 2 for s in sleeps)
+    assert [a.status for a in exc.value.attempts] == [503, 503, 503]
+
+
+class _Trickle(httpx.AsyncByteStream):
+    """A body that keeps sending a byte just inside httpx's read timeout."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(0.05)
+            yield chunk
+
+
+def _trickling_client(monkeypatch, chunks):
+    def handler(request):
+        return httpx.Response(200, stream=_Trickle(chunks))
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm, "_client", client)
+    return client
+
+
+def test_slow_body_bounded_by_deadline(monkeypatch):
+    policy = llm.RetryPolicy(max_attempts=1, deadline=0.3, attempt_timeout=10)
+
+    async def run():
+        client = _trickling_client(monkeypatch, [b" "] * 100)
+        try:
+            return await llm.post_json("http://test/v1", {"model": "m"}, {}, policy)
+        finally:
+            await client.aclose()
+
+    started = time.monotonic()
+    with pytest.raises(llm.LLMRequestError):
+        asyncio.run(run())
+    assert time.monotonic() - started < 1
+
+
+def test_slow_stream_bounded_by_deadline(monkeypatch):
+    policy = llm.RetryPolicy(max_attempts=1, deadline=0.3, attempt_timeout=10)
+    chunks = [b'data: {"choices":[{"delta":{"content":"a\\n"}}]}\n\n'] * 100
+    lines = []
+
+    async def run():
+        client = _trickling_client(monkeypatch, chunks)
+        try:
+            async for line in llm.stream_lines("http://test/v1", {"model": "m"}, {}, policy):
+                lines.append(line)
+        finally:
+            await client.aclose()
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        asyncio.run(run())
+    assert time.monotonic() - started < 1
+    assert 0 < len(lines) < 100
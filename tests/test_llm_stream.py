@@ -0,0 +1,153 @@
+import sys
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import httpx
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import llm, outbox
+from bot.chunking import ChunkPolicy
+from bot.coalesce import Coalescer
+from bot.handlers import common
+
+
+SSE_BODY = (
+    'data: {"choices":[{"delta":{"reasoning_content":"думаю"}}]}\n\n'
+    ": keep-alive\n\n"
+    'data: {"choices":[{"delta":{"content":"пер"}}]}\n\n'
+    'data: {"choices":[{"delta":{"content":"вая\\nвто"}}]}\n\n'
+    'data: {"choices":[{"delta":{"content":"рая"}}]}\n\n'
+    "data: [DONE]\n\n"
+)
+
+
+def test_stream_chat_completion_yields_lines(monkeypatch):
+    captured = {}
+
+    def handler(request):
+        captured["body"] = request.content
+        return httpx.Response(200, text=SSE_BODY)
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(llm, "_client", client)
+        chunks = llm.stream_chat_completion("http://test/v1", {"model": "m"}, {})
+        lines = [line async for line in llm.iter_lines(chunks)]
+        await client.aclose()
+        return lines
+
+    assert asyncio.run(run()) == ["первая", "вторая"]
+    assert b'"stream":true' in captured["body"].replace(b" ", b"")
+
+
+class DummyBot:
+    async def send_chat_action(self, chat_id, action):
+        pass
+
+
+class DummyMessage:
+    def __init__(self):
+        self.text = "hi"
+        self.chat = SimpleNamespace(id=1, type="group")
+        self.message_id = 1
+        self.message_thread_id = 0
+        self.from_user = SimpleNamespace(id=123)
+        self.bot = DummyBot()
+        self.sent = []
+        self.replied = asyncio.Event()
+
+    async def reply(self, text):
+        self.sent.append(("reply", text))
+        self.replied.set()
+        return SimpleNamespace(message_id=42)
+
+    async def answer(self, text):
+        self.sent.append(("answer", text))
+        return SimpleNamespace(message_id=43)
+
+
+async def _respond_and_deliver(msg):
+    await common.respond_with_personality(msg, "Kuplinov", "hi", reply_to=msg)
+    await outbox.drain()
+
+
+def test_streamed_lines_sent_before_stream_ends(monkeypatch):
+    msg = DummyMessage()
+    monkeypatch.setattr(common, "DEEPSEEK_STREAM", True)
+    monkeypatch.setattr(common, "is_group_allowed", lambda cid: True)
+    monkeypatch.setattr(common, "get_thread", AsyncMock(return_value=[]))
+    add_message = AsyncMock()
+    monkeypatch.setattr(common, "add_message", add_message)
+    monkeypatch.setattr(common.asyncio, "sleep", AsyncMock())
+    monkeypatch.setattr(common, "coalescer", Coalescer(ttl=0, max_entries=0))
+    monkeypatch.setattr(outbox, "_buckets", lambda bot_id, chat_id: [])
+    # one message per line, so the first goes out while the stream is open
+    monkeypatch.setattr(common, "get_chunk_policy", lambda personality: ChunkPolicy())
+    seen_before_second = []
+
+    async def fake_stream(url, json_payload, headers, max_attempts=3, timeout=30):
+        yield "first"
+        await msg.replied.wait()
+        seen_before_second.extend(msg.sent)
+        yield ""
+        yield "second"
+
+    monkeypatch.setattr(common, "_httpx_stream_lines", fake_stream)
+    asyncio.run(_respond_and_deliver(msg))
+    assert seen_before_second == [("reply", "first")]
+    assert msg.sent == [("reply", "first"), ("answer", "second")]
+    assert add_message.await_count == 2
+
+
+def test_stream_failure_after_first_line_keeps_sent_lines(monkeypatch):
+    msg = DummyMessage()
+    monkeypatch.setattr(common, "DEEPSEEK_STREAM", True)
+    monkeypatch.setattr(common, "is_group_allowed", lambda cid: True)
+    monkeypatch.setattr(common, "get_thread", AsyncMock(return_value=[]))
+    monkeypatch.setattr(common, "add_message", AsyncMock())
+    monkeypatch.setattr(common.asyncio, "sleep", AsyncMock())
+    monkeypatch.setattr(common, "coalescer", Coalescer(ttl=0, max_entries=0))
+    monkeypatch.setattr(outbox, "_buckets", lambda bot_id, chat_id: [])
+
+    async def fake_stream(url, json_payload, headers, max_attempts=3, timeout=30):
+        yield "first"
+        raise httpx.ReadError("boom")
+
+    monkeypatch.setattr(common, "_httpx_stream_lines", fake_stream)
+    asyncio.run(_respond_and_deliver(msg))
+    assert msg.sent == [("reply", "first")]
+
+
+def test_shed_request_gets_error_message_unless_auto(monkeypatch):
+    monkeypatch.setattr(common, "is_group_allowed", lambda cid: True)
+    monkeypatch.setattr(common, "get_thread", AsyncMock(return_value=[]))
+    monkeypatch.setattr(common, "get_history", AsyncMock(return_value=[]))
+    monkeypatch.setattr(outbox, "_buckets", lambda bot_id, chat_id: [])
+
+    async def shed(payload, headers, priority):
+        raise common.LLMOverloaded("queue full")
+        yield
+
+    monkeypatch.setattr(common, "_generate_lines", shed)
+    msg = DummyMessage()
+    asyncio.run(_respond_and_deliver(msg))
+    assert msg.sent == [("reply", "Не удалось получить ответ.")]
+
+    sent = []
+
+    async def send_message(chat_id, text, **kwargs):
+        sent.append(text)
+
+    bot = SimpleNamespace(send_chat_action=AsyncMock(), send_message=send_message)
+
+    async def run(priority):
+        await common.respond_with_personality_to_chat(bot, 1, 2, 0, "Kuplinov", "hi", priority=priority)
+        await outbox.drain()
+
+    asyncio.run(run(common.Priority.AUTO))
+    assert sent == []
+    asyncio.run(run(common.Priority.REPLY))
+    assert sent == ["Не удалось получить ответ."]
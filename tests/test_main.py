@@ -0,0 +1,59 @@
+import os
+import sys
+import signal
+import asyncio
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import main
+from bot import outbox
+
+
+@pytest.mark.parametrize("webhook", ["", "https://bot.example"])
+def test_queued_replies_sent_on_sigterm(monkeypatch, webhook):
+    monkeypatch.setattr(outbox, "_queues", {})
+    monkeypatch.setattr(outbox, "_workers", {})
+    monkeypatch.setattr(outbox, "_buckets", lambda bot_id, chat_id: [])
+    monkeypatch.setattr(main, "WEBHOOK_URL", webhook)
+    monkeypatch.setattr(main, "register_handlers", lambda dp, personality: None)
+
+    async def forever(*args, **kwargs):
+        await asyncio.Event().wait()
+
+    for name in ("listen_auto_replies", "run_delayed_jobs", "run_comment_debouncer"):
+        monkeypatch.setattr(main, name, forever)
+    sent = []
+
+    def send(text):
+        async def call():
+            await asyncio.sleep(0.05)
+            sent.append(text)
+        return call
+
+    async def receive(bots):
+        for bot in bots:
+            for n in (1, 2):
+                outbox.enqueue(bot, 1, send(f"{bot.id}:{n}"))
+        os.kill(os.getpid(), signal.SIGTERM)
+        await forever()
+
+    async def poll(dp, bot, **kwargs):
+        # signals are left to _start_bots
+        assert kwargs["handle_signals"] is False
+        await receive([bot])
+
+    async def run_webhooks(routes):
+        await receive([bot for _, bot in routes.values()])
+
+    monkeypatch.setattr(main, "_poll", poll)
+    monkeypatch.setattr(main, "run_webhooks", run_webhooks)
+
+    async def run():
+        await asyncio.wait_for(main._start_bots({"JoePeach": "42:A", "Mrazota": "43:B"}), 5)
+
+    asyncio.run(run())
+    assert sorted(sent) == ["42:1", "42:2", "43:1", "43:2"]
+    assert outbox.queue_depth()["messages"] == 0
@@ -0,0 +1,129 @@
+import sys
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import outbox
+
+
+def _flood(retry_after=0):
+    return TelegramRetryAfter(SendMessage(chat_id=1, text="x"), "Flood control exceeded", retry_after)
+
+
+def test_retry_after_keeps_order_and_records_once(monkeypatch):
+    monkeypatch.setattr(outbox, "_queues", {})
+    monkeypatch.setattr(outbox, "_workers", {})
+    monkeypatch.setattr(outbox, "_buckets", lambda bot_id, chat_id: [outbox.TokenBucket(1000, 1)])
+    calls = []
+    recorded = []
+    failures = {"a": 1}
+
+    def send(text):
+        async def call():
+            calls.append(text)
+            if failures.get(text):
+                failures[text] -= 1
+                raise _flood()
+            return SimpleNamespace(message_id=len(calls), text=text)
+        return call
+
+    async def record(sent):
+        recorded.append(sent.text)
+
+    async def run():
+        for text in ("a", "b", "c"):
+            outbox.enqueue(None, -100, send(text), record)
+        await outbox.drain()
+
+    asyncio.run(run())
+    assert calls == ["a", "a", "b", "c"]
+    assert recorded == ["a", "b", "c"]
+    assert outbox.queue_depth() == {"messages": 0, "chats": 0}
+
+
+def _unpaused_bucket():
+    bucket = outbox.TokenBucket(1000, 1)
+    bucket.pause = lambda seconds: None
+    return bucket
+
+
+def test_flood_waits_do_not_count_as_attempts(monkeypatch):
+    monkeypatch.setattr(outbox, "_buckets", lambda bot_id, chat_id: [outbox.TokenBucket(1000, 1)])
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+    floods = [1, 1, 1, 1]
+
+    async def busy_group():
+        if floods:
+            floods.pop()
+            raise _flood()
+        return "sent"
+
+    async def run():
+        return await outbox.enqueue(None, -100, busy_group)
+
+    assert asyncio.run(run()) == "sent"
+    assert floods == []
+
+
+def test_message_dropped_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(outbox, "_buckets", lambda bot_id, chat_id: [_unpaused_bucket()])
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+    calls = []
+
+    async def always_failing():
+        calls.append(1)
+        raise TelegramNetworkError(SendMessage(chat_id=5, text="x"), "connection reset")
+
+    async def ok():
+        calls.append(2)
+
+    async def run():
+        dropped = outbox.enqueue(None, 5, always_failing)
+        sent = outbox.enqueue(None, 5, ok)
+        await outbox.drain()
+        with pytest.raises(outbox.MessageDropped):
+            await dropped
+        await sent
+
+    asyncio.run(run())
+    assert calls == [1, 1, 2]
+
+
+def test_drain_gives_up_after_timeout(monkeypatch):
+    monkeypatch.setattr(outbox, "_queues", {})
+    monkeypatch.setattr(outbox, "_workers", {})
+    monkeypatch.setattr(outbox, "_buckets", lambda bot_id, chat_id: [])
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    async def run():
+        outbox.enqueue(None, 6, slow)
+        started = asyncio.get_running_loop().time()
+        await outbox.drain(timeout=0.05)
+        return asyncio.get_running_loop().time() - started, outbox.queue_depth()
+
+    waited, depth = asyncio.run(run())
+    assert waited < 1
+    assert depth == {"messages": 1, "chats": 1}
+
+
+def test_token_bucket_paces_and_pauses(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(outbox.time, "monotonic", lambda: now[0])
+    bucket = outbox.TokenBucket(rate=2, burst=2)
+    bucket.take()
+    bucket.take()
+    assert bucket.wait_time() == 0.5
+    now[0] += 0.5
+    assert bucket.wait_time() == 0
+    bucket.pause(3)
+    assert bucket.wait_time() == 3
+    now[0] += 3
+    assert bucket.wait_time() == 0
@@ -0,0 +1,52 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import personalities, prompts
+
+
+def _use_dir(monkeypatch, path):
+    monkeypatch.setattr(prompts, "PROMPTS_DIR", path)
+    monkeypatch.setattr(personalities, "PROMPTS_DIR", path)
+    monkeypatch.setattr(prompts, "_compiled", {})
+
+
+def test_prefix_cached_until_file_changes(monkeypatch, tmp_path):
+    _use_dir(monkeypatch, tmp_path)
+    file = tmp_path / "Kuplinov.txt"
+    file.write_text("v1", encoding="utf-8")
+    reads = []
+    original = prompts.get_prompt
+    monkeypatch.setattr(prompts, "get_prompt", lambda name: reads.append(name) or original(name))
+
+    first = prompts.static_prefix("Kuplinov")
+    assert prompts.static_prefix("Kuplinov") is first
+    assert reads == ["Kuplinov"]
+    assert first.startswith(personalities.MAIN_PROMPT)
+    assert first.endswith("v1")
+
+    file.write_text("v2", encoding="utf-8")
+    stat = file.stat()
+    os.utime(file, (stat.st_atime, stat.st_mtime + 10))
+    assert prompts.static_prefix("Kuplinov").endswith("v2")
+    assert prompts._compiled["Kuplinov"].version == 2
+
+
+def test_invalidate_forces_rebuild(monkeypatch, tmp_path):
+    _use_dir(monkeypatch, tmp_path)
+    (tmp_path / "JoePeach.txt").write_text("joe", encoding="utf-8")
+    prompts.static_prefix("JoePeach")
+    prompts.invalidate_prompt("JoePeach")
+    assert "JoePeach" not in prompts._compiled
+
+
+def test_system_prompt_starts_with_static_prefix(monkeypatch, tmp_path):
+    _use_dir(monkeypatch, tmp_path)
+    (tmp_path / "Mrazota.txt").write_text("mrazota", encoding="utf-8")
+    prefix = prompts.static_prefix("Mrazota")
+    for _ in range(5):
+        system = prompts.build_system_prompt("Mrazota", "extra")
+        assert system.startswith(prefix + "\n")
+        assert system.endswith("extra")
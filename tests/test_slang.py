@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot.slang import SlangMatcher, relevant_slang
+
+
+def test_only_mentioned_terms_returned():
+    found = relevant_slang(["опять этот теневой пришёл", "готика когда?"])
+    assert list(found) == ["теневой", "готика"]
+
+
+def test_matches_inflected_forms_case_insensitive():
+    found = relevant_slang(["у Теневого новый донат", "куплинова бы сюда"])
+    assert set(found) == {"теневой", "куплинов"}
+
+
+def test_no_match_inside_other_words():
+    matcher = SlangMatcher({"ключ": "мем"})
+    assert matcher.find(["переключатель сломался"]) == {}
+    assert matcher.find(["отдай ключи"]) == {"ключ": "мем"}
+
+
+def test_large_dictionary_with_shared_prefixes():
+    terms = {f"слово{i}": str(i) for i in range(300)}
+    matcher = SlangMatcher(terms)
+    found = matcher.find(["тут слово42 и слово7, а слово300 нет"])
+    assert found == {"слово7": "7", "слово42": "42"}
+
+
+def test_empty_texts():
+    assert relevant_slang(["", "привет"]) == {}
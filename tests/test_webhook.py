@@ -0,0 +1,52 @@
+import sys
+import asyncio
+from pathlib import Path
+
+from aiogram import Bot, Dispatcher
+from aiohttp import ClientSession, web
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from bot import webhook
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 2, "is_bot": False, "first_name": "User"},
+        "text": "hi",
+    },
+}
+
+
+def test_webhook_checks_secret_and_dispatches(monkeypatch):
+    monkeypatch.setattr(webhook, "WEBHOOK_SECRET", "s3cret")
+    dp = Dispatcher()
+    seen = []
+
+    @dp.message()
+    async def on_message(message):
+        seen.append(message.text)
+
+    async def run():
+        bot = Bot(f"123:{'x' * 35}")
+        runner = web.AppRunner(webhook.build_app({"JoePeach": (dp, bot)}))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        url = f"http://127.0.0.1:{port}{webhook.webhook_path('JoePeach')}"
+        async with ClientSession() as client:
+            async with client.post(url, json=UPDATE) as resp:
+                refused = resp.status
+            headers = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+            async with client.post(url, json=UPDATE, headers=headers) as resp:
+                accepted = resp.status
+        await asyncio.sleep(0.05)
+        await runner.cleanup()
+        return refused, accepted
+
+    assert asyncio.run(run()) == (401, 200)
+    assert seen == ["hi"]